@@ -1,337 +1,812 @@
 import numpy as np
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, Union
 import numba
+from numba.extending import register_jitable
+from aligner.scoring import SeqLike, encode_sequence, decode_sequence, score_table
 
 
-def _get_pair_score(
-        char1: str,
-        char2: str,
+def _prepare_sequences(
+        seq1: SeqLike,
+        seq2: SeqLike,
         match_score: int,
         mismatch_score: int,
         scoring_matrix: Optional[Dict[Tuple[str, str], int]]
-) -> int:
-    if scoring_matrix:
-        return scoring_matrix.get((char1.upper(), char2.upper()), mismatch_score)
-    return match_score if char1 == char2 else mismatch_score
-
-
-def _backtrace_linear(
-        dp: np.ndarray,
-        seq1: str,
-        seq2: str,
-        start_i: int,
-        start_j: int,
+) -> Tuple[str, str, np.ndarray, np.ndarray, np.ndarray]:
+    # строки для вывода, uint8-коды для DP и таблица score: score пары = table[a[i], b[j]]
+    return (
+        decode_sequence(seq1), decode_sequence(seq2),
+        encode_sequence(seq1), encode_sequence(seq2),
+        score_table(match_score, mismatch_score, scoring_matrix)
+    )
+
+
+# направления traceback (linear gaps), 2 бита на ячейку
+STOP, DIAG, UP, LEFT = 0, 1, 2, 3
+# операции выравнивания: пара символов, gap в seq2, gap в seq1
+OP_MATCH, OP_DEL, OP_INS = 0, 1, 2
+# "минус бесконечность" для целочисленных DP
+_NEG_INF = -(1 << 40)
+# бит на указатель ячейки: linear - направление, affine - источник M (2 бита) и продолжение Ix, Iy (по биту)
+LINEAR_BITS, AFFINE_BITS = 2, 4
+
+# Строки score считаются в самом узком целом типе, в котором не насыщаются: сначала int16, при выходе score
+# за четверть диапазона - заново в int32, затем в int64. "Минус бесконечность" типа - половина диапазона:
+# недостижимые кандидаты не опускаются ниже нее (обрезаются), а реальный score, уходя вниз шагами не больше
+# max_step, обязательно попадает в полосу (-limit - max_step, -limit) выше "бесконечности" - там насыщение
+# и замечается. Значения: (neg_inf, limit)
+SCORE_DTYPES = (np.int16, np.int32, np.int64)
+_SCORE_LIMITS = {np.int16: (-(1 << 14), 1 << 13), np.int32: (-(1 << 30), 1 << 29), np.int64: (_NEG_INF, 1 << 38)}
+
+
+def _pointer_bytes(rows: int, cols: int, bits: int) -> int:
+    # байт на матрицу указателей rows x cols по bits бит на ячейку
+    return rows * ((cols * bits + 7) // 8)
+
+
+def _pack_pointers(ptr: np.ndarray, bits: int) -> np.ndarray:
+    # упаковка матрицы указателей по байту на ячейку в bits бит на ячейку (младшие биты - меньший столбец)
+    per_byte = 8 // bits
+    cols = -(-ptr.shape[1] // per_byte) * per_byte
+    wide = np.zeros((ptr.shape[0], cols), dtype=np.uint8)
+    wide[:, :ptr.shape[1]] = ptr
+    wide = wide.reshape(ptr.shape[0], -1, per_byte)
+    packed = np.zeros(wide.shape[:2], dtype=np.uint8)
+    for slot in range(per_byte):
+        packed |= wide[:, :, slot] << np.uint8(slot * bits)
+    return packed
+
+
+# распаковка указателей - register_jitable: из compiled кода встраивается, из python (traceback движка
+# diagonal через py_func) вызывается как обычная функция и numba не компилирует
+@register_jitable
+def _get2(ptr: np.ndarray, i: int, k: int) -> int:
+    return (ptr[i, k >> 2] >> ((k & 3) * 2)) & 3
+
+
+@register_jitable
+def _set2(ptr: np.ndarray, i: int, k: int, value: int):
+    # матрица указателей заполнена нулями, поэтому достаточно OR
+    ptr[i, k >> 2] |= value << ((k & 3) * 2)
+
+
+@register_jitable
+def _get4(ptr: np.ndarray, i: int, k: int) -> int:
+    return (ptr[i, k >> 1] >> ((k & 1) * 4)) & 15
+
+
+@register_jitable
+def _set4(ptr: np.ndarray, i: int, k: int, value: int):
+    ptr[i, k >> 1] |= value << ((k & 1) * 4)
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _fill_linear(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
         gap_penalty: int,
-        pair_score_func,
-        stop_condition,
-        bandwidth: Optional[int] = None
-) -> Tuple[str, str]:
-    align1, align2 = [], []
-    i, j = start_i, start_j
-    if bandwidth is not None:
-        width = 2 * bandwidth + 1
-        while not stop_condition(i, j, dp):
-            col = j - (i - bandwidth)
-            if col < 0 or col >= width:
-                # Выход за band
-                if col < 0:
-                    align1.append(seq1[i - 1])
-                    align2.append('-')
-                    i -= 1
+        local: bool,
+        banded: bool,
+        lo: int,
+        hi: int,
+        traceback: bool,
+        rows: np.ndarray,
+        neg_inf: int,
+        limit: int,
+        floor: int
+) -> Tuple[np.ndarray, int, int, int, bool]:
+    # заполнение NW/SW с целыми score: две строки score (rows, тип задает вызывающий) и 2-битный указатель на ячейку;
+    # в banded-режиме считаются диагонали lo <= j - i <= hi, указатели лежат в координатах band;
+    # traceback=False - только score и конец выравнивания, матрица указателей не выделяется.
+    # Последний элемент результата - насыщение: score вышел за limit (или ниже -limit, но выше floor)
+    n, m = len(a), len(b)
+    width = hi - lo + 1 if banded else m + 1
+    ptr = np.zeros((n + 1, (width + 3) // 4) if traceback else (1, 1), dtype=np.uint8)
+    prev, curr = rows[0], rows[1]
+    prev[:] = neg_inf
+    curr[:] = neg_inf
+    best, best_i, best_j = 0, 0, 0
+
+    j_hi = min(m, hi) if banded else m
+    for j in range(j_hi + 1):
+        k = j - lo if banded else j
+        if local:
+            prev[j] = 0
+        else:
+            if j * gap_penalty < -limit:
+                return ptr, 0, 0, 0, True
+            prev[j] = j * gap_penalty
+            if j > 0 and traceback:
+                _set2(ptr, 0, k, LEFT)
+    if j_hi < m:
+        prev[j_hi + 1] = neg_inf
+
+    for i in range(1, n + 1):
+        j_lo = max(0, i + lo) if banded else 0
+        j_hi = min(m, i + hi) if banded else m
+        if 0 < j_lo <= m:
+            curr[j_lo - 1] = neg_inf
+        ai = a[i - 1]
+        for j in range(j_lo, j_hi + 1):
+            k = j - (i + lo) if banded else j
+            if j == 0:
+                if local:
+                    curr[0] = 0
                 else:
-                    align1.append('-')
-                    align2.append(seq2[j - 1])
-                    j -= 1
-                continue
-            if i > 0 and j > 0 and col > 0:  # col-1 >=0
-                pair_score = pair_score_func(seq1[i - 1], seq2[j - 1])
-                if dp[i][col] == dp[i - 1][col - 1] + pair_score:
-                    align1.append(seq1[i - 1])
-                    align2.append(seq2[j - 1])
-                    i -= 1
-                    j -= 1
-                    continue
-            if i > 0 and dp[i][col] == dp[i - 1][col] + gap_penalty:
-                align1.append(seq1[i - 1])
-                align2.append('-')
-                i -= 1
-                continue
-            if j > 0:
-                align1.append('-')
-                align2.append(seq2[j - 1])
-                j -= 1
-    else:
-        while not stop_condition(i, j, dp):
-            if i > 0 and j > 0:
-                pair_score = pair_score_func(seq1[i - 1], seq2[j - 1])
-                if dp[i][j] == dp[i - 1][j - 1] + pair_score:
-                    align1.append(seq1[i - 1])
-                    align2.append(seq2[j - 1])
-                    i -= 1
-                    j -= 1
-                    continue
-            if i > 0 and (j == 0 or dp[i][j] == dp[i - 1][j] + gap_penalty):
-                align1.append(seq1[i - 1])
-                align2.append('-')
-                i -= 1
+                    if i * gap_penalty < -limit:
+                        return ptr, 0, 0, 0, True
+                    curr[0] = i * gap_penalty
+                    if traceback:
+                        _set2(ptr, i, k, UP)
                 continue
-            if j > 0:
-                align1.append('-')
-                align2.append(seq2[j - 1])
-                j -= 1
-    while i > 0:
-        align1.append(seq1[i - 1])
-        align2.append('-')
-        i -= 1
-    while j > 0:
-        align1.append('-')
-        align2.append(seq2[j - 1])
-        j -= 1
-    return ''.join(reversed(align1)), ''.join(reversed(align2))
-
-
-def _backtrace_affine(
-        M: np.ndarray,
-        Ix: np.ndarray,
-        Iy: np.ndarray,
-        seq1: str,
-        seq2: str,
-        start_i: int,
-        start_j: int,
+            # порядок сравнения задает приоритет при равенстве: diag, up, left
+            score = prev[j - 1] + table[ai, b[j - 1]]
+            direction = DIAG
+            up = prev[j] + gap_penalty
+            if up > score:
+                score = up
+                direction = UP
+            left = curr[j - 1] + gap_penalty
+            if left > score:
+                score = left
+                direction = LEFT
+            if local:
+                if score <= 0:
+                    score = 0
+                    direction = STOP
+                elif score > best:
+                    best, best_i, best_j = score, i, j
+            if score > limit or floor < score < -limit:
+                return ptr, 0, 0, 0, True
+            curr[j] = max(score, neg_inf)
+            if traceback:
+                _set2(ptr, i, k, direction)
+        if j_hi < m:
+            curr[j_hi + 1] = neg_inf
+        prev, curr = curr, prev
+
+    if not local:
+        best, best_i, best_j = prev[m], n, m
+    return ptr, best, best_i, best_j, False
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _traceback_linear(
+        ptr: np.ndarray,
+        i: int,
+        j: int,
+        banded: bool,
+        lo: int
+) -> Tuple[np.ndarray, int, int]:
+    # идет по указателям от (i, j) до STOP; возвращает операции в прямом порядке и стартовую ячейку
+    ops = np.empty(i + j, dtype=np.uint8)
+    length = 0
+    while True:
+        k = j - (i + lo) if banded else j
+        direction = _get2(ptr, i, k)
+        if direction == STOP:
+            break
+        if direction == DIAG:
+            ops[length] = OP_MATCH
+            i -= 1
+            j -= 1
+        elif direction == UP:
+            ops[length] = OP_DEL
+            i -= 1
+        else:
+            ops[length] = OP_INS
+            j -= 1
+        length += 1
+    return ops[:length][::-1].copy(), i, j
+
+
+@numba.jit(nopython=True, cache=True)
+def _fill_affine(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
         gap_open: int,
         gap_extend: int,
-        pair_score_func,
-        stop_condition
-) -> Tuple[str, str]:
-    align1, align2 = [], []
-    i, j = start_i, start_j
-    current_matrix = np.argmax([M[i][j], Ix[i][j], Iy[i][j]])  # 0: M, 1: Ix, 2: Iy
-    while i > 0 or j > 0:
-        if current_matrix == 0:  # M
-            align1.append(seq1[i - 1])
-            align2.append(seq2[j - 1])
+        local: bool,
+        banded: bool,
+        lo: int,
+        hi: int,
+        traceback: bool,
+        rows: np.ndarray,
+        neg_inf: int,
+        limit: int,
+        floor: int
+) -> Tuple[np.ndarray, int, int, int, int, bool]:
+    # Gotoh (M, Ix, Iy) с целыми score; 4-битный указатель ячейки: биты 0-1 - из какой матрицы пришел M
+    # (3 - начало локального выравнивания), бит 2 - Ix продолжает gap (иначе открыт из M),
+    # бит 3 - то же для Iy; banded, traceback=False, rows (шесть строк) и насыщение - как в _fill_linear
+    n, m = len(a), len(b)
+    width = hi - lo + 1 if banded else m + 1
+    ptr = np.zeros((n + 1, (width + 1) // 2) if traceback else (1, 1), dtype=np.uint8)
+    M_prev, X_prev, Y_prev, M_curr, X_curr, Y_curr = rows[0], rows[1], rows[2], rows[3], rows[4], rows[5]
+    rows[:] = neg_inf
+    j_hi = min(m, hi) if banded else m
+    for j in range(j_hi + 1):
+        if local or j == 0:
+            M_prev[j] = 0
+        else:
+            if gap_open + (j - 1) * gap_extend < -limit:
+                return ptr, 0, 0, 0, 0, True
+            Y_prev[j] = gap_open + (j - 1) * gap_extend
+            M_prev[j] = Y_prev[j]
+    top, top_i, top_j = 0, 0, 0
+
+    for i in range(1, n + 1):
+        j_lo = max(0, i + lo) if banded else 0
+        j_hi = min(m, i + hi) if banded else m
+        if 0 < j_lo <= m:
+            M_curr[j_lo - 1] = neg_inf
+            X_curr[j_lo - 1] = neg_inf
+            Y_curr[j_lo - 1] = neg_inf
+        if j_lo == 0:
+            if local:
+                M_curr[0] = 0
+                X_curr[0] = neg_inf
+            else:
+                if gap_open + (i - 1) * gap_extend < -limit:
+                    return ptr, 0, 0, 0, 0, True
+                X_curr[0] = gap_open + (i - 1) * gap_extend
+                M_curr[0] = X_curr[0]
+            Y_curr[0] = neg_inf
+        ai = a[i - 1]
+        for j in range(max(1, j_lo), j_hi + 1):
+            best = M_prev[j - 1]
+            source = 0
+            if X_prev[j - 1] > best:
+                best = X_prev[j - 1]
+                source = 1
+            if Y_prev[j - 1] > best:
+                best = Y_prev[j - 1]
+                source = 2
+            if local and best <= 0:
+                best = 0
+                source = 3
+            match = best + table[ai, b[j - 1]]
+            if match > limit or floor < match < -limit:
+                return ptr, 0, 0, 0, 0, True
+            M_curr[j] = max(match, neg_inf)
+            if local and match > top:
+                top, top_i, top_j = match, i, j
+
+            x_open = M_prev[j] + gap_open
+            x_ext = X_prev[j] + gap_extend
+            if x_ext > x_open:
+                x_open = x_ext
+                source |= 4
+            if floor < x_open < -limit:
+                return ptr, 0, 0, 0, 0, True
+            X_curr[j] = max(x_open, neg_inf)
+
+            y_open = M_curr[j - 1] + gap_open
+            y_ext = Y_curr[j - 1] + gap_extend
+            if y_ext > y_open:
+                y_open = y_ext
+                source |= 8
+            if floor < y_open < -limit:
+                return ptr, 0, 0, 0, 0, True
+            Y_curr[j] = max(y_open, neg_inf)
+            if traceback:
+                _set4(ptr, i, j - (i + lo) if banded else j, source)
+        if j_hi < m:
+            M_curr[j_hi + 1] = neg_inf
+            X_curr[j_hi + 1] = neg_inf
+            Y_curr[j_hi + 1] = neg_inf
+        M_prev, M_curr = M_curr, M_prev
+        X_prev, X_curr = X_curr, X_prev
+        Y_prev, Y_curr = Y_curr, Y_prev
+
+    if local:
+        # локальное выравнивание всегда заканчивается в M
+        return ptr, top, 0, top_i, top_j, False
+    # стартовое состояние traceback - первая матрица с максимумом в (n, m)
+    state = 0
+    score = M_prev[m]
+    if X_prev[m] > score:
+        score = X_prev[m]
+        state = 1
+    if Y_prev[m] > score:
+        score = Y_prev[m]
+        state = 2
+    return ptr, score, state, n, m, False
+
+
+def _compiled_fill(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        gap_penalty: int,
+        gap_open: Optional[int],
+        gap_extend: Optional[int],
+        local: bool,
+        banded: bool = False,
+        lo: int = 0,
+        hi: int = 0,
+        traceback: bool = True
+) -> Tuple[np.ndarray, int, int, int, int]:
+    # _fill_linear / _fill_affine в самом узком типе строк score без насыщения; (ptr, score, state, end_i, end_j),
+    # недостижимый конец - score _NEG_INF, как раньше
+    affine = gap_open is not None and gap_extend is not None
+    gaps = (gap_open, gap_extend) if affine else (gap_penalty,)
+    max_step = int(np.abs(table).max()) + max(abs(gap) for gap in gaps)
+    for dtype in SCORE_DTYPES:
+        neg_inf, limit = _SCORE_LIMITS[dtype]
+        if dtype is not np.int64 and 2 * max_step >= limit:
+            continue
+        rows = np.empty((6 if affine else 2, len(b) + 1), dtype=dtype)
+        floor = neg_inf + max_step
+        if affine:
+            ptr, score, state, end_i, end_j, saturated = _fill_affine(
+                a, b, table, gap_open, gap_extend, local, banded, lo, hi, traceback, rows, neg_inf, limit, floor)
+        else:
+            ptr, score, end_i, end_j, saturated = _fill_linear(
+                a, b, table, gap_penalty, local, banded, lo, hi, traceback, rows, neg_inf, limit, floor)
+            state = 0
+        if not saturated or dtype is np.int64:
+            break
+    score = int(score)
+    if score < -limit:
+        score = _NEG_INF
+    return ptr, score, state, end_i, end_j
+
+
+@numba.jit(nopython=True, cache=True)
+def _traceback_affine(
+        ptr: np.ndarray,
+        i: int,
+        j: int,
+        state: int,
+        local: bool,
+        banded: bool = False,
+        lo: int = 0
+) -> Tuple[np.ndarray, int, int]:
+    ops = np.empty(i + j, dtype=np.uint8)
+    length = 0
+    while i > 0 and j > 0:
+        source = _get4(ptr, i, j - (i + lo) if banded else j)
+        if state == 0:
+            ops[length] = OP_MATCH
+            state = source & 3
             i -= 1
             j -= 1
-            current_matrix = np.argmax([M[i][j], Ix[i][j], Iy[i][j]])
-        elif current_matrix == 1:  # Ix (gap in seq2)
-            align1.append(seq1[i - 1])
-            align2.append('-')
+            if state == 3:
+                length += 1
+                break
+        elif state == 1:
+            ops[length] = OP_DEL
+            state = 1 if source & 4 else 0
             i -= 1
-            if i >= 0 and Ix[i + 1][j] == M[i][j] + gap_open:
-                current_matrix = 0
-            else:
-                current_matrix = 1
-        else:  # Iy (gap in seq1)
-            align1.append('-')
-            align2.append(seq2[j - 1])
+        else:
+            ops[length] = OP_INS
+            state = 2 if source & 8 else 0
             j -= 1
-            if j >= 0 and Iy[i][j + 1] == M[i][j] + gap_open:
-                current_matrix = 0
-            else:
-                current_matrix = 2
-    return ''.join(reversed(align1)), ''.join(reversed(align2))
+        length += 1
+    if not local:
+        while i > 0:
+            ops[length] = OP_DEL
+            i -= 1
+            length += 1
+        while j > 0:
+            ops[length] = OP_INS
+            j -= 1
+            length += 1
+    return ops[:length][::-1].copy(), i, j
 
 
-@numba.jit(nopython=True)
-def _compute_nw_row_vectorized(
-        seq1: str,
-        seq2: str,
-        match_score: int,
-        mismatch_score: int,
-        gap_penalty: int
-) -> np.ndarray:
-    # векторизованная версия заполнения строки NW (для Hirschberg)
-    n = len(seq1)
-    m = len(seq2)
-    prev = np.arange(0, gap_penalty * (m + 1), gap_penalty, dtype=np.float64)
-    for i in range(1, n + 1):
-        curr = np.zeros(m + 1, dtype=np.float64)
-        curr[0] = prev[0] + gap_penalty
-        char1 = seq1[i - 1]
-        pair_scores = np.array([match_score if char1 == seq2[j - 1] else mismatch_score for j in range(1, m + 1)], dtype=np.float64)
-        diag = prev[:-1] + pair_scores
-        up = prev[1:] + gap_penalty
-        left = curr[:-1] + gap_penalty
-        curr[1:] = np.maximum.reduce([diag, up, left])
-        prev = curr
-    return prev
+def _render_alignment(seq1: str, seq2: str, ops: np.ndarray, start_i: int = 0, start_j: int = 0) -> Tuple[str, str]:
+    # строки с gap'ами по массиву операций, без посимвольного цикла в python
+    chars1 = np.frombuffer(seq1.encode('utf-32-le'), dtype=np.uint32)
+    chars2 = np.frombuffer(seq2.encode('utf-32-le'), dtype=np.uint32)
+    take1 = ops != OP_INS
+    take2 = ops != OP_DEL
+    gap = np.uint32(ord('-'))
+    out1 = np.full(len(ops), gap, dtype=np.uint32)
+    out2 = np.full(len(ops), gap, dtype=np.uint32)
+    out1[take1] = chars1[start_i:start_i + int(take1.sum())]
+    out2[take2] = chars2[start_j:start_j + int(take2.sum())]
+    return out1.tobytes().decode('utf-32-le'), out2.tobytes().decode('utf-32-le')
+
+
+def _summarize_ops(ops: np.ndarray, chars1: np.ndarray, chars2: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int, int]:
+    # run-length (CIGAR) и число совпадений и gap-столбцов операций traceback, векторно в numpy (без JIT -
+    # движок diagonal не компилирует numba); chars1/chars2 - символы выровненных участков (utf-32),
+    # совпадение - как в строках выравнивания
+    starts = np.flatnonzero(np.concatenate(([True], ops[1:] != ops[:-1]))) if len(ops) else np.zeros(0, np.int64)
+    run_ops = ops[starts].astype(np.uint8)
+    run_lengths = np.diff(np.append(starts, len(ops))).astype(np.uint32)
+    paired = ops == OP_MATCH
+    pos1 = np.cumsum(ops != OP_INS) - 1
+    pos2 = np.cumsum(ops != OP_DEL) - 1
+    matches = int(np.count_nonzero(chars1[pos1[paired]] == chars2[pos2[paired]]))
+    return run_ops, run_lengths, matches, len(ops) - int(np.count_nonzero(paired))
+
+
+def _utf32(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+
+class Alignment:
+    # результат парного выравнивания: координаты участков [start, end) в seq1/seq2, run-length CIGAR и статистика
+    # (считается один раз при сборке из операций traceback); строки с gap'ами рендерятся только по запросу.
+    # Распаковывается как (align1, align2, score), как раньше возвращались кортежи
+    __slots__ = ("score", "start_i", "end_i", "start_j", "end_j", "length", "matches", "gaps", "plan",
+                 "_run_ops", "_run_lengths", "_seq1", "_seq2")
+
+    _CIGAR = "MDI"
+
+    def __init__(self, seq1: str, seq2: str, run_ops: np.ndarray, run_lengths: np.ndarray, score: int,
+                 start_i: int, start_j: int, matches: int, gaps: int):
+        lengths = run_lengths.astype(np.int64)
+        self.score = score
+        self.start_i = start_i
+        self.start_j = start_j
+        self.end_i = start_i + int(lengths[run_ops != OP_INS].sum())
+        self.end_j = start_j + int(lengths[run_ops != OP_DEL].sum())
+        self.length = int(lengths.sum())
+        self.matches = matches
+        self.gaps = gaps
+        self.plan = None
+        self._run_ops = run_ops
+        self._run_lengths = run_lengths
+        self._seq1 = seq1
+        self._seq2 = seq2
+
+    @classmethod
+    def from_ops(cls, seq1: str, seq2: str, ops: np.ndarray, score: int, start_i: int = 0,
+                 start_j: int = 0) -> "Alignment":
+        # из массива операций traceback; seq1/seq2 - полные последовательности (хранятся ссылки, не копии)
+        take1 = int(np.count_nonzero(ops != OP_INS))
+        take2 = int(np.count_nonzero(ops != OP_DEL))
+        run_ops, run_lengths, matches, gaps = _summarize_ops(
+            ops, _utf32(seq1[start_i:start_i + take1]), _utf32(seq2[start_j:start_j + take2]))
+        return cls(seq1, seq2, run_ops, run_lengths, int(score), start_i, start_j, matches, gaps)
+
+    def offset(self, seq1: str, seq2: str, start_i: int, start_j: int, score: Optional[int] = None) -> "Alignment":
+        # то же выравнивание подпоследовательностей, привязанное к seq1/seq2 с началом (start_i, start_j)
+        return Alignment(seq1, seq2, self._run_ops, self._run_lengths, self.score if score is None else score,
+                         start_i, start_j, self.matches, self.gaps)
+
+    @property
+    def identity(self) -> float:
+        # % столбцов с одинаковыми символами
+        return self.matches / self.length * 100 if self.length > 0 else 0
+
+    @property
+    def cigar(self) -> str:
+        # M - пара символов, D - gap в seq2, I - gap в seq1
+        return ''.join(f"{length}{self._CIGAR[op]}" for op, length in zip(self._run_ops, self._run_lengths))
+
+    def ops(self) -> np.ndarray:
+        return np.repeat(self._run_ops, self._run_lengths)
+
+    def aligned(self) -> Tuple[str, str]:
+        # строки с gap'ами
+        return _render_alignment(self._seq1[self.start_i:self.end_i], self._seq2[self.start_j:self.end_j], self.ops())
+
+    def match_line(self, match: str = '|', mismatch: str = ' ') -> str:
+        # строка совпадений под выравниванием: match в столбцах с одинаковыми символами
+        ops = self.ops()
+        pairs = ops == OP_MATCH
+        col1 = _utf32(self._seq1[self.start_i:self.end_i])[np.cumsum(ops != OP_INS)[pairs] - 1]
+        col2 = _utf32(self._seq2[self.start_j:self.end_j])[np.cumsum(ops != OP_DEL)[pairs] - 1]
+        line = np.full(len(ops), ord(mismatch), dtype=np.uint32)
+        line[np.flatnonzero(pairs)[col1 == col2]] = ord(match)
+        return line.tobytes().decode('utf-32-le')
+
+    def __iter__(self):
+        align1, align2 = self.aligned()
+        return iter((align1, align2, self.score))
+
+    def __len__(self) -> int:
+        return 3
+
+    def __getitem__(self, index):
+        if index == 2 or index == -1:
+            return self.score
+        return tuple(self)[index]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (Alignment, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return (f"Alignment(score={self.score}, seq1=[{self.start_i}:{self.end_i}], "
+                f"seq2=[{self.start_j}:{self.end_j}], cigar={self.cigar!r})")
+
+
+def _band_limits(n: int, m: int, bandwidth: int) -> Tuple[int, int]:
+    # band вокруг главной диагонали, расширенный так, чтобы в него попадала ячейка (n, m)
+    return min(0, m - n) - bandwidth, max(0, m - n) + bandwidth
+
+
+ENGINES = ("compiled", "diagonal")
+# needleman_wunsch дополнительно умеет bit-parallel edit distance (aligner.bitparallel)
+# и wavefront alignment (aligner.wavefront), полный и low-memory; auto - выбор по модели стоимости (aligner.dispatch)
+GLOBAL_ENGINES = ENGINES + ("bitparallel", "wfa", "wfa-lowmem", "auto")
+LOCAL_ENGINES = ENGINES + ("auto",)
+# сколько байт можно отдать под полную матрицу указателей (LINEAR_BITS / AFFINE_BITS на ячейку), выше - линейная память
+MATRIX_MEMORY_BUDGET = 1 << 27
+
+
+def _band_window(n: int, m: int, bandwidth: Optional[int], local: bool) -> Tuple[bool, int, int]:
+    # (banded, lo, hi) для _fill_linear
+    if bandwidth is None:
+        return False, 0, 0
+    if local:
+        return True, -bandwidth, bandwidth
+    return (True,) + _band_limits(n, m, bandwidth)
+
+
+def _fill_encoded(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        gap_penalty: int,
+        gap_open: Optional[int],
+        gap_extend: Optional[int],
+        local: bool,
+        bandwidth: Optional[int],
+        engine: str,
+        traceback: bool = True
+) -> Tuple[np.ndarray, int, int, int, int]:
+    # заполнение выбранным движком; возвращает (ptr, score, state, end_i, end_j), state - только для affine
+    if engine not in ENGINES:
+        raise ValueError(f"Неизвестный движок '{engine}'. Доступны: {', '.join(ENGINES)}")
+    affine = gap_open is not None and gap_extend is not None
+    if engine == "diagonal":
+        if bandwidth is not None:
+            raise ValueError("Движок diagonal не поддерживает banded режим")
+        from aligner.diagonal import diagonal_fill_linear, diagonal_fill_affine
+        # numpy-движок пишет байт на ячейку; traceback общий - по упакованным указателям
+        if affine:
+            ptr, score, state, end_i, end_j = diagonal_fill_affine(a, b, table, gap_open, gap_extend, local,
+                                                                   traceback)
+            return _pack_pointers(ptr, AFFINE_BITS), score, state, end_i, end_j
+        ptr, score, end_i, end_j = diagonal_fill_linear(a, b, table, gap_penalty, local, traceback)
+        return _pack_pointers(ptr, LINEAR_BITS), score, 0, end_i, end_j
+
+    banded, lo, hi = _band_window(len(a), len(b), bandwidth, local)
+    return _compiled_fill(a, b, table, gap_penalty, gap_open, gap_extend, local, banded, lo, hi, traceback)
+
+
+def _align_encoded(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        gap_penalty: int,
+        gap_open: Optional[int],
+        gap_extend: Optional[int],
+        local: bool,
+        bandwidth: Optional[int],
+        engine: str
+) -> Tuple[np.ndarray, int, int, int]:
+    # заполнение + traceback выбранным движком; возвращает операции, score и стартовую ячейку
+    ptr, score, state, end_i, end_j = _fill_encoded(a, b, table, gap_penalty, gap_open, gap_extend, local,
+                                                    bandwidth, engine)
+    affine = gap_open is not None and gap_extend is not None
+    # у diagonal traceback без JIT: py_func - исходная python-версия compiled функции
+    traceback_affine = _traceback_affine.py_func if engine == "diagonal" else _traceback_affine
+    traceback_linear = _traceback_linear.py_func if engine == "diagonal" else _traceback_linear
+    banded, lo, _ = _band_window(len(a), len(b), bandwidth, local)
+    if affine:
+        ops, start_i, start_j = traceback_affine(ptr, end_i, end_j, state, local, banded, lo)
+    else:
+        ops, start_i, start_j = traceback_linear(ptr, end_i, end_j, banded, lo)
+    return ops, int(score), start_i, start_j
+
+
+# начальная ширина band для bandwidth="auto"; дальше удваивается
+AUTO_BAND_START = 32
+
+
+def _band_escape_bound(n: int, m: int, lo: int, hi: int, pair_max: int, gap_max: int) -> Optional[int]:
+    # верхняя граница score любого глобального пути, выходящего из band lo <= j - i <= hi; None - выйти нельзя.
+    # Чтобы дойти до диагонали hi + 1, нужно >= hi + 1 ходов вправо и столько же минус (m - n) вниз, а каждая
+    # такая пара gap-столбцов отнимает одну пару символов; score каждого gap-столбца не больше gap_max
+    bounds = []
+    for steps_right, steps_down in ((hi + 1, hi + 1 - (m - n)), (1 - lo + (m - n), 1 - lo)):
+        if 0 <= steps_right <= m and 0 <= steps_down <= n:
+            bounds.append((m - steps_right) * pair_max + (steps_right + steps_down) * gap_max)
+    return max(bounds) if bounds else None
+
+
+def _auto_bandwidth(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        gap_penalty: int,
+        gap_open: Optional[int],
+        gap_extend: Optional[int],
+        engine: str
+) -> Optional[int]:
+    # удваивает band, пока score внутри него не станет не меньше любого пути вне band - тогда он оптимален;
+    # None - band дорос до всей матрицы (или оценка невозможна) и нужен полный DP
+    n, m = len(a), len(b)
+    affine = gap_open is not None and gap_extend is not None
+    gap_max = max(gap_open, gap_extend) if affine else gap_penalty
+    if n == 0 or m == 0 or gap_max > 0:
+        return None
+    pair_max = max(int(table[np.ix_(np.unique(a), np.unique(b))].max()), 0)
+    bandwidth = AUTO_BAND_START
+    while True:
+        lo, hi = _band_limits(n, m, bandwidth)
+        if lo <= -n and hi >= m:
+            return None
+        _, score, _, _, _ = _fill_encoded(a, b, table, gap_penalty, gap_open, gap_extend, False, bandwidth, engine,
+                                          traceback=False)
+        bound = _band_escape_bound(n, m, lo, hi, pair_max, gap_max)
+        if bound is None or score >= bound:
+            return bandwidth
+        bandwidth *= 2
+
+
+class ScoreResult:
+    # результат score_only: score и конец выравнивания (для SW), traceback считается только по запросу
+
+    def __init__(self, score: int, end_i: int, end_j: int, align, seq1: str, seq2: str, **params):
+        self.score = score
+        self.end_i = end_i
+        self.end_j = end_j
+        self._align = align
+        self._seq1 = seq1
+        self._seq2 = seq2
+        self._params = params
+        # план выбора движка (engine="auto"), см. aligner.dispatch
+        self.plan = None
+
+    def traceback(self) -> "Alignment":
+        # полное выравнивание (align1, align2, score), как без score_only; для SW достаточно
+        # прямоугольника до конца выравнивания - первый максимум в нем тот же
+        return self._align(self._seq1[:self.end_i], self._seq2[:self.end_j], **self._params)
+
+    def __repr__(self) -> str:
+        return f"ScoreResult(score={self.score}, end=({self.end_i}, {self.end_j}))"
 
 
 def needleman_wunsch(
-        seq1: str,
-        seq2: str,
+        seq1: SeqLike,
+        seq2: SeqLike,
         match_score: int = 1,
         mismatch_score: int = -1,
         gap_penalty: int = -2,
         gap_open: Optional[int] = None,
         gap_extend: Optional[int] = None,
         scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
-        bandwidth: Optional[int] = None
-) -> Tuple[str, str, int]:
-    # Needleman-Wunsch с векторизацией, banded и affine gaps
-    seq1 = seq1.upper()
-    seq2 = seq2.upper()
+        bandwidth: Optional[Union[int, str]] = None,
+        engine: str = "compiled",
+        score_only: bool = False,
+        max_memory: Optional[int] = None
+) -> Union[Alignment, ScoreResult]:
+    # Needleman-Wunsch (compiled fill + traceback по указателям), banded и affine gaps;
+    # seq1/seq2 - строки или uint8-коды, engine="diagonal" - numpy-проход по антидиагоналям без JIT;
+    # score_only=True - две строки DP вместо матрицы, возвращает ScoreResult с отложенным traceback;
+    # bandwidth="auto" - самый узкий band (удвоениями), для которого результат доказуемо оптимален;
+    # engine="bitparallel" - edit distance по 64 ячейки в слове, только для linear-схем, эквивалентных ей
+    # (match = 2 * (mismatch - gap), например 0 / -1 / -1 - тогда score = -distance), иначе ValueError;
+    # engine="wfa"/"wfa-lowmem" - wavefront alignment за O(n * s), s - штраф выравнивания;
+    # engine="auto" - движок выбирает aligner.dispatch по длинам, расхождению и бюджету max_memory (байт)
+    if engine == "auto":
+        if bandwidth is None:
+            from aligner.dispatch import align
+            return align(seq1, seq2, False, match_score, mismatch_score, gap_penalty, gap_open, gap_extend,
+                         scoring_matrix, max_memory, score_only)
+        engine = "compiled"
+    seq1, seq2, a, b, table = _prepare_sequences(seq1, seq2, match_score, mismatch_score, scoring_matrix)
     n, m = len(seq1), len(seq2)
-    if n > 10000 or m > 10000:
-        raise ValueError("Последовательности слишком длинные для базовой версии. Используйте оптимизированную")
+    if engine == "bitparallel":
+        if (gap_open is not None and gap_extend is not None) or scoring_matrix is not None or bandwidth is not None:
+            raise ValueError("Движок bitparallel считает только edit distance: без affine gaps, scoring_matrix и band")
+        # linear-схема эквивалентна edit distance, только если mismatch и gap стоят одинаково относительно match:
+        # при 2 * (пар) + gaps = n + m score = match * (n + m) / 2 - cost * distance, cost = mismatch - 2 * gap
+        cost = mismatch_score - 2 * gap_penalty
+        if match_score != 2 * (mismatch_score - gap_penalty) or cost <= 0:
+            raise ValueError("Движок bitparallel считает только edit distance: нужен match = 2 * (mismatch - gap) "
+                             "и mismatch > 2 * gap, например match=0, mismatch=-1, gap=-1")
+        base = match_score * (n + m) // 2
+        from aligner.bitparallel import edit_alignment, edit_distance
+        if score_only:
+            return ScoreResult(base - cost * edit_distance(a, b), n, m, needleman_wunsch, seq1, seq2,
+                               match_score=match_score, mismatch_score=mismatch_score, gap_penalty=gap_penalty,
+                               engine=engine)
+        ops, distance = edit_alignment(a, b)
+        return Alignment.from_ops(seq1, seq2, ops, base - cost * distance)
+    if engine in ("wfa", "wfa-lowmem"):
+        if scoring_matrix is not None or bandwidth is not None:
+            raise ValueError(f"Движок {engine} не поддерживает scoring_matrix и band")
+        from aligner.wavefront import wfa_needleman_wunsch, wfa_score
+        if score_only:
+            score = wfa_score(a, b, match_score, mismatch_score, gap_penalty, gap_open, gap_extend)
+            return ScoreResult(score, n, m, needleman_wunsch, seq1, seq2, match_score=match_score,
+                               mismatch_score=mismatch_score, gap_penalty=gap_penalty, gap_open=gap_open,
+                               gap_extend=gap_extend, engine=engine)
+        return wfa_needleman_wunsch(seq1, seq2, match_score, mismatch_score, gap_penalty, gap_open, gap_extend,
+                                    low_memory=engine == "wfa-lowmem")
+    if bandwidth == "auto":
+        bandwidth = _auto_bandwidth(a, b, table, gap_penalty, gap_open, gap_extend, engine)
+    if score_only:
+        _, score, _, end_i, end_j = _fill_encoded(a, b, table, gap_penalty, gap_open, gap_extend, False,
+                                                  bandwidth, engine, traceback=False)
+        if score <= _NEG_INF // 2:
+            score = -10000000000
+        return ScoreResult(int(score), end_i, end_j, needleman_wunsch, seq1, seq2, match_score=match_score,
+                           mismatch_score=mismatch_score, gap_penalty=gap_penalty, gap_open=gap_open,
+                           gap_extend=gap_extend, scoring_matrix=scoring_matrix, bandwidth=bandwidth, engine=engine)
+    bits = AFFINE_BITS if gap_open is not None and gap_extend is not None else LINEAR_BITS
+    budget = MATRIX_MEMORY_BUDGET if max_memory is None else max_memory
+    if bandwidth is None and _pointer_bytes(n + 1, m + 1, bits) > budget:
+        # матрица указателей не влезает в бюджет: divide and conquer в линейной памяти, тот же score
+        from aligner.linear_space import hirschberg_needleman_wunsch, myers_miller_needleman_wunsch
+        if gap_open is not None and gap_extend is not None:
+            return myers_miller_needleman_wunsch(seq1, seq2, match_score, mismatch_score, gap_open, gap_extend,
+                                                 scoring_matrix)
+        return hirschberg_needleman_wunsch(seq1, seq2, match_score, mismatch_score, gap_penalty, scoring_matrix)
 
-    affine = gap_open is not None and gap_extend is not None
-    if affine and bandwidth is not None:
-        raise ValueError("Banded not supported for affine gaps yet")
-    pair_score_func = lambda c1, c2: _get_pair_score(c1, c2, match_score, mismatch_score, scoring_matrix)
-
-    if affine:
-        # Affine gaps (full DP only)
-        M = np.zeros((n + 1, m + 1), dtype=np.float64)
-        Ix = np.full((n + 1, m + 1), -np.inf, dtype=np.float64)
-        Iy = np.full((n + 1, m + 1), -np.inf, dtype=np.float64)
-        for i in range(1, n + 1):
-            Ix[i, 0] = gap_open + (i - 1) * gap_extend
-            M[i, 0] = Ix[i, 0]
-        for j in range(1, m + 1):
-            Iy[0, j] = gap_open + (j - 1) * gap_extend
-            M[0, j] = Iy[0, j]
-        for i in range(1, n + 1):
-            for j in range(1, m + 1):
-                pair = pair_score_func(seq1[i-1], seq2[j-1])
-                M[i, j] = pair + max(M[i-1, j-1], Ix[i-1, j-1], Iy[i-1, j-1])
-                Ix[i, j] = max(M[i-1, j] + gap_open, Ix[i-1, j] + gap_extend)
-                Iy[i, j] = max(M[i, j-1] + gap_open, Iy[i, j-1] + gap_extend)
-        stop_condition = lambda i, j, M: i == 0 or j == 0
-        align1, align2 = _backtrace_affine(M, Ix, Iy, seq1, seq2, n, m, gap_open, gap_extend, pair_score_func, stop_condition)
-        score = max(M[n, m], Ix[n, m], Iy[n, m])
-    else:
-        if bandwidth is not None:
-            width = 2 * bandwidth + 1
-            dp = np.full((n + 1, width), -np.inf, dtype=np.float64)
-
-            for j in range(m + 1):
-                col = j + bandwidth  # col = j - (0 - bandwidth)
-                if 0 <= col < width:
-                    dp[0, col] = j * gap_penalty
-            for i in range(1, n + 1):
-                # left column (gaps в seq2)
-                col_left = bandwidth - i  # col для j=0: 0 - (i - bandwidth) = bandwidth - i
-                if 0 <= col_left < width:
-                    dp[i, col_left] = i * gap_penalty
-                for col in range(width):
-                    j = col + (i - bandwidth)
-                    if j < 0 or j > m:
-                        continue
-                    if j == 0:
-                        continue
-                    pair = pair_score_func(seq1[i - 1], seq2[j - 1])
-
-                    diag = (dp[i - 1, col] + pair) if j > 0 else -np.inf
-                    up = (dp[i - 1, col + 1] + gap_penalty) if col + 1 < width else -np.inf
-                    left = (dp[i, col - 1] + gap_penalty) if col - 1 >= 0 else -np.inf
-                    dp[i, col] = max(diag, up, left)
-            stop_condition = lambda i, j, dp: i == 0 or j == 0
-            align1, align2 = _backtrace_linear(dp, seq1, seq2, n, m, gap_penalty, pair_score_func, stop_condition, bandwidth)
-            col = m - (n - bandwidth)
-            score = dp[n, col] if 0 <= col < width else np.max(dp[n])
-        else:
-            dp = np.zeros((n + 1, m + 1), dtype=np.float64)
-            if gap_penalty != 0:
-                dp[:, 0] = np.arange(0, gap_penalty * (n + 1), gap_penalty)
-                dp[0, :] = np.arange(0, gap_penalty * (m + 1), gap_penalty)
-            else:
-                dp[:, 0] = 0
-                dp[0, :] = 0
-            for i in range(1, n + 1):
-                for j in range(1, m + 1):
-                    pair = pair_score_func(seq1[i - 1], seq2[j - 1])
-                    dp[i][j] = max(
-                        dp[i - 1][j - 1] + pair,
-                        dp[i - 1][j] + gap_penalty,
-                        dp[i][j - 1] + gap_penalty
-                    )
-            stop_condition = lambda i, j, dp: i == 0 or j == 0
-            align1, align2 = _backtrace_linear(dp, seq1, seq2, n, m, gap_penalty, pair_score_func, stop_condition, bandwidth)
-            score = dp[n][m]
-    if np.isinf(score) or np.isnan(score):
+    ops, score, _, _ = _align_encoded(a, b, table, gap_penalty, gap_open, gap_extend, False, bandwidth, engine)
+    if score <= _NEG_INF // 2:
         score = -10000000000
-    return align1, align2, int(score)
+    return Alignment.from_ops(seq1, seq2, ops, score)
 
 
 def smith_waterman(
-        seq1: str,
-        seq2: str,
+        seq1: SeqLike,
+        seq2: SeqLike,
         match_score: int = 1,
         mismatch_score: int = -1,
         gap_penalty: int = -2,
         scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
-        bandwidth: Optional[int] = None
-) -> Tuple[str, str, int]:
-    # Smith-Waterman
-    seq1 = seq1.upper()
-    seq2 = seq2.upper()
+        bandwidth: Optional[int] = None,
+        gap_open: Optional[int] = None,
+        gap_extend: Optional[int] = None,
+        engine: str = "compiled",
+        score_only: bool = False,
+        max_memory: Optional[int] = None
+) -> Union[Alignment, ScoreResult]:
+    # Smith-Waterman (compiled fill + traceback по указателям), linear или affine gaps;
+    # seq1/seq2 - строки или uint8-коды, engine, score_only и max_memory как в needleman_wunsch
+    if engine == "auto":
+        if bandwidth is None:
+            from aligner.dispatch import align
+            return align(seq1, seq2, True, match_score, mismatch_score, gap_penalty, gap_open, gap_extend,
+                         scoring_matrix, max_memory, score_only)
+        engine = "compiled"
+    seq1, seq2, a, b, table = _prepare_sequences(seq1, seq2, match_score, mismatch_score, scoring_matrix)
     n, m = len(seq1), len(seq2)
-    if n > 10000 or m > 10000:
-        raise ValueError("Последовательности слишком длинные для этой версии. Используйте оптимизированную.")
+    if score_only:
+        _, score, _, end_i, end_j = _fill_encoded(a, b, table, gap_penalty, gap_open, gap_extend, True,
+                                                  bandwidth, engine, traceback=False)
+        return ScoreResult(int(score), end_i, end_j, smith_waterman, seq1, seq2, match_score=match_score,
+                           mismatch_score=mismatch_score, gap_penalty=gap_penalty, scoring_matrix=scoring_matrix,
+                           bandwidth=bandwidth, gap_open=gap_open, gap_extend=gap_extend, engine=engine)
+    bits = AFFINE_BITS if gap_open is not None and gap_extend is not None else LINEAR_BITS
+    budget = MATRIX_MEMORY_BUDGET if max_memory is None else max_memory
+    if bandwidth is None and _pointer_bytes(n + 1, m + 1, bits) > budget:
+        # матрица указателей не влезает в бюджет - выравнивание в линейной памяти
+        from aligner.linear_space import linear_space_smith_waterman
+        return linear_space_smith_waterman(seq1, seq2, match_score, mismatch_score, gap_penalty, scoring_matrix,
+                                           gap_open, gap_extend, engine)
 
-    dp = np.zeros((n + 1, m + 1), dtype=np.float64)
-    pair_score_func = lambda c1, c2: _get_pair_score(c1, c2, match_score, mismatch_score, scoring_matrix)
-    max_score = 0.0
-    max_i, max_j = 0, 0
-    for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            pair = pair_score_func(seq1[i - 1], seq2[j - 1])
-            dp[i][j] = max(
-                0.0,
-                dp[i - 1][j - 1] + pair,
-                dp[i - 1][j] + gap_penalty,
-                dp[i][j - 1] + gap_penalty
-            )
-            if dp[i][j] > max_score:
-                max_score = dp[i][j]
-                max_i, max_j = i, j
-
-    stop_condition = lambda i, j, dp: i == 0 or j == 0 or dp[i][j] == 0
-    align1, align2 = _backtrace_linear(dp, seq1, seq2, max_i, max_j, gap_penalty, pair_score_func, stop_condition, bandwidth)
-    min_len = min(len(align1), len(align2))
-    start = 0
-    while start < min_len and (align1[start] == '-' or align2[start] == '-'):
-        start += 1
-    end = min_len
-    while end > start and (align1[end-1] == '-' or align2[end-1] == '-'):
-        end -= 1
-    align1 = align1[start:end]
-    align2 = align2[start:end]
-    return align1, align2, int(max_score)
+    # локальное выравнивание по указателям не может начинаться или заканчиваться gap'ом
+    ops, max_score, start_i, start_j = _align_encoded(a, b, table, gap_penalty, gap_open, gap_extend, True,
+                                                      bandwidth, engine)
+    return Alignment.from_ops(seq1, seq2, ops, max_score, start_i, start_j)
 
 
 def hirschberg_needleman_wunsch(
-        seq1: str,
-        seq2: str,
+        seq1: SeqLike,
+        seq2: SeqLike,
         match_score: int = 1,
         mismatch_score: int = -1,
         gap_penalty: int = -2,
-        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None
-) -> Tuple[str, str, int]:
-
-    seq1 = seq1.upper()
-    seq2 = seq2.upper()
-    n, m = len(seq1), len(seq2)
-
-    if n == 0:
-        return '-' * m, seq2, gap_penalty * m
-    if m == 0:
-        return seq1, '-' * n, gap_penalty * n
-    if n == 1 or m == 1:
-        return needleman_wunsch(seq1, seq2, match_score, mismatch_score, gap_penalty, None, None, scoring_matrix)
-
-    mid = n // 2
-    score_left = _compute_nw_row_vectorized(seq1[:mid], seq2, match_score, mismatch_score, gap_penalty)
-    score_right = _compute_nw_row_vectorized(seq1[mid:][::-1], seq2[::-1], match_score, mismatch_score, gap_penalty)[::-1]
-
-    split = np.argmax(score_left + score_right)
-
-    align1_left, align2_left, _ = hirschberg_needleman_wunsch(seq1[:mid], seq2[:split], match_score, mismatch_score, gap_penalty, scoring_matrix)
-    align1_right, align2_right, _ = hirschberg_needleman_wunsch(seq1[mid:], seq2[split:], match_score, mismatch_score, gap_penalty, scoring_matrix)
-
-    full_align1 = align1_left + align1_right
-    full_align2 = align2_left + align2_right
-    full_score = score_left[split] + score_right[split]
-
-    return full_align1, full_align2, int(full_score)
\ No newline at end of file
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
+        threads: int = 1
+) -> Alignment:
+    # NW с linear gaps в линейной памяти; реализация (compiled, итеративная) - в aligner.linear_space
+    from aligner.linear_space import hirschberg_needleman_wunsch as hirschberg
+    return hirschberg(seq1, seq2, match_score, mismatch_score, gap_penalty, scoring_matrix, threads)
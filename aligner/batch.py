@@ -0,0 +1,238 @@
+import os
+import numpy as np
+import numba
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+from aligner.algorithms import ScoreResult, needleman_wunsch, smith_waterman
+from aligner.scoring import ALPHABET_SIZE, SeqLike, decode_sequence, encode_sequence, score_table
+
+# Межзадачная векторизация (inter-sequence, Rognes 2011): много коротких пар считаются одновременно.
+# Пары сортируются по длине и режутся на пачки; коды пачки лежат в массивах (длина, пачка), строки DP - в
+# (m + 1, пачка), и каждая ячейка (i, j) обновляется сразу для всех пар пачки - внутренний цикл по пачке
+# без зависимостей и ветвлений, его векторизует LLVM. Короткие пары добиваются кодом PAD, у которого score
+# с любой буквой ниже любого реального пути: ячейки вне пары не влияют ни на score, ни на конец выравнивания.
+# Пары больше BATCH_MAX_CELLS ячеек (выбросы по длине) считаются по одной обычным движком (engine="auto").
+
+MODES = ("global", "local")
+# пар в одной пачке: ширина внутреннего цикла
+BATCH_SIZE = 256
+# больше ячеек на пару - добивка до общей длины пачки дороже выигрыша, такие пары идут по одной
+BATCH_MAX_CELLS = 1 << 18
+PAD = ALPHABET_SIZE
+# (минус бесконечность, предел |score|) для типов строк пачки, как _SCORE_LIMITS в algorithms
+_LIMITS = {np.int16: (-(1 << 14), 1 << 13), np.int32: (-(1 << 30), 1 << 29)}
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _batch_linear(a: np.ndarray, b: np.ndarray, len_a: np.ndarray, len_b: np.ndarray, table: np.ndarray,
+                  gap_penalty: int, local: bool, rows: np.ndarray, scores: np.ndarray, ends_i: np.ndarray,
+                  ends_j: np.ndarray):
+    # NW/SW с linear gaps для пачки: a - (n, пачка), b - (m, пачка); score и конец пары k - в scores[k], ends
+    n, batch = a.shape
+    m = b.shape[0]
+    prev, curr = rows[0], rows[1]
+    for j in range(m + 1):
+        for k in range(batch):
+            prev[j, k] = 0 if local else j * gap_penalty
+    for k in range(batch):
+        scores[k] = 0
+        ends_i[k] = 0
+        ends_j[k] = 0
+        if not local and len_a[k] == 0:
+            scores[k] = prev[len_b[k], k]
+            ends_j[k] = len_b[k]
+    for i in range(1, n + 1):
+        for k in range(batch):
+            curr[0, k] = 0 if local else i * gap_penalty
+        row = a[i - 1]
+        for j in range(1, m + 1):
+            col = b[j - 1]
+            for k in range(batch):
+                # порядок как в _fill_linear: при равенстве diag, up, left - на score это не влияет
+                score = prev[j - 1, k] + table[row[k], col[k]]
+                up = prev[j, k] + gap_penalty
+                left = curr[j - 1, k] + gap_penalty
+                if up > score:
+                    score = up
+                if left > score:
+                    score = left
+                if local:
+                    if score < 0:
+                        score = 0
+                    # первый максимум в порядке строк - тот же конец, что у smith_waterman
+                    if score > scores[k]:
+                        scores[k] = score
+                        ends_i[k] = i
+                        ends_j[k] = j
+                curr[j, k] = score
+        if not local:
+            for k in range(batch):
+                if len_a[k] == i:
+                    scores[k] = curr[len_b[k], k]
+                    ends_i[k] = i
+                    ends_j[k] = len_b[k]
+        prev, curr = curr, prev
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _batch_affine(a: np.ndarray, b: np.ndarray, len_a: np.ndarray, len_b: np.ndarray, table: np.ndarray,
+                  gap_open: int, gap_extend: int, local: bool, neg_inf: int, rows: np.ndarray, scores: np.ndarray,
+                  ends_i: np.ndarray, ends_j: np.ndarray):
+    # Gotoh (M, Ix, Iy) для пачки, модель и концы - как в _fill_affine; rows - шесть строк (m + 1, пачка)
+    n, batch = a.shape
+    m = b.shape[0]
+    M_prev, X_prev, Y_prev, M_curr, X_curr, Y_curr = rows[0], rows[1], rows[2], rows[3], rows[4], rows[5]
+    rows[:] = neg_inf
+    for j in range(m + 1):
+        for k in range(batch):
+            if local or j == 0:
+                M_prev[j, k] = 0
+            else:
+                Y_prev[j, k] = gap_open + (j - 1) * gap_extend
+                M_prev[j, k] = Y_prev[j, k]
+    for k in range(batch):
+        scores[k] = 0
+        ends_i[k] = 0
+        ends_j[k] = 0
+        if not local and len_a[k] == 0:
+            scores[k] = M_prev[len_b[k], k]
+            ends_j[k] = len_b[k]
+    for i in range(1, n + 1):
+        for k in range(batch):
+            if local:
+                M_curr[0, k] = 0
+                X_curr[0, k] = neg_inf
+            else:
+                X_curr[0, k] = gap_open + (i - 1) * gap_extend
+                M_curr[0, k] = X_curr[0, k]
+            Y_curr[0, k] = neg_inf
+        row = a[i - 1]
+        for j in range(1, m + 1):
+            col = b[j - 1]
+            for k in range(batch):
+                best = M_prev[j - 1, k]
+                if X_prev[j - 1, k] > best:
+                    best = X_prev[j - 1, k]
+                if Y_prev[j - 1, k] > best:
+                    best = Y_prev[j - 1, k]
+                if local and best < 0:
+                    best = 0
+                match = best + table[row[k], col[k]]
+                if local and match > scores[k]:
+                    scores[k] = match
+                    ends_i[k] = i
+                    ends_j[k] = j
+                M_curr[j, k] = max(match, neg_inf)
+                x_open = M_prev[j, k] + gap_open
+                x_ext = X_prev[j, k] + gap_extend
+                X_curr[j, k] = max(max(x_open, x_ext), neg_inf)
+                y_open = M_curr[j - 1, k] + gap_open
+                y_ext = Y_curr[j - 1, k] + gap_extend
+                Y_curr[j, k] = max(max(y_open, y_ext), neg_inf)
+        if not local:
+            for k in range(batch):
+                if len_a[k] == i:
+                    end = len_b[k]
+                    scores[k] = max(M_curr[end, k], max(X_curr[end, k], Y_curr[end, k]))
+                    ends_i[k] = i
+                    ends_j[k] = end
+        M_prev, M_curr = M_curr, M_prev
+        X_prev, X_curr = X_curr, X_prev
+        Y_prev, Y_curr = Y_curr, Y_prev
+
+
+def _stack(codes: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    # (длина, пачка) кодов с добивкой PAD и длины пар
+    lengths = np.array([len(c) for c in codes], dtype=np.int64)
+    stacked = np.full((int(lengths.max()), len(codes)), PAD, dtype=np.uint8)
+    for k, c in enumerate(codes):
+        stacked[:len(c), k] = c
+    return stacked, lengths
+
+
+def _align_chunk(chunk: List[Tuple[np.ndarray, np.ndarray]], table: np.ndarray, gap_penalty: int,
+                 gap_open: Optional[int], gap_extend: Optional[int], local: bool, dtype) -> Tuple[np.ndarray, ...]:
+    a, len_a = _stack([pair[0] for pair in chunk])
+    b, len_b = _stack([pair[1] for pair in chunk])
+    batch = len(chunk)
+    scores = np.zeros(batch, dtype=np.int64)
+    ends_i = np.zeros(batch, dtype=np.int64)
+    ends_j = np.zeros(batch, dtype=np.int64)
+    neg_inf, _ = _LIMITS[dtype]
+    table = table.astype(dtype)
+    if gap_open is not None and gap_extend is not None:
+        rows = np.empty((6, b.shape[0] + 1, batch), dtype=dtype)
+        _batch_affine(a, b, len_a, len_b, table, gap_open, gap_extend, local, neg_inf, rows, scores, ends_i, ends_j)
+    else:
+        rows = np.empty((2, b.shape[0] + 1, batch), dtype=dtype)
+        _batch_linear(a, b, len_a, len_b, table, gap_penalty, local, rows, scores, ends_i, ends_j)
+    return scores, ends_i, ends_j
+
+
+def align_batch(
+        pairs: Sequence[Tuple[SeqLike, SeqLike]],
+        mode: str = "global",
+        match_score: int = 1,
+        mismatch_score: int = -1,
+        gap_penalty: int = -2,
+        gap_open: Optional[int] = None,
+        gap_extend: Optional[int] = None,
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
+        num_workers: Optional[int] = None
+) -> List[ScoreResult]:
+    # score (и конец для local) каждой пары (seq1, seq2) в порядке pairs; traceback - по запросу, как у score_only.
+    # Результат совпадает с needleman_wunsch / smith_waterman(..., score_only=True)
+    if mode not in MODES:
+        raise ValueError(f"Неизвестный режим '{mode}'. Доступны: {', '.join(MODES)}")
+    local = mode == "local"
+    align_fn = smith_waterman if local else needleman_wunsch
+    scoring = dict(match_score=match_score, mismatch_score=mismatch_score, gap_penalty=gap_penalty,
+                   gap_open=gap_open, gap_extend=gap_extend, scoring_matrix=scoring_matrix)
+    affine = gap_open is not None and gap_extend is not None
+
+    base = score_table(match_score, mismatch_score, scoring_matrix)
+    max_step = max(int(np.abs(base).max()), abs(gap_penalty) if not affine else max(abs(gap_open), abs(gap_extend)))
+    table = np.empty((ALPHABET_SIZE + 1, ALPHABET_SIZE + 1), dtype=np.int64)
+    table[:ALPHABET_SIZE, :ALPHABET_SIZE] = base
+
+    encoded = [(encode_sequence(s1), encode_sequence(s2)) for s1, s2 in pairs]
+    results: List[Optional[ScoreResult]] = [None] * len(encoded)
+    outliers = []
+    batched = []
+    for k, (a, b) in enumerate(encoded):
+        # score по модулю не больше max_step на строку и столбец - пачка берет самый узкий тип, где это влезает
+        if len(a) * len(b) > BATCH_MAX_CELLS or max_step * (len(a) + len(b) + 2) >= _LIMITS[np.int32][1]:
+            outliers.append(k)
+        else:
+            batched.append(k)
+    batched.sort(key=lambda k: max(len(encoded[k][0]), len(encoded[k][1])))
+    chunks = [batched[start:start + BATCH_SIZE] for start in range(0, len(batched), BATCH_SIZE)]
+
+    def run_chunk(indices: List[int]):
+        bound = max_step * max(len(encoded[k][0]) + len(encoded[k][1]) + 2 for k in indices)
+        dtype = np.int16 if bound < _LIMITS[np.int16][1] else np.int32
+        # PAD дороже любого пути внутри пары, но без переполнения типа
+        pad_table = table.copy()
+        pad_table[PAD, :] = pad_table[:, PAD] = -_LIMITS[dtype][1]
+        scores, ends_i, ends_j = _align_chunk([encoded[k] for k in indices], pad_table, gap_penalty, gap_open,
+                                              gap_extend, local, dtype)
+        for k, score, end_i, end_j in zip(indices, scores, ends_i, ends_j):
+            seq1, seq2 = pairs[k]
+            results[k] = ScoreResult(int(score), int(end_i), int(end_j), align_fn, decode_sequence(seq1),
+                                     decode_sequence(seq2), **scoring)
+
+    def run_outlier(k: int):
+        seq1, seq2 = pairs[k]
+        results[k] = align_fn(seq1, seq2, engine="auto", score_only=True, **scoring)
+
+    # потоки, а не numba parallel - как в striped.search; ядра пачек отпускают GIL
+    jobs = [(run_chunk, chunk) for chunk in chunks] + [(run_outlier, k) for k in outliers]
+    workers = min(num_workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        for fn, arg in jobs:
+            fn(arg)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(fn, arg) for fn, arg in jobs]:
+                future.result()
+    return results
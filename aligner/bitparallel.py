@@ -0,0 +1,148 @@
+import numpy as np
+import numba
+from typing import Tuple
+from aligner.algorithms import OP_MATCH, OP_DEL, OP_INS
+from aligner.scoring import ALPHABET_SIZE, UNKNOWN_CODE, SeqLike, encode_sequence
+
+# Bit-parallel edit distance (Myers, 1999; блочный вариант Hyyrö): столбец DP по seq1 хранится как два битовых
+# вектора вертикальных разностей - Pv (+1) и Mv (-1), по 64 ячейки в слове uint64, длинный seq1 - несколько слов.
+# Столбец пересчитывается за O(len(seq1) / 64) операций над словами, перенос между словами - горизонтальная
+# разность на границе блока (hin/hout). Модель - unit cost (Levenshtein): совпадение 0, замена и gap - 1.
+# Для traceback векторы каждого столбца сохраняются (2 бита на ячейку), значение D[i][j] восстанавливается
+# popcount'ом префикса столбца.
+
+WORD = 64
+
+
+def build_peq(seq: SeqLike) -> np.ndarray:
+    # битовые маски позиций seq для каждой буквы алфавита: peq[c, w] - биты слова w, где seq[i] == c
+    codes = encode_sequence(seq)
+    words = max(1, (len(codes) + WORD - 1) // WORD)
+    bits = np.zeros((ALPHABET_SIZE, words * WORD), dtype=bool)
+    bits[codes, np.arange(len(codes))] = True
+    # неизвестный символ не совпадает ни с чем, как в score_table
+    bits[UNKNOWN_CODE] = False
+    return np.packbits(bits.reshape(ALPHABET_SIZE, words, WORD), axis=2, bitorder='little').view(np.uint64)[:, :, 0]
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _myers_columns(peq: np.ndarray, b: np.ndarray, n: int, traceback: bool) -> Tuple[int, np.ndarray, np.ndarray]:
+    # глобальная edit distance seq1 (n символов, маски peq) против b; при traceback - Pv/Mv всех столбцов
+    words = peq.shape[1]
+    one, zero = np.uint64(1), np.uint64(0)
+    high = one << np.uint64(WORD - 1)
+    last_bit = one << np.uint64((n - 1) % WORD)
+    Pv = np.full(words, ~zero, dtype=np.uint64)
+    Mv = np.zeros(words, dtype=np.uint64)
+    m = len(b)
+    P_cols = np.empty((m + 1 if traceback else 1, words), dtype=np.uint64)
+    M_cols = np.empty((m + 1 if traceback else 1, words), dtype=np.uint64)
+    P_cols[0] = Pv
+    M_cols[0] = Mv
+    score = n
+    for j in range(m):
+        eq_col = peq[b[j]]
+        # строка 0 глобальной матрицы растет на 1 с каждым столбцом
+        hin = 1
+        for w in range(words):
+            pv, mv, eq = Pv[w], Mv[w], eq_col[w]
+            xv = eq | mv
+            if hin < 0:
+                eq |= one
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | ~(xh | pv)
+            mh = pv & xh
+            if w == words - 1:
+                if ph & last_bit:
+                    score += 1
+                elif mh & last_bit:
+                    score -= 1
+            hout = 0
+            if ph & high:
+                hout = 1
+            elif mh & high:
+                hout = -1
+            ph <<= one
+            mh <<= one
+            if hin < 0:
+                mh |= one
+            elif hin > 0:
+                ph |= one
+            Pv[w] = mh | ~(xv | ph)
+            Mv[w] = ph & xv
+            hin = hout
+        if traceback:
+            P_cols[j + 1] = Pv
+            M_cols[j + 1] = Mv
+    return score, P_cols, M_cols
+
+
+@numba.jit(nopython=True, cache=True)
+def _popcount(x: np.uint64) -> int:
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return int((x * np.uint64(0x0101010101010101)) >> np.uint64(56))
+
+
+@numba.jit(nopython=True, cache=True)
+def _cell(P_cols: np.ndarray, M_cols: np.ndarray, i: int, j: int) -> int:
+    # D[i][j] = D[0][j] + сумма вертикальных разностей строк 1..i столбца j
+    value = j
+    full, rest = i // WORD, i % WORD
+    for w in range(full):
+        value += _popcount(P_cols[j, w]) - _popcount(M_cols[j, w])
+    if rest:
+        mask = (np.uint64(1) << np.uint64(rest)) - np.uint64(1)
+        value += _popcount(P_cols[j, full] & mask) - _popcount(M_cols[j, full] & mask)
+    return value
+
+
+@numba.jit(nopython=True, cache=True)
+def _myers_traceback(P_cols: np.ndarray, M_cols: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # путь от (n, m) к (0, 0); при равенстве, как в _traceback_linear: диагональ, затем вверх, затем влево
+    i, j = len(a), len(b)
+    current = _cell(P_cols, M_cols, i, j)
+    ops = np.empty(i + j, dtype=np.uint8)
+    length = 0
+    while i > 0 or j > 0:
+        if i > 0 and j > 0:
+            diag = _cell(P_cols, M_cols, i - 1, j - 1)
+            if diag + (1 if a[i - 1] != b[j - 1] or a[i - 1] == UNKNOWN_CODE else 0) == current:
+                ops[length] = OP_MATCH
+                i -= 1
+                j -= 1
+                current = diag
+                length += 1
+                continue
+        if i > 0:
+            up = _cell(P_cols, M_cols, i - 1, j)
+            if up + 1 == current:
+                ops[length] = OP_DEL
+                i -= 1
+                current = up
+                length += 1
+                continue
+        ops[length] = OP_INS
+        j -= 1
+        current -= 1
+        length += 1
+    return ops[:length][::-1].copy()
+
+
+def edit_distance(seq1: SeqLike, seq2: SeqLike) -> int:
+    # Levenshtein-расстояние без traceback: O(len(seq1) / 64 * len(seq2)) операций, O(len(seq1) / 64) памяти
+    a, b = encode_sequence(seq1), encode_sequence(seq2)
+    if len(a) == 0:
+        return len(b)
+    distance, _, _ = _myers_columns(build_peq(a), b, len(a), False)
+    return int(distance)
+
+
+def edit_alignment(seq1: SeqLike, seq2: SeqLike) -> Tuple[np.ndarray, int]:
+    # (операции оптимального выравнивания, edit distance); хранит 2 бита на ячейку матрицы
+    a, b = encode_sequence(seq1), encode_sequence(seq2)
+    if len(a) == 0:
+        return np.full(len(b), OP_INS, dtype=np.uint8), len(b)
+    distance, P_cols, M_cols = _myers_columns(build_peq(a), b, len(a), True)
+    return _myers_traceback(P_cols, M_cols, a, b), int(distance)
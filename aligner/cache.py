@@ -0,0 +1,152 @@
+import hashlib
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from aligner.scoring import SeqLike, decode_sequence
+
+# Кэш результатов парного выравнивания: ключ - sha256 от хэшей обеих последовательностей, режима и всех
+# параметров score (у scoring_matrix - имя biopython-матрицы или хэш ее содержимого), значение - (score, end_i,
+# end_j), как у ScoreResult. Перед диском стоит LRU в памяти; на диске - SQLite, записи пишутся пачками,
+# время последнего обращения (для вытеснения) обновляется там же. Когда занятое место в файле превышает
+# max_bytes, удаляется четверть самых давно использованных записей - свободные страницы SQLite переиспользует.
+
+DEFAULT_CACHE_BYTES = 256 << 20
+# записей в LRU в памяти
+MEMORY_ENTRIES = 1 << 16
+# сколько новых записей копится до записи на диск
+_FLUSH_EVERY = 1024
+
+Value = Tuple[int, int, int]
+
+
+def _matrix_id(scoring_matrix: Optional[Dict[Tuple[str, str], int]]) -> str:
+    if scoring_matrix is None:
+        return "none"
+    name = getattr(scoring_matrix, "name", None)
+    if name is not None:
+        return name
+    items = repr(sorted(scoring_matrix.items())).encode()
+    return "sha1:" + hashlib.sha1(items).hexdigest()
+
+
+def sequence_hash(seq: SeqLike) -> str:
+    # хэш содержимого: регистр и представление (строка или коды) не важны
+    return hashlib.sha1(decode_sequence(seq).encode("ascii", "replace")).hexdigest()
+
+
+class ResultCache:
+    # path=None - только LRU в памяти; hits / misses - счетчики get
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = DEFAULT_CACHE_BYTES,
+                 memory_entries: int = MEMORY_ENTRIES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Value]" = OrderedDict()
+        self._pending: Dict[str, Value] = {}
+        self._touched = set()
+        self._db = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path)
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, score INTEGER, "
+                             "end_i INTEGER, end_j INTEGER, used REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+
+    @staticmethod
+    def key(seq1: SeqLike, seq2: SeqLike, mode: str,
+            scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None, **params) -> str:
+        # params - все, от чего зависит результат (score, gap-модель, движок, band), в любом порядке
+        fields = [mode, sequence_hash(seq1), sequence_hash(seq2), _matrix_id(scoring_matrix)]
+        fields += [f"{name}={params[name]!r}" for name in sorted(params)]
+        return hashlib.sha256("|".join(fields).encode()).hexdigest()
+
+    def _remember(self, key: str, value: Value) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Value]:
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+        elif self._db is not None:
+            row = self._db.execute("SELECT score, end_i, end_j FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                value = (int(row[0]), int(row[1]), int(row[2]))
+                self._remember(key, value)
+                self._touched.add(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, score: int, end_i: int = 0, end_j: int = 0) -> None:
+        value = (int(score), int(end_i), int(end_j))
+        self._remember(key, value)
+        if self._db is not None:
+            self._pending[key] = value
+            if len(self._pending) >= _FLUSH_EVERY:
+                self.flush()
+
+    def flush(self) -> None:
+        # новые записи и время обращения к прочитанным - на диск, затем вытеснение по размеру
+        if self._db is None:
+            return
+        now = time.time()
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                                 [(key, *value, now) for key, value in self._pending.items()])
+            self._db.executemany("UPDATE results SET used = ? WHERE key = ?",
+                                 [(now, key) for key in self._touched - self._pending.keys()])
+        self._pending.clear()
+        self._touched.clear()
+        self._evict()
+
+    def _evict(self) -> None:
+        page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        while True:
+            pages = self._db.execute("PRAGMA page_count").fetchone()[0]
+            free = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+            count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if (pages - free) * page_size <= self.max_bytes or count == 0:
+                return
+            with self._db:
+                self._db.execute("DELETE FROM results WHERE key IN "
+                                 "(SELECT key FROM results ORDER BY used LIMIT ?)", (max(count // 4, 1),))
+
+    def __len__(self) -> int:
+        if self._db is None:
+            return len(self._memory)
+        self.flush()
+        return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self) -> None:
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def __enter__(self) -> "ResultCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def lookup_many(cache: Optional[ResultCache], keys: Iterable[str]) -> Dict[int, Value]:
+    # {номер ключа: значение} найденных в кэше; без кэша - пусто
+    if cache is None:
+        return {}
+    found = {}
+    for k, key in enumerate(keys):
+        value = cache.get(key)
+        if value is not None:
+            found[k] = value
+    return found
@@ -2,6 +2,7 @@ import os
 import sys
 import time
 import logging
+import re
 from typing import List, Optional, Dict
 
 try:
@@ -16,13 +17,21 @@ from rich.panel import Panel
 from rich.text import Text
 import inquirer
 import yaml
-from aligner.algorithms import needleman_wunsch, smith_waterman
+from aligner.algorithms import needleman_wunsch, smith_waterman, Alignment, ScoreResult, GLOBAL_ENGINES, LOCAL_ENGINES
+from aligner.batch import align_batch
+from aligner.cache import DEFAULT_CACHE_BYTES, ResultCache, lookup_many
+from aligner.genome import genome_align
+from aligner.index import MinimizerIndex
+from aligner.suffix_array import SuffixArrayIndex
 from aligner.io_utils import load_sequences, format_alignment, format_msa
-from aligner.msa import multiple_sequence_alignment
+from aligner.msa import DISTANCES, EMBED_THRESHOLD, TREE_METHODS, multiple_sequence_alignment
+from aligner.optimizers import heuristic_local_align
 from aligner.scoring import load_scoring_matrix
 
 # зависимости: pip install click rich inquirer pyyaml biopython numpy numba psutil
 console = Console()
+# --genome: в таблице только начало выравнивания (полное - мегабазы строк)
+GENOME_PREVIEW_COLUMNS = 600
 
 # ascii-арт с цветами
 ASCII_ART = Text("""
@@ -104,11 +113,45 @@ TRANSLATIONS = {
         'gap_extend': "Gap extend penalty (affine, default None): Penalty for extending a gap.",
         'subsample': "Subsample first N bases (0 for full): For large files to speed up testing.",
         'threads': "Number of threads for MSA (default cpu_count):",
+        'engine': "DP engine: auto (default, picked by lengths, divergence and --max-memory), compiled (Numba JIT) or "
+                  "diagonal (pure NumPy anti-diagonal sweep, no JIT warm-up); "
+                  "global also: bitparallel (edit distance, 64 cells per machine word; "
+                  "needs match = 2 * (mismatch - gap), e.g. --match 0 --mismatch -1 --gap -1), "
+                  "wfa / wfa-lowmem (wavefront alignment, time grows with the alignment score).",
+        'max_memory': "Memory budget for --engine auto, e.g. 512M or 2G (default 128M): larger inputs go to "
+                      "banded, wavefront or linear-space engines.",
+        'bandwidth': "Band width N for banded DP, or 'auto' to widen the band until the result is provably optimal.",
+        'heuristic': "Seed-and-extend (k-mer seeds, X-drop extension): fast for long sequences, may miss the optimum.",
         'clustal': "Output MSA in Clustal format? (y/n)",
+        'guide_tree': "Guide tree method: upgma (average linkage) or nj (neighbour-joining).",
+        'newick': "Also write the guide tree in Newick format to this file (leaves Seq1..SeqN in input order).",
+        'embed_above': "Above this many sequences the guide tree is built from k-mer embeddings and clustering (mBed) "
+                       "instead of the full distance matrix (default 100, at most 100).",
+        'distance': "Guide tree distance: align (score of a full global alignment per pair), edit (edit distance) or "
+                    "kmer (shared k-mers, no alignment; milliseconds for hundreds of sequences).",
         'verbose': "Enable verbose logging for detailed steps? (y/n)",
         'preview_seq': "Preview first 100 bases of sequences? (y/n)",
         'tutorial': "Run tutorial with example alignments? (y/n)",
         'batch_mode': "Run batch alignment for all FASTA files in directory? (y/n)",
+        'top': "Batch mode: scores for all pairs, full alignment only for the N best (0 for all).",
+        'query': "FASTA file with query sequences.",
+        'reference': "FASTA file with reference sequences to search.",
+        'index': "Minimizer index directory: loaded if present, otherwise built from --reference and saved there.",
+        'search_top': "Search: candidate targets per query (most shared minimizers); DP runs only on them.",
+        'error_search': "Search requires --query and --reference FASTA files.",
+        'error_index': "Index does not match the reference file (different number of sequences).",
+        'cache': "SQLite file of the pairwise result cache (batch mode and MSA distances): pairs already in it are not "
+                 "recomputed.",
+        'cache_size': "Cache size limit on disk, e.g. 256M (default 256M): least recently used results are evicted.",
+        'cache_stats': "Cache",
+        'hits': "hits",
+        'misses': "misses",
+        'genome': "Whole-genome mode: minimizer anchors, colinear chaining, gaps between anchors aligned in parallel "
+                  "(megabase inputs without --subsample; the table shows the first columns only).",
+        'seed_index': "With --heuristic: suffix array directory of input2 for SMEM seeds; loaded if present, otherwise built and saved there.",
+        'error_seed_index': "Seed index does not match input2.",
+        'no_candidates': "no candidates",
+        'shared_seeds': "shared minimizers",
         'config': "Load configuration from YAML file (path):",
         'processing': "Processing alignment...",
         'success': "Alignment completed successfully!",
@@ -123,6 +166,8 @@ TRANSLATIONS = {
         'sec': "sec",
         'mb': "MB",
         'identity': "Identity %",
+        'engine_used': "Engine",
+        'cells': "cells",
         'gaps': "Gaps count",
         'config_load': "Load config from YAML file? (enter path or 'n' for none):",
         'config_save': "Save current parameters to YAML file? (y/n)",
@@ -146,11 +191,45 @@ TRANSLATIONS = {
         'gap_extend': "Штраф за расширение gap (affine, default None): Штраф за продолжение пробела.",
         'subsample': "Subsample первых N баз (0 для полного): Для больших файлов для ускорения тестирования.",
         'threads': "Количество потоков для MSA (default cpu_count):",
+        'engine': "DP-движок: auto (по умолчанию, выбор по длинам, расхождению и --max-memory), compiled (Numba JIT) "
+                  "или diagonal (чистый NumPy по антидиагоналям, без JIT warm-up); "
+                  "для global еще bitparallel (edit distance, 64 ячейки в машинном слове; "
+                  "нужно match = 2 * (mismatch - gap), например --match 0 --mismatch -1 --gap -1), "
+                  "wfa / wfa-lowmem (wavefront alignment, время растет со score выравнивания).",
+        'max_memory': "Бюджет памяти для --engine auto, например 512M или 2G (default 128M): большие входы уходят в "
+                      "banded, wavefront или linear-space движки.",
+        'bandwidth': "Ширина band N для banded DP или 'auto': band расширяется, пока результат не станет доказуемо оптимальным.",
+        'heuristic': "Seed-and-extend (затравки k-меров, X-drop продление): быстро для длинных последовательностей, может пропустить оптимум.",
         'clustal': "Вывести MSA в формате Clustal? (y/n)",
+        'guide_tree': "Метод guide tree: upgma (среднее связывание) или nj (neighbour-joining).",
+        'newick': "Дополнительно записать guide tree в формате Newick в этот файл (листья Seq1..SeqN по порядку входа).",
+        'embed_above': "Выше этого числа последовательностей guide tree строится по k-мерным векторам и кластеризации "
+                       "(mBed), а не по полной матрице дистанций (default 100, не больше 100).",
+        'distance': "Дистанция для guide tree: align (score глобального выравнивания каждой пары), edit (edit distance) "
+                    "или kmer (общие k-меры, без выравнивания; миллисекунды на сотни последовательностей).",
         'verbose': "Включить детальный logging для подробных шагов? (y/n)",
         'preview_seq': "Предпросмотр первых 100 баз последовательностей? (y/n)",
         'tutorial': "Запустить tutorial с примерами выравниваний? (y/n)",
         'batch_mode': "Запустить batch-выравнивание для всех FASTA в директории? (y/n)",
+        'top': "Batch-режим: score для всех пар, полное выравнивание только для N лучших (0 для всех).",
+        'query': "FASTA с query-последовательностями.",
+        'reference': "FASTA с reference-последовательностями для поиска.",
+        'index': "Директория индекса минимизаторов: читается, если есть, иначе строится по --reference и сохраняется туда.",
+        'search_top': "Поиск: кандидатов на query (больше всего общих минимизаторов); DP считается только для них.",
+        'error_search': "Для поиска нужны FASTA-файлы --query и --reference.",
+        'error_index': "Индекс не соответствует reference-файлу (другое число последовательностей).",
+        'cache': "SQLite-файл кэша парных результатов (batch-режим и дистанции MSA): пары, которые в нем есть, не "
+                 "пересчитываются.",
+        'cache_size': "Предел размера кэша на диске, например 256M (default 256M): вытесняются давно не нужные результаты.",
+        'cache_stats': "Кэш",
+        'hits': "попаданий",
+        'misses': "промахов",
+        'genome': "Режим целых геномов: якоря-минимизаторы, colinear chaining, промежутки между якорями выравниваются "
+                  "параллельно (мегабазы без --subsample; в таблице - только первые столбцы).",
+        'seed_index': "С --heuristic: директория суффиксного массива input2 для затравок SMEM; читается, если есть, иначе строится и сохраняется туда.",
+        'error_seed_index': "Индекс затравок не соответствует input2.",
+        'no_candidates': "нет кандидатов",
+        'shared_seeds': "общих минимизаторов",
         'config': "Загрузить конфигурацию из YAML файла (путь):",
         'processing': "Обработка выравнивания...",
         'success': "Выравнивание успешно завершено!",
@@ -165,6 +244,8 @@ TRANSLATIONS = {
         'sec': "сек",
         'mb': "МБ",
         'identity': "Идентичность %",
+        'engine_used': "Движок",
+        'cells': "ячеек",
         'gaps': "Количество gaps",
         'config_load': "Загрузить конфигурацию из YAML? (введите путь или 'n' для пропуска):",
         'config_save': "Сохранить текущие параметры в YAML? (y/n)",
@@ -189,6 +270,37 @@ def validate_file(file_path: str, tr: Dict) -> bool:
     return True
 
 
+def parse_bandwidth(ctx, param, value):
+    # --bandwidth: целое >= 0 или 'auto'
+    if value is None or value == 'auto':
+        return value
+    try:
+        bandwidth = int(value)
+    except ValueError:
+        raise click.BadParameter("expected a non-negative integer or 'auto'")
+    if bandwidth < 0:
+        raise click.BadParameter("expected a non-negative integer or 'auto'")
+    return bandwidth
+
+
+def parse_memory(ctx, param, value):
+    # --max-memory: байты или число с суффиксом K/M/G
+    if value is None:
+        return value
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    text = value.strip().upper().rstrip('B')
+    try:
+        if text and text[-1] in units:
+            memory = int(float(text[:-1]) * units[text[-1]])
+        else:
+            memory = int(text)
+    except ValueError:
+        raise click.BadParameter("expected bytes or a size like 512M / 2G")
+    if memory <= 0:
+        raise click.BadParameter("expected bytes or a size like 512M / 2G")
+    return memory
+
+
 def validate_params(params: Dict, tr: Dict) -> bool:
     # проверяет, что штрафы отрицательные
     for param in ['gap', 'mismatch', 'gap_open', 'gap_extend']:
@@ -329,62 +441,163 @@ def save_config(params: Dict, path: str):
     console.print(f"{TRANSLATIONS[params['lang']]['config_saved'].format(path=path)}", style="green")
 
 
-def print_alignment_table(align1: str, align2: str, tr: Dict):
-    # таблица для pairwise выравнивания с цветами
+def _color_match_line(line: str) -> str:
+    # разметка rich для куска строки совпадений: серии '|' - зеленым, несовпадения - красным
+    return ''.join(f"[green]{run}[/green]" if run[0] == '|' else f"[red]{run}[/red]"
+                   for run in re.findall(r"\|+| +", line))
+
+
+def print_alignment_table(alignment: Alignment, tr: Dict, max_columns: Optional[int] = None):
+    # таблица для pairwise выравнивания с цветами; строка совпадений режется по 60 столбцов до разметки;
+    # max_columns - показать только начало выравнивания
     table = Table(title="Alignment")
     table.add_column("Seq1", style="cyan")
     table.add_column("Matches", style="magenta")
     table.add_column("Seq2", style="green")
-    match_line = ''.join(
-        ['[green]|[/green]' if a == b and a != '-' else '[red] [/red]' for a, b in zip(align1, align2)])
-    for i in range(0, len(align1), 60):
-        table.add_row(align1[i:i + 60], match_line[i:i + 60], align2[i:i + 60])
+    align1, align2 = alignment.aligned()
+    match_line = alignment.match_line()
+    for i in range(0, min(len(align1), max_columns or len(align1)), 60):
+        table.add_row(align1[i:i + 60], _color_match_line(match_line[i:i + 60]), align2[i:i + 60])
     console.print(table)
 
 
-def compute_stats(align1: str, align2: str) -> Dict:
-    # статистика: % идентичности, gaps
-    matches = sum(1 for a, b in zip(align1, align2) if a == b and a != '-')
-    length = len(align1)
-    gaps = align1.count('-') + align2.count('-')
-    identity = (matches / length * 100) if length > 0 else 0
-    return {'identity': identity, 'gaps': gaps}
+def compute_stats(alignment: Alignment) -> Dict:
+    # статистика: % идентичности, gaps - посчитана при сборке выравнивания
+    return {'identity': alignment.identity, 'gaps': alignment.gaps}
+
+
+def _engine_report(aligned, tr: Dict) -> str:
+    # строка о движке, выбранном --engine auto (план лежит в результате); пусто для явно заданного движка
+    plan = getattr(aligned, 'plan', None)
+    if plan is None:
+        return ""
+    return f"{tr['engine_used']}: {plan.engine} (~{plan.cells:,} {tr['cells']})\n"
 
 
-def run_batch_alignment(directory: str, params: Dict, tr: Dict) -> str:
-    # batch-режим: pairwise все-против-всех
+def run_batch_alignment(directory: str, params: Dict, tr: Dict, cache: Optional[ResultCache] = None) -> str:
+    # batch-режим: pairwise все-против-всех; score пар, уже лежащих в cache, не пересчитываются
     fasta_files = get_fasta_files(directory)
     if len(fasta_files) < 2:
         console.print(f"{tr['error']} {tr['error_pairwise']}", style="bold red")
         sys.exit(1)
 
     result = ""
+    pairs = []
     scoring_matrix = load_scoring_matrix(params['matrix']) if params['matrix'] else None
+    sequences = []
+    for file in fasta_files:
+        seq = load_sequences(os.path.join(directory, file))[0]
+        sequences.append(seq[:params['subsample']] if params['subsample'] > 0 else seq)
+    index_pairs = [(i, j) for i in range(len(fasta_files)) for j in range(i + 1, len(fasta_files))]
+    scoring = dict(match_score=params['match'], mismatch_score=params['mismatch'], gap_penalty=params['gap'],
+                   gap_open=params.get('gap_open'), gap_extend=params.get('gap_extend'), scoring_matrix=scoring_matrix)
+    engine = dict(engine=params.get('engine', 'auto'), max_memory=params.get('max_memory'))
+    if params['mode'] == 'global':
+        engine['bandwidth'] = params.get('bandwidth')
+    align_fn = needleman_wunsch if params['mode'] == 'global' else smith_waterman
+    # heuristic не кэшируется: его traceback по score и концу не восстановить
+    keys = [ResultCache.key(sequences[i], sequences[j], params['mode'], scoring_matrix, match=params['match'],
+                            mismatch=params['mismatch'], gap=params['gap'], gap_open=params.get('gap_open'),
+                            gap_extend=params.get('gap_extend'), engine=engine['engine'],
+                            bandwidth=params.get('bandwidth'))
+            for i, j in index_pairs] if cache is not None and not params.get('heuristic') else []
+    cached = lookup_many(cache, keys)
+    todo = [k for k in range(len(index_pairs)) if k not in cached]
+    # сначала только score (две строки DP), traceback - потом и только для лучших пар; с движком auto и без band
+    # все пары считаются пачками (align_batch), а не по одной
+    batched = not params.get('heuristic') and params.get('engine', 'auto') == 'auto' and not params.get('bandwidth')
     with Progress() as progress:
-        task = progress.add_task(tr['processing'], total=len(fasta_files) * (len(fasta_files) - 1) // 2)
-        for i, file1 in enumerate(fasta_files):
-            seq1 = load_sequences(os.path.join(directory, file1))[0]
-            if params['subsample'] > 0:
-                seq1 = seq1[:params['subsample']]
-            for j, file2 in enumerate(fasta_files[i + 1:], start=i + 1):
-                seq2 = load_sequences(os.path.join(directory, file2))[0]
-                if params['subsample'] > 0:
-                    seq2 = seq2[:params['subsample']]
-                console.print(f"\nProcessing: {file1} vs {file2}", style="bold blue")
-                if params['mode'] == 'global':
-                    align1, align2, score = needleman_wunsch(
-                        seq1, seq2, params['match'], params['mismatch'], params['gap'],
-                        params.get('gap_open'), params.get('gap_extend'), scoring_matrix
-                    )
-                else:
-                    align1, align2, score = smith_waterman(
-                        seq1, seq2, params['match'], params['mismatch'], params['gap'], scoring_matrix
-                    )
-                result += f"\nAlignment: {file1} vs {file2}\nScore: {score}\n"
-                print_alignment_table(align1, align2, tr)
-                stats = compute_stats(align1, align2)
-                result += f"{tr['identity']}: {stats['identity']:.2f}%\n{tr['gaps']}: {stats['gaps']}\n"
-                progress.update(task, advance=1)
+        task = progress.add_task(tr['processing'], total=len(index_pairs))
+        scored = {}
+        if batched and todo:
+            scored = dict(zip(todo, align_batch([(sequences[index_pairs[k][0]], sequences[index_pairs[k][1]])
+                                                 for k in todo], params['mode'], **scoring)))
+        for k, (i, j) in enumerate(index_pairs):
+            file1, file2 = fasta_files[i], fasta_files[j]
+            seq1, seq2 = sequences[i], sequences[j]
+            console.print(f"\nProcessing: {file1} vs {file2}", style="bold blue")
+            if k in cached:
+                score, end_i, end_j = cached[k]
+                aligned = ScoreResult(score, end_i, end_j, align_fn, seq1, seq2, **engine, **scoring)
+            elif batched:
+                aligned = scored[k]
+            elif params['mode'] == 'global':
+                aligned = needleman_wunsch(seq1, seq2, score_only=True, **engine, **scoring)
+            elif params.get('heuristic'):
+                aligned = heuristic_local_align(seq1, seq2, score_only=True, **scoring)
+            else:
+                aligned = smith_waterman(seq1, seq2, score_only=True, **engine, **scoring)
+            if keys and k not in cached:
+                cache.put(keys[k], aligned.score, aligned.end_i, aligned.end_j)
+            pairs.append((file1, file2, aligned))
+            progress.update(task, advance=1)
+
+    top = params.get('top', 10) or len(pairs)
+    best = set(sorted(range(len(pairs)), key=lambda k: -pairs[k][2].score)[:top])
+    for k, (file1, file2, aligned) in enumerate(pairs):
+        result += f"\nAlignment: {file1} vs {file2}\nScore: {aligned.score}\n" + _engine_report(aligned, tr)
+        if k in best:
+            alignment = aligned.traceback()
+            print_alignment_table(alignment, tr)
+            stats = compute_stats(alignment)
+            result += f"{tr['identity']}: {stats['identity']:.2f}%\n{tr['gaps']}: {stats['gaps']}\n"
+    return result
+
+
+def load_seed_index(params: Dict, seq2: str, tr: Dict) -> Optional[SuffixArrayIndex]:
+    # суффиксный массив seq2 для --heuristic: из --seed-index, иначе строится и сохраняется туда
+    path = params.get('seed_index')
+    if not path:
+        return None
+    if os.path.exists(os.path.join(path, "meta.json")):
+        index = SuffixArrayIndex.load(path)
+        if len(index) != 1 or len(index.text) != len(seq2) + 1:
+            console.print(f"{tr['error']} {tr['error_seed_index']}", style="bold red")
+            sys.exit(1)
+        return index
+    index = SuffixArrayIndex.build([seq2])
+    index.save(path)
+    return index
+
+
+def run_search(params: Dict, tr: Dict) -> str:
+    # поиск query по reference: кандидаты из индекса минимизаторов, DP (пачкой) только для top кандидатов
+    queries = load_sequences(params['query'])
+    references = load_sequences(params['reference'])
+    if params['subsample'] > 0:
+        queries = [seq[:params['subsample']] for seq in queries]
+    index_path = params.get('index')
+    if index_path and os.path.exists(os.path.join(index_path, "meta.json")):
+        index = MinimizerIndex.load(index_path)
+    else:
+        index = MinimizerIndex.from_fasta(params['reference'])
+        if index_path:
+            index.save(index_path)
+    if len(index) != len(references):
+        console.print(f"{tr['error']} {tr['error_index']}", style="bold red")
+        sys.exit(1)
+
+    scoring_matrix = load_scoring_matrix(params['matrix']) if params['matrix'] else None
+    candidates = [index.lookup(query, top=params.get('top', 5) or None) for query in queries]
+    pairs = [(queries[q], references[t]) for q, hits in enumerate(candidates) for t, _ in hits]
+    scored = iter(align_batch(pairs, params['search_mode'], params['match'], params['mismatch'], params['gap'],
+                              params.get('gap_open'), params.get('gap_extend'), scoring_matrix))
+
+    result = ""
+    for q, hits in enumerate(candidates):
+        result += f"\nQuery {q + 1}:\n"
+        if not hits:
+            result += f"  {tr['no_candidates']}\n"
+            continue
+        hits = [(t, shared, next(scored)) for t, shared in hits]
+        for t, shared, aligned in hits:
+            result += f"  Target {t + 1}: Score: {aligned.score} ({shared} {tr['shared_seeds']})\n"
+        # полное выравнивание - только для лучшего по score кандидата
+        t, _, aligned = max(hits, key=lambda hit: hit[2].score)
+        alignment = aligned.traceback()
+        print_alignment_table(alignment, tr)
+        stats = compute_stats(alignment)
+        result += f"  Best: Target {t + 1}, {tr['identity']}: {stats['identity']:.2f}%, {tr['gaps']}: {stats['gaps']}\n"
     return result
 
 
@@ -430,15 +643,24 @@ def cli(ctx, config):
 @click.option('--preview', is_flag=True, help=TRANSLATIONS['en']['preview_seq'])
 @click.option('--verbose', is_flag=True, help=TRANSLATIONS['en']['verbose'])
 @click.option('--batch', is_flag=True, help=TRANSLATIONS['en']['batch_mode'])
+@click.option('--top', type=int, default=10, help=TRANSLATIONS['en']['top'])
+@click.option('--engine', default='auto', type=click.Choice(GLOBAL_ENGINES), help=TRANSLATIONS['en']['engine'])
+@click.option('--bandwidth', default=None, callback=parse_bandwidth, help=TRANSLATIONS['en']['bandwidth'])
+@click.option('--max-memory', default=None, callback=parse_memory, help=TRANSLATIONS['en']['max_memory'])
+@click.option('--genome', is_flag=True, help=TRANSLATIONS['en']['genome'])
+@click.option('--cache', 'cache_path', default=None, help=TRANSLATIONS['en']['cache'])
+@click.option('--cache-size', default=None, callback=parse_memory, help=TRANSLATIONS['en']['cache_size'])
 @click.option('--lang', default='en', type=click.Choice(['en', 'ru']), help=TRANSLATIONS['en']['choose_lang'])
 def global_align(input1, input2, directory, output, match, mismatch, gap, gap_open, gap_extend, matrix, subsample,
-                 preview, verbose, batch, lang):
+                 preview, verbose, batch, top, engine, bandwidth, max_memory, genome, cache_path, cache_size, lang):
     # subcommand для global выравнивания (переименовано из 'global' во избежание конфликта с ключевым словом)
     tr = TRANSLATIONS[lang]
     params = {
         'mode': 'global', 'input1': input1, 'input2': input2, 'directory': directory, 'output': output,
         'match': match, 'mismatch': mismatch, 'gap': gap, 'gap_open': gap_open, 'gap_extend': gap_extend,
-        'matrix': matrix, 'subsample': subsample, 'preview': preview, 'verbose': verbose, 'batch': batch, 'lang': lang
+        'matrix': matrix, 'subsample': subsample, 'preview': preview, 'verbose': verbose, 'batch': batch,
+        'top': top, 'engine': engine, 'bandwidth': bandwidth, 'max_memory': max_memory, 'genome': genome,
+        'cache': cache_path, 'cache_size': cache_size, 'lang': lang
     }
     if batch and not directory:
         console.print(f"{tr['error']} Directory required for batch mode.", style="bold red")
@@ -459,19 +681,31 @@ def global_align(input1, input2, directory, output, match, mismatch, gap, gap_op
 @click.option('--match', type=int, default=1, help=TRANSLATIONS['en']['match_score'])
 @click.option('--mismatch', type=int, default=-1, help=TRANSLATIONS['en']['mismatch_score'])
 @click.option('--gap', type=int, default=-2, help=TRANSLATIONS['en']['gap_penalty'])
+@click.option('--gap_open', type=int, default=None, help=TRANSLATIONS['en']['gap_open'])
+@click.option('--gap_extend', type=int, default=None, help=TRANSLATIONS['en']['gap_extend'])
 @click.option('--matrix', default=None, help=TRANSLATIONS['en']['select_matrix'])
 @click.option('--subsample', type=int, default=0, help=TRANSLATIONS['en']['subsample'])
 @click.option('--preview', is_flag=True, help=TRANSLATIONS['en']['preview_seq'])
 @click.option('--verbose', is_flag=True, help=TRANSLATIONS['en']['verbose'])
 @click.option('--batch', is_flag=True, help=TRANSLATIONS['en']['batch_mode'])
+@click.option('--top', type=int, default=10, help=TRANSLATIONS['en']['top'])
+@click.option('--engine', default='auto', type=click.Choice(LOCAL_ENGINES), help=TRANSLATIONS['en']['engine'])
+@click.option('--heuristic', is_flag=True, help=TRANSLATIONS['en']['heuristic'])
+@click.option('--seed-index', default=None, help=TRANSLATIONS['en']['seed_index'])
+@click.option('--max-memory', default=None, callback=parse_memory, help=TRANSLATIONS['en']['max_memory'])
+@click.option('--cache', 'cache_path', default=None, help=TRANSLATIONS['en']['cache'])
+@click.option('--cache-size', default=None, callback=parse_memory, help=TRANSLATIONS['en']['cache_size'])
 @click.option('--lang', default='en', type=click.Choice(['en', 'ru']), help=TRANSLATIONS['en']['choose_lang'])
-def local(input1, input2, directory, output, match, mismatch, gap, matrix, subsample, preview, verbose, batch, lang):
+def local(input1, input2, directory, output, match, mismatch, gap, gap_open, gap_extend, matrix, subsample, preview,
+          verbose, batch, top, engine, heuristic, seed_index, max_memory, cache_path, cache_size, lang):
     # subcommand для local выравнивания
     tr = TRANSLATIONS[lang]
     params = {
         'mode': 'local', 'input1': input1, 'input2': input2, 'directory': directory, 'output': output,
-        'match': match, 'mismatch': mismatch, 'gap': gap, 'matrix': matrix, 'subsample': subsample,
-        'preview': preview, 'verbose': verbose, 'batch': batch, 'lang': lang
+        'match': match, 'mismatch': mismatch, 'gap': gap, 'gap_open': gap_open, 'gap_extend': gap_extend,
+        'matrix': matrix, 'subsample': subsample, 'preview': preview, 'verbose': verbose, 'batch': batch,
+        'top': top, 'engine': engine, 'heuristic': heuristic, 'seed_index': seed_index, 'max_memory': max_memory,
+        'cache': cache_path, 'cache_size': cache_size, 'lang': lang
     }
     if batch and not directory:
         console.print(f"{tr['error']} Directory required for batch mode.", style="bold red")
@@ -496,17 +730,27 @@ def local(input1, input2, directory, output, match, mismatch, gap, matrix, subsa
 @click.option('--subsample', type=int, default=0, help=TRANSLATIONS['en']['subsample'])
 @click.option('--threads', type=int, default=os.cpu_count(), help=TRANSLATIONS['en']['threads'])
 @click.option('--clustal', is_flag=True, help=TRANSLATIONS['en']['clustal'])
+@click.option('--distance', default='align', type=click.Choice(DISTANCES), help=TRANSLATIONS['en']['distance'])
+@click.option('--guide-tree', default='upgma', type=click.Choice(TREE_METHODS),
+              help=TRANSLATIONS['en']['guide_tree'])
+@click.option('--newick', default=None, help=TRANSLATIONS['en']['newick'])
+@click.option('--embed-above', type=click.IntRange(1, EMBED_THRESHOLD), default=EMBED_THRESHOLD,
+              help=TRANSLATIONS['en']['embed_above'])
 @click.option('--preview', is_flag=True, help=TRANSLATIONS['en']['preview_seq'])
 @click.option('--verbose', is_flag=True, help=TRANSLATIONS['en']['verbose'])
+@click.option('--cache', 'cache_path', default=None, help=TRANSLATIONS['en']['cache'])
+@click.option('--cache-size', default=None, callback=parse_memory, help=TRANSLATIONS['en']['cache_size'])
 @click.option('--lang', default='en', type=click.Choice(['en', 'ru']), help=TRANSLATIONS['en']['choose_lang'])
-def msa(input1, output, match, mismatch, gap, gap_open, gap_extend, matrix, subsample, threads, clustal, preview,
-        verbose, lang):
+def msa(input1, output, match, mismatch, gap, gap_open, gap_extend, matrix, subsample, threads, clustal, distance,
+        guide_tree, newick, embed_above, preview, verbose, cache_path, cache_size, lang):
     # subcommand для msa
     tr = TRANSLATIONS[lang]
     params = {
         'mode': 'msa', 'input1': input1, 'output': output, 'match': match, 'mismatch': mismatch, 'gap': gap,
         'gap_open': gap_open, 'gap_extend': gap_extend, 'matrix': matrix, 'subsample': subsample,
-        'threads': threads, 'clustal': clustal, 'preview': preview, 'verbose': verbose, 'lang': lang
+        'threads': threads, 'clustal': clustal, 'distance': distance, 'guide_tree': guide_tree, 'newick': newick,
+        'embed_above': embed_above, 'preview': preview, 'verbose': verbose, 'cache': cache_path,
+        'cache_size': cache_size, 'lang': lang
     }
     if not input1:
         console.print(f"{tr['error']} {tr['error_msa']}", style="bold red")
@@ -516,6 +760,41 @@ def msa(input1, output, match, mismatch, gap, gap_open, gap_extend, matrix, subs
     run_alignment(params, tr)
 
 
+@cli.command()
+@click.option('--query', type=str, help=TRANSLATIONS['en']['query'])
+@click.option('--reference', type=str, help=TRANSLATIONS['en']['reference'])
+@click.option('--index', 'index_path', type=str, default=None, help=TRANSLATIONS['en']['index'])
+@click.option('--output', default="alignment.txt", help="Output file")
+@click.option('--mode', 'search_mode', default='local', type=click.Choice(['global', 'local']),
+              help=TRANSLATIONS['en']['choose_mode'])
+@click.option('--match', type=int, default=1, help=TRANSLATIONS['en']['match_score'])
+@click.option('--mismatch', type=int, default=-1, help=TRANSLATIONS['en']['mismatch_score'])
+@click.option('--gap', type=int, default=-2, help=TRANSLATIONS['en']['gap_penalty'])
+@click.option('--gap_open', type=int, default=None, help=TRANSLATIONS['en']['gap_open'])
+@click.option('--gap_extend', type=int, default=None, help=TRANSLATIONS['en']['gap_extend'])
+@click.option('--matrix', default=None, help=TRANSLATIONS['en']['select_matrix'])
+@click.option('--subsample', type=int, default=0, help=TRANSLATIONS['en']['subsample'])
+@click.option('--top', type=int, default=5, help=TRANSLATIONS['en']['search_top'])
+@click.option('--verbose', is_flag=True, help=TRANSLATIONS['en']['verbose'])
+@click.option('--lang', default='en', type=click.Choice(['en', 'ru']), help=TRANSLATIONS['en']['choose_lang'])
+def search(query, reference, index_path, output, search_mode, match, mismatch, gap, gap_open, gap_extend, matrix,
+           subsample, top, verbose, lang):
+    # subcommand для поиска query по reference через индекс минимизаторов
+    tr = TRANSLATIONS[lang]
+    params = {
+        'mode': 'search', 'query': query, 'reference': reference, 'index': index_path, 'output': output,
+        'search_mode': search_mode, 'match': match, 'mismatch': mismatch, 'gap': gap, 'gap_open': gap_open,
+        'gap_extend': gap_extend, 'matrix': matrix, 'subsample': subsample, 'top': top, 'verbose': verbose,
+        'lang': lang
+    }
+    if not query or not reference:
+        console.print(f"{tr['error']} {tr['error_search']}", style="bold red")
+        sys.exit(1)
+    if not validate_params(params, tr):
+        sys.exit(1)
+    run_alignment(params, tr)
+
+
 def run_alignment(params: Dict, tr: Dict):
     # выполнение выравнивания
     if params['verbose']:
@@ -529,8 +808,14 @@ def run_alignment(params: Dict, tr: Dict):
         process = psutil.Process(os.getpid())
         start_mem = process.memory_info().rss / 1024 ** 2
 
+    cache = None
+    if params.get('cache'):
+        cache = ResultCache(params['cache'], params.get('cache_size') or DEFAULT_CACHE_BYTES)
+
     if params.get('batch', False):
-        result = run_batch_alignment(params['directory'], params, tr)
+        result = run_batch_alignment(params['directory'], params, tr, cache)
+    elif params['mode'] == 'search':
+        result = run_search(params, tr)
     else:
         scoring_matrix = load_scoring_matrix(params['matrix']) if params['matrix'] else None
         sequences = load_sequences(params['input1'])
@@ -550,11 +835,16 @@ def run_alignment(params: Dict, tr: Dict):
                 if len(sequences) < 2:
                     console.print(f"{tr['error']} {tr['error_msa']}", style="bold red")
                     sys.exit(1)
-                aligned = multiple_sequence_alignment(
+                aligned, newick = multiple_sequence_alignment(
                     sequences, params['match'], params['mismatch'], params['gap'],
                     params.get('gap_open'), params.get('gap_extend'), scoring_matrix,
-                    params.get('threads', os.cpu_count())
+                    params.get('threads', os.cpu_count()), params.get('distance', 'align'), cache=cache,
+                    tree_method=params.get('guide_tree', 'upgma'), return_tree=True,
+                    embed_above=params.get('embed_above', EMBED_THRESHOLD)
                 )
+                if params.get('newick'):
+                    with open(params['newick'], 'w') as f:
+                        f.write(newick + "\n")
                 result = format_msa(aligned, clustal=params.get('clustal', False))
             else:
                 if 'input2' not in params:
@@ -566,22 +856,42 @@ def run_alignment(params: Dict, tr: Dict):
                     seq1 = seq1[:params['subsample']]
                     seq2 = seq2[:params['subsample']]
                     console.print(tr['subsampled'].format(params['subsample']), style="yellow")
-                if params['mode'] == 'global':
-                    align1, align2, score = needleman_wunsch(
+                if params['mode'] == 'global' and params.get('genome'):
+                    aligned = genome_align(
+                        seq1, seq2, params['match'], params['mismatch'], params['gap'],
+                        params.get('gap_open'), params.get('gap_extend'), scoring_matrix,
+                        max_memory=params.get('max_memory')
+                    )
+                elif params['mode'] == 'global':
+                    aligned = needleman_wunsch(
                         seq1, seq2, params['match'], params['mismatch'], params['gap'],
-                        params.get('gap_open'), params.get('gap_extend'), scoring_matrix
+                        params.get('gap_open'), params.get('gap_extend'), scoring_matrix,
+                        bandwidth=params.get('bandwidth'), engine=params.get('engine', 'auto'),
+                        max_memory=params.get('max_memory')
+                    )
+                elif params.get('heuristic'):
+                    aligned = heuristic_local_align(
+                        seq1, seq2, match_score=params['match'], mismatch_score=params['mismatch'],
+                        gap_penalty=params['gap'], scoring_matrix=scoring_matrix, gap_open=params.get('gap_open'),
+                        gap_extend=params.get('gap_extend'), seed_index=load_seed_index(params, seq2, tr)
                     )
                 else:
-                    align1, align2, score = smith_waterman(
-                        seq1, seq2, params['match'], params['mismatch'], params['gap'], scoring_matrix
+                    aligned = smith_waterman(
+                        seq1, seq2, params['match'], params['mismatch'], params['gap'], scoring_matrix,
+                        gap_open=params.get('gap_open'), gap_extend=params.get('gap_extend'),
+                        engine=params.get('engine', 'auto'), max_memory=params.get('max_memory')
                     )
-                result = f"Score: {score}\n"
-                print_alignment_table(align1, align2, tr)
-                stats = compute_stats(align1, align2)
+                result = f"Score: {aligned.score}\n" + _engine_report(aligned, tr)
+                print_alignment_table(aligned, tr, GENOME_PREVIEW_COLUMNS if params.get('genome') else None)
+                stats = compute_stats(aligned)
                 result += f"{tr['identity']}: {stats['identity']:.2f}%\n{tr['gaps']}: {stats['gaps']}\n"
 
             progress.update(task, advance=100)
 
+    if cache is not None:
+        cache.close()
+        result += f"{tr['cache_stats']}: {cache.hits} {tr['hits']}, {cache.misses} {tr['misses']}\n"
+
     end_time = time.time()
     if psutil:
         memory_usage = process.memory_info().rss / 1024 ** 2 - start_mem
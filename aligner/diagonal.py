@@ -0,0 +1,169 @@
+import numpy as np
+from typing import Tuple
+from aligner.algorithms import STOP, DIAG, UP, LEFT, _NEG_INF
+
+# Заполнение DP по антидиагоналям (wavefront): все ячейки диагонали i + j = d не зависят друг от друга,
+# поэтому каждая диагональ считается одной векторной numpy-операцией. Numba не нужен, что выгодно для
+# коротких запусков, где JIT warm-up дороже самого выравнивания. Указатели и их приоритеты при равенстве
+# совпадают с compiled-движком, так что traceback и результаты одинаковые.
+
+
+def _diagonal_rows(d: int, n: int, m: int) -> Tuple[int, int]:
+    # строки i ячеек (i, d - i) внутри матрицы, без нулевой строки и нулевого столбца
+    return max(1, d - m), min(n, d - 1)
+
+
+def _gap_cost(length: int, gap_open: int, gap_extend: int) -> int:
+    return gap_open + (length - 1) * gap_extend
+
+
+def diagonal_fill_linear(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        gap_penalty: int,
+        local: bool,
+        traceback: bool = True
+) -> Tuple[np.ndarray, int, int, int]:
+    # линейные gaps; возвращает (ptr, score, end_i, end_j) как _fill_linear
+    n, m = len(a), len(b)
+    ptr = np.zeros((n + 1, m + 1) if traceback else (1, 1), dtype=np.uint8)
+    if not local and traceback:
+        ptr[1:, 0] = UP
+        ptr[0, 1:] = LEFT
+    # буферы диагоналей d-2, d-1 и d, индекс - номер строки i
+    H2 = np.full(n + 1, _NEG_INF, dtype=np.int64)
+    H1 = np.full(n + 1, _NEG_INF, dtype=np.int64)
+    H = np.full(n + 1, _NEG_INF, dtype=np.int64)
+    H2[0] = 0
+    if m >= 1:
+        H1[0] = 0 if local else gap_penalty
+    if n >= 1:
+        H1[1] = 0 if local else gap_penalty
+    best, best_i, best_j = 0, 0, 0
+
+    for d in range(2, n + m + 1):
+        if d <= m:
+            H[0] = 0 if local else d * gap_penalty
+        if d <= n:
+            H[d] = 0 if local else d * gap_penalty
+        i_lo, i_hi = _diagonal_rows(d, n, m)
+        if i_lo <= i_hi:
+            rows = np.arange(i_lo, i_hi + 1)
+            pair = table[a[i_lo - 1:i_hi], b[d - i_hi - 1:d - i_lo][::-1]]
+            score = H2[i_lo - 1:i_hi] + pair
+            direction = np.full(len(rows), DIAG, dtype=np.uint8)
+            up = H1[i_lo - 1:i_hi] + gap_penalty
+            mask = up > score
+            score[mask] = up[mask]
+            direction[mask] = UP
+            left = H1[i_lo:i_hi + 1] + gap_penalty
+            mask = left > score
+            score[mask] = left[mask]
+            direction[mask] = LEFT
+            if local:
+                mask = score <= 0
+                score[mask] = 0
+                direction[mask] = STOP
+                k = int(np.argmax(score))
+                # как в построчном проходе: при равных score побеждает меньшая строка, затем меньший столбец
+                if score[k] > best or (score[k] == best and best > 0 and rows[k] < best_i):
+                    best, best_i, best_j = int(score[k]), int(rows[k]), d - int(rows[k])
+            H[i_lo:i_hi + 1] = score
+            if traceback:
+                ptr[rows, d - rows] = direction
+        H2, H1, H = H1, H, H2
+
+    if local:
+        return ptr, best, best_i, best_j
+    if n == 0 or m == 0:
+        return ptr, (n + m) * gap_penalty, n, m
+    return ptr, int(H1[n]), n, m
+
+
+def diagonal_fill_affine(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        gap_open: int,
+        gap_extend: int,
+        local: bool,
+        traceback: bool = True
+) -> Tuple[np.ndarray, int, int, int, int]:
+    # affine gaps (Gotoh); возвращает (ptr, score, state, end_i, end_j) как _fill_affine
+    n, m = len(a), len(b)
+    ptr = np.zeros((n + 1, m + 1) if traceback else (1, 1), dtype=np.uint8)
+    M2, X2, Y2 = (np.full(n + 1, _NEG_INF, dtype=np.int64) for _ in range(3))
+    M1, X1, Y1 = (np.full(n + 1, _NEG_INF, dtype=np.int64) for _ in range(3))
+    M, X, Y = (np.full(n + 1, _NEG_INF, dtype=np.int64) for _ in range(3))
+
+    def set_boundary(d, M, X, Y):
+        # ячейки (0, d) и (d, 0) диагонали d
+        if d <= m:
+            M[0] = 0 if local else _gap_cost(d, gap_open, gap_extend)
+            Y[0] = _NEG_INF if local else M[0]
+            X[0] = _NEG_INF
+        if d <= n:
+            M[d] = 0 if local else _gap_cost(d, gap_open, gap_extend)
+            X[d] = _NEG_INF if local else M[d]
+            Y[d] = _NEG_INF
+
+    M2[0] = 0
+    set_boundary(1, M1, X1, Y1)
+    top, top_i, top_j = 0, 0, 0
+
+    for d in range(2, n + m + 1):
+        set_boundary(d, M, X, Y)
+        i_lo, i_hi = _diagonal_rows(d, n, m)
+        if i_lo <= i_hi:
+            rows = np.arange(i_lo, i_hi + 1)
+            pair = table[a[i_lo - 1:i_hi], b[d - i_hi - 1:d - i_lo][::-1]]
+
+            best = M2[i_lo - 1:i_hi].copy()
+            source = np.zeros(len(rows), dtype=np.uint8)
+            for state, prev in ((1, X2), (2, Y2)):
+                candidate = prev[i_lo - 1:i_hi]
+                mask = candidate > best
+                best[mask] = candidate[mask]
+                source[mask] = state
+            if local:
+                mask = best <= 0
+                best[mask] = 0
+                source[mask] = 3
+            M_d = best + pair
+
+            x_open = M1[i_lo - 1:i_hi] + gap_open
+            x_ext = X1[i_lo - 1:i_hi] + gap_extend
+            mask = x_ext > x_open
+            X_d = np.where(mask, x_ext, x_open)
+            source[mask] |= 4
+
+            y_open = M1[i_lo:i_hi + 1] + gap_open
+            y_ext = Y1[i_lo:i_hi + 1] + gap_extend
+            mask = y_ext > y_open
+            Y_d = np.where(mask, y_ext, y_open)
+            source[mask] |= 8
+
+            if local:
+                k = int(np.argmax(M_d))
+                if M_d[k] > top or (M_d[k] == top and top > 0 and rows[k] < top_i):
+                    top, top_i, top_j = int(M_d[k]), int(rows[k]), d - int(rows[k])
+            M[i_lo:i_hi + 1] = M_d
+            X[i_lo:i_hi + 1] = X_d
+            Y[i_lo:i_hi + 1] = Y_d
+            if traceback:
+                ptr[rows, d - rows] = source
+        M2, M1, M = M1, M, M2
+        X2, X1, X = X1, X, X2
+        Y2, Y1, Y = Y1, Y, Y2
+
+    if local:
+        return ptr, top, 0, top_i, top_j
+    if n == 0 and m == 0:
+        return ptr, 0, 0, 0, 0
+    if n == 0 or m == 0:
+        return ptr, _gap_cost(n + m, gap_open, gap_extend), 0, n, m
+    # как в compiled-движке: при равенстве приоритет M, затем Ix, затем Iy
+    finals = [int(M1[n]), int(X1[n]), int(Y1[n])]
+    state = int(np.argmax(finals))
+    return ptr, finals[state], state, n, m
@@ -0,0 +1,178 @@
+import math
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Union
+from aligner.algorithms import (AFFINE_BITS, AUTO_BAND_START, LINEAR_BITS, MATRIX_MEMORY_BUDGET, Alignment,
+                                ScoreResult, _pointer_bytes, _prepare_sequences, needleman_wunsch, smith_waterman)
+from aligner.optimizers import _kmer_keys, heuristic_local_align
+from aligner.scoring import ALPHABET_SIZE, SeqLike
+
+# Выбор движка по модели стоимости: для каждого подходящего движка оценивается число ячеек DP (время) и пиковая
+# память; из движков, влезающих в бюджет памяти, берется самый дешевый. Оценка расхождения последовательностей
+# (по общим k-мерам) нужна banded и wavefront движкам: их стоимость растет с числом правок, а не с n * m.
+# Точные движки: compiled (полная матрица указателей или две строки DP), banded (bandwidth="auto"), linear-space
+# (Hirschberg / Myers-Miller / linear-space SW) и wfa / wfa-lowmem; seed (heuristic_local_align) - только для
+# local и только если точным движкам нужно больше max_cells ячеек.
+
+# ниже этого числа ячеек полная матрица дешевле любой оценки - движок выбирается без оценки расхождения
+SMALL_CELLS = 1 << 20
+# больше ячеек точные движки считают слишком долго (минуты), для local тогда берется seed-and-extend
+MAX_EXACT_CELLS = 1 << 34
+
+
+class Plan:
+    # выбранный движок, оценка числа ячеек DP и пиковой памяти (байт), оценка расхождения (None - не считалась)
+
+    def __init__(self, engine: str, cells: int, memory: int, divergence: Optional[float] = None):
+        self.engine = engine
+        self.cells = cells
+        self.memory = memory
+        self.divergence = divergence
+
+    def __repr__(self) -> str:
+        return f"Plan(engine={self.engine!r}, cells={self.cells}, memory={self.memory})"
+
+
+def estimate_divergence(a: np.ndarray, b: np.ndarray, k: Optional[int] = None) -> float:
+    # доля правок на позицию по Jaccard множеств k-меров (оценка Mash): 0 - идентичные, 1 - ничего общего
+    if k is None:
+        alphabet = max(len(np.union1d(np.unique(a), np.unique(b))), 2)
+        # k, при котором случайные совпадения k-меров редки, но в int64 ключ влезает
+        k = min(max(math.ceil(math.log(max(len(a), len(b), 2)) / math.log(alphabet)) + 2, 4), 12)
+    if len(a) < k or len(b) < k:
+        return 1.0
+    keys_a = np.unique(_kmer_keys(a, k, ALPHABET_SIZE))
+    keys_b = np.unique(_kmer_keys(b, k, ALPHABET_SIZE))
+    shared = len(np.intersect1d(keys_a, keys_b, assume_unique=True))
+    jaccard = shared / (len(keys_a) + len(keys_b) - shared)
+    if jaccard == 0:
+        return 1.0
+    return min(max(-math.log(2 * jaccard / (1 + jaccard)) / k, 0.0), 1.0)
+
+
+def _wfa_penalties(match_score: int, mismatch_score: int, gap_penalty: int, gap_open: Optional[int],
+                   gap_extend: Optional[int]) -> Optional[Tuple[int, int, int]]:
+    # (x, o, e) для WFA или None, если схема для него не подходит
+    from aligner.wavefront import _penalties
+    try:
+        return _penalties(match_score, mismatch_score, gap_penalty, gap_open, gap_extend)
+    except ValueError:
+        return None
+
+
+def plan_alignment(
+        n: int,
+        m: int,
+        local: bool = False,
+        traceback: bool = True,
+        divergence: Optional[float] = None,
+        max_memory: Optional[int] = None,
+        affine: bool = False,
+        wfa_penalties: Optional[Tuple[int, int, int]] = None,
+        max_cells: int = MAX_EXACT_CELLS
+) -> Plan:
+    # модель стоимости для seq1 длины n и seq2 длины m; wfa_penalties - (x, o, e), если WFA применим
+    budget = MATRIX_MEMORY_BUDGET if max_memory is None else max_memory
+    full = (n + 1) * (m + 1)
+    bits = AFFINE_BITS if affine else LINEAR_BITS
+    rows = 8 * (m + 1) * (6 if affine else 2)
+    candidates: List[Plan] = [
+        Plan("compiled", full, _pointer_bytes(n + 1, m + 1, bits) + rows if traceback else rows, divergence),
+        # прямой проход, обратный и деление пополам: около двух проходов по матрице
+        Plan("linear-space", 2 * full, 2 * rows + 16 * (n + m), divergence),
+    ]
+    if divergence is not None and not local:
+        edits = divergence * max(n, m)
+        # band растет удвоениями от AUTO_BAND_START, пока не накроет дрейф диагонали, и считается еще раз с traceback
+        bandwidth = AUTO_BAND_START
+        while bandwidth < 2 * edits:
+            bandwidth *= 2
+        if bandwidth < max(n, m):
+            band_width = 2 * bandwidth + abs(n - m) + 1
+            band_cells = (n + 1) * band_width
+            candidates.append(Plan("banded", (3 if traceback else 2) * band_cells,
+                                   (_pointer_bytes(n + 1, band_width, bits) if traceback else 0) + rows, divergence))
+        if wfa_penalties is not None:
+            x, o, e = wfa_penalties
+            penalty = int(edits * max(x, o + e)) + 1
+            # волна штрафа s покрывает не больше s / e диагоналей с каждой стороны; плюс продления совпадениями
+            width = min(2 * penalty // e + 1, n + m + 1)
+            wfa_cells = penalty * width // 2 + n + m
+            window = max(x, o + e) + 1
+            if traceback:
+                candidates.append(Plan("wfa", wfa_cells, 24 * penalty * width, divergence))
+            candidates.append(Plan("wfa-lowmem", 2 * wfa_cells if traceback else wfa_cells, 48 * window * width,
+                                   divergence))
+    fitting = [plan for plan in candidates if plan.memory <= budget]
+    # linear-space влезает всегда, кроме совсем крошечного бюджета - тогда все равно он
+    best = min(fitting, key=lambda plan: plan.cells) if fitting else candidates[1]
+    if local and best.cells > max_cells:
+        return Plan("seed", 16 * (n + m), 16 * (n + m), divergence)
+    return best
+
+
+def align(
+        seq1: SeqLike,
+        seq2: SeqLike,
+        local: bool = False,
+        match_score: int = 1,
+        mismatch_score: int = -1,
+        gap_penalty: int = -2,
+        gap_open: Optional[int] = None,
+        gap_extend: Optional[int] = None,
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
+        max_memory: Optional[int] = None,
+        score_only: bool = False
+) -> Union[Alignment, ScoreResult]:
+    # выравнивание движком, выбранным plan_alignment; план - в атрибуте plan результата
+    seq1, seq2, a, b, _ = _prepare_sequences(seq1, seq2, match_score, mismatch_score, scoring_matrix)
+    n, m = len(a), len(b)
+    affine = gap_open is not None and gap_extend is not None
+    divergence = None
+    if (n + 1) * (m + 1) > SMALL_CELLS:
+        divergence = estimate_divergence(a, b)
+    wfa_penalties = None
+    if scoring_matrix is None:
+        wfa_penalties = _wfa_penalties(match_score, mismatch_score, gap_penalty, gap_open, gap_extend)
+    plan = plan_alignment(n, m, local, not score_only, divergence, max_memory, affine, wfa_penalties)
+
+    scoring = dict(match_score=match_score, mismatch_score=mismatch_score, gap_penalty=gap_penalty,
+                   gap_open=gap_open, gap_extend=gap_extend, scoring_matrix=scoring_matrix)
+    align_fn = smith_waterman if local else needleman_wunsch
+    if plan.engine == "seed":
+        result = heuristic_local_align(seq1, seq2, score_only=score_only, **scoring)
+    elif plan.engine == "linear-space":
+        result = _linear_space(seq1, seq2, local, score_only, scoring)
+    else:
+        engine = "compiled" if plan.engine == "banded" else plan.engine
+        bandwidth = "auto" if plan.engine == "banded" else None
+        if local:
+            result = smith_waterman(seq1, seq2, engine=engine, score_only=score_only, max_memory=max_memory,
+                                    **scoring)
+        else:
+            result = needleman_wunsch(seq1, seq2, bandwidth=bandwidth, engine=engine, score_only=score_only,
+                                      max_memory=max_memory, **scoring)
+
+    if score_only and plan.engine != "seed":
+        # traceback по запросу снова выбирает движок - уже с учетом матрицы указателей
+        result = ScoreResult(result.score, result.end_i, result.end_j, align_fn, seq1, seq2, engine="auto",
+                             max_memory=max_memory, **scoring)
+    result.plan = plan
+    return result
+
+
+def _linear_space(seq1: str, seq2: str, local: bool, score_only: bool, scoring: Dict) -> Union[Alignment, ScoreResult]:
+    # выравнивание в линейной памяти; score_only - это и так две строки DP compiled-движка
+    from aligner.linear_space import (hirschberg_needleman_wunsch, linear_space_smith_waterman,
+                                      myers_miller_needleman_wunsch)
+    if score_only:
+        align_fn = smith_waterman if local else needleman_wunsch
+        return align_fn(seq1, seq2, score_only=True, **scoring)
+    if local:
+        return linear_space_smith_waterman(seq1, seq2, scoring['match_score'], scoring['mismatch_score'],
+                                           scoring['gap_penalty'], scoring['scoring_matrix'], scoring['gap_open'],
+                                           scoring['gap_extend'])
+    if scoring['gap_open'] is not None and scoring['gap_extend'] is not None:
+        return myers_miller_needleman_wunsch(seq1, seq2, scoring['match_score'], scoring['mismatch_score'],
+                                             scoring['gap_open'], scoring['gap_extend'], scoring['scoring_matrix'])
+    return hirschberg_needleman_wunsch(seq1, seq2, scoring['match_score'], scoring['mismatch_score'],
+                                       scoring['gap_penalty'], scoring['scoring_matrix'])
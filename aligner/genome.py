@@ -0,0 +1,251 @@
+import os
+import numpy as np
+import numba
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from aligner.algorithms import OP_MATCH, Alignment, _prepare_sequences, needleman_wunsch
+from aligner.dispatch import Plan
+from aligner.index import MinimizerIndex, _default_kw, _minimizers
+from aligner.scoring import ALPHABET_SIZE, SeqLike, encode_sequence
+
+# Глобальное выравнивание целых геномов (как в minimap2 / MUMmer): якоря - общие минимизаторы seq1 и seq2
+# (точные совпадения k-меров), colinear chaining - разреженный DP по якорям, отсортированным по позиции в seq1:
+# якорь q продолжает цепочку якоря p, если лежит правее и ниже, за min(dx, dy, k) совпавших позиций минус штраф
+# за сдвиг диагонали |dx - dy|. Локальные цепочки (синтенные блоки) соединяет второй colinear DP - по цепочкам,
+# с логарифмическим штрафом за сдвиг и без предела расстояния; лучшая цепочка цепочек - "скелет" выравнивания.
+# Якоря скелета (обрезанные там, где перекрываются) - столбцы совпадений, а прямоугольники между соседними
+# якорями выравниваются глобально (needleman_wunsch engine="auto": полная матрица, band, WFA или linear-space
+# по модели стоимости), параллельно; слишком большие - рекурсивно, по якорям меньшей длины.
+# Score - сумма score прямоугольников и якорей: якорь - непрерывный run совпадений, gaps соседних прямоугольников
+# не сливаются, и affine-штрафы складываются так же, как в одном DP по этому пути.
+
+# минимизаторы, встречающиеся в seq2 чаще, - повторы, якорями не берутся
+MAX_ANCHOR_OCCURRENCES = 16
+# сколько предыдущих якорей смотрит chaining DP и на какое расстояние (как -z / -r в minimap2); более далекие
+# якоря соединяет второй DP - по цепочкам
+CHAIN_LOOKBACK = 64
+CHAIN_MAX_DISTANCE = 10000
+# цепочки со score меньше MIN_CHAIN_SCORE * k - случайные совпадения, во второй DP не берутся;
+# штраф перехода между цепочками - CHAIN_GAP_LOG * k * log2(1 + сдвиг диагонали)
+MIN_CHAIN_SCORE = 3
+CHAIN_GAP_LOG = 1.0
+# прямоугольник между якорями больше MAX_FILL_CELLS ячеек выравнивается рекурсивно по якорям с k * 2 // 3
+# (пока k не меньше RECURSE_MIN_K), а не полным DP
+MAX_FILL_CELLS = 1 << 24
+RECURSE_MIN_K = 8
+
+
+@numba.jit(nopython=True, cache=True)
+def _anchors(a: np.ndarray, b: np.ndarray, hashes: np.ndarray, positions: np.ndarray, keys: np.ndarray,
+             offsets: np.ndarray, targets_pos: np.ndarray, k: int, max_occurrences: int) -> Tuple[np.ndarray, np.ndarray]:
+    # (i, j) общих минимизаторов a и индекса b; совпадение проверяется по кодам (хэш k-мера может совпасть)
+    out_i = np.empty(len(hashes) * 2, dtype=np.int64)
+    out_j = np.empty(len(hashes) * 2, dtype=np.int64)
+    found = 0
+    for q in range(len(hashes)):
+        slot = np.searchsorted(keys, hashes[q])
+        if slot >= len(keys) or keys[slot] != hashes[q]:
+            continue
+        if offsets[slot + 1] - offsets[slot] > max_occurrences:
+            continue
+        i = positions[q]
+        for p in range(offsets[slot], offsets[slot + 1]):
+            j = targets_pos[p]
+            exact = True
+            for t in range(k):
+                if a[i + t] != b[j + t]:
+                    exact = False
+                    break
+            if not exact:
+                continue
+            if found == len(out_i):
+                out_i = np.concatenate((out_i, np.empty(len(out_i), dtype=np.int64)))
+                out_j = np.concatenate((out_j, np.empty(len(out_j), dtype=np.int64)))
+            out_i[found] = i
+            out_j[found] = j
+            found += 1
+    return out_i[:found], out_j[:found]
+
+
+@numba.jit(nopython=True, cache=True)
+def _chain(anchor_i: np.ndarray, anchor_j: np.ndarray, k: int, lookback: int,
+           max_distance: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # локальные цепочки якорей (якоря отсортированы по i, затем j): DP по CHAIN_LOOKBACK предыдущим якорям
+    # на расстоянии до max_distance, затем, как в minimap2, цепочки снимаются по убыванию score - обратный
+    # проход останавливается на якоре, уже взятом в другую цепочку. Возвращает якоря всех цепочек подряд
+    # (members), границы цепочек в members (offsets) и их score; цепочки - по убыванию score
+    count = len(anchor_i)
+    score = np.empty(count, dtype=np.float64)
+    parent = np.full(count, -1, dtype=np.int64)
+    for q in range(count):
+        score[q] = k
+        for p in range(q - 1, max(q - lookback, 0) - 1, -1):
+            dx = anchor_i[q] - anchor_i[p]
+            dy = anchor_j[q] - anchor_j[p]
+            if dx > max_distance:
+                break
+            if dx <= 0 or dy <= 0 or dy > max_distance:
+                continue
+            shift = abs(dx - dy)
+            gain = min(min(dx, dy), k) - (0.01 * k * shift + (0.5 * np.log2(shift) if shift > 0 else 0.0))
+            if score[p] + gain > score[q]:
+                score[q] = score[p] + gain
+                parent[q] = p
+    used = np.zeros(count, dtype=np.bool_)
+    members = np.empty(count, dtype=np.int64)
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    scores = np.empty(count, dtype=np.float64)
+    chains = 0
+    length = 0
+    for q in np.argsort(-score, kind="mergesort"):
+        if used[q]:
+            continue
+        start = length
+        p = q
+        while p >= 0 and not used[p]:
+            used[p] = True
+            members[length] = p
+            length += 1
+            p = parent[p]
+        members[start:length] = members[start:length][::-1].copy()
+        scores[chains] = score[q] - (score[p] if p >= 0 else 0.0)
+        chains += 1
+        offsets[chains] = length
+    return members, offsets[:chains + 1], scores[:chains]
+
+
+@numba.jit(nopython=True, cache=True)
+def _chain_chains(first_i: np.ndarray, first_j: np.ndarray, last_i: np.ndarray, last_j: np.ndarray,
+                  scores: np.ndarray, k: int) -> np.ndarray:
+    # colinear DP по цепочкам (отсортированы по first_i): цепочка продолжает предыдущую, если начинается
+    # правее и ниже ее конца; штраф за сдвиг диагонали логарифмический и без предела расстояния - длинные
+    # вставки и несовпадающие острова между синтенными блоками перешагиваются. Индексы лучшей цепочки цепочек
+    count = len(scores)
+    total = np.empty(count, dtype=np.float64)
+    parent = np.full(count, -1, dtype=np.int64)
+    for q in range(count):
+        total[q] = scores[q]
+        for p in range(q):
+            dx = first_i[q] - last_i[p]
+            dy = first_j[q] - last_j[p]
+            if dx < k or dy < k:
+                continue
+            gain = scores[q] - CHAIN_GAP_LOG * k * np.log2(1.0 + abs(dx - dy))
+            if total[p] + gain > total[q]:
+                total[q] = total[p] + gain
+                parent[q] = p
+    best = np.empty(count, dtype=np.int64)
+    length = 0
+    q = np.argmax(total) if count else -1
+    while q >= 0:
+        best[length] = q
+        length += 1
+        q = parent[q]
+    return best[:length][::-1].copy()
+
+
+def _backbone(a: np.ndarray, b: np.ndarray, k: int, w: int) -> List[Tuple[int, int, int]]:
+    # якоря лучшей цепочки без перекрытий: [(i, j, длина)] по возрастанию i и j
+    index = MinimizerIndex.build([b], k, w)
+    hashes, positions = _minimizers(a, k, w, ALPHABET_SIZE)
+    anchor_i, anchor_j = _anchors(a, b, hashes, positions, np.asarray(index.keys), np.asarray(index.offsets),
+                                  np.asarray(index.positions).astype(np.int64), k, MAX_ANCHOR_OCCURRENCES)
+    order = np.lexsort((anchor_j, anchor_i))
+    anchor_i, anchor_j = anchor_i[order], anchor_j[order]
+    members, offsets, scores = _chain(anchor_i, anchor_j, k, CHAIN_LOOKBACK, CHAIN_MAX_DISTANCE)
+    keep = np.flatnonzero(scores >= MIN_CHAIN_SCORE * k)
+    if len(keep) == 0 and len(scores):
+        keep = np.array([0])
+    first, last = members[offsets[keep]], members[offsets[keep + 1] - 1]
+    order = np.argsort(anchor_i[first], kind="stable")
+    keep, first, last = keep[order], first[order], last[order]
+    picked = _chain_chains(anchor_i[first], anchor_j[first], anchor_i[last], anchor_j[last], scores[keep], k)
+    chain = [members[offsets[c]:offsets[c + 1]] for c in keep[picked]]
+
+    backbone = []
+    end_i = end_j = 0
+    for q in (np.concatenate(chain) if chain else []):
+        i, j = int(anchor_i[q]), int(anchor_j[q])
+        # перекрытие с предыдущим якорем срезается с начала (на одной диагонали якоря просто сливаются)
+        trim = max(end_i - i, end_j - j, 0)
+        if trim >= k:
+            continue
+        i, j, length = i + trim, j + trim, k - trim
+        if backbone and i == end_i and j == end_j:
+            prev_i, prev_j, prev_length = backbone.pop()
+            i, j, length = prev_i, prev_j, prev_length + length
+        backbone.append((i, j, length))
+        end_i, end_j = i + length, j + length
+    return backbone
+
+
+def _align_region(seq1: str, seq2: str, table: np.ndarray, params: Dict, k: int, w: int, threads: int,
+                  max_memory: Optional[int]) -> Tuple[np.ndarray, int, int]:
+    # (ops, score, ячейки DP) глобального выравнивания seq1 и seq2 по якорям; params - score и gaps
+    a, b = encode_sequence(seq1), encode_sequence(seq2)
+    backbone = _backbone(a, b, k, w)
+
+    # прямоугольники перед каждым якорем и после последнего
+    gaps = []
+    end_i = end_j = 0
+    for i, j, length in backbone:
+        gaps.append((end_i, i, end_j, j))
+        end_i, end_j = i + length, j + length
+    gaps.append((end_i, len(a), end_j, len(b)))
+
+    def fill(gap: Tuple[int, int, int, int]) -> Tuple[np.ndarray, int, int]:
+        i0, i1, j0, j1 = gap
+        cells = (i1 - i0 + 1) * (j1 - j0 + 1)
+        if cells > MAX_FILL_CELLS and k * 2 // 3 >= RECURSE_MIN_K and min(i1 - i0, j1 - j0) > 0:
+            # большой прямоугольник (расхождение, потерянный повтор) - заново якоря меньшей длины
+            return _align_region(seq1[i0:i1], seq2[j0:j1], table, params, k * 2 // 3, w, 1, max_memory)
+        part = needleman_wunsch(seq1[i0:i1], seq2[j0:j1], engine="auto", max_memory=max_memory, **params)
+        return part.ops(), part.score, cells
+
+    workers = min(threads, len(gaps))
+    if workers <= 1:
+        filled = [fill(gap) for gap in gaps]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            filled = list(executor.map(fill, gaps))
+
+    ops = []
+    score = cells = 0
+    for (i, j, length), (part_ops, part_score, part_cells) in zip(backbone + [(len(a), len(b), 0)], filled):
+        ops.append(part_ops)
+        score += part_score
+        cells += part_cells
+        ops.append(np.full(length, OP_MATCH, dtype=np.uint8))
+        score += int(table[a[i:i + length], b[j:j + length]].sum())
+    return np.concatenate(ops), score, cells
+
+
+def genome_align(
+        seq1: SeqLike,
+        seq2: SeqLike,
+        match_score: int = 1,
+        mismatch_score: int = -1,
+        gap_penalty: int = -2,
+        gap_open: Optional[int] = None,
+        gap_extend: Optional[int] = None,
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
+        k: Optional[int] = None,
+        w: Optional[int] = None,
+        threads: Optional[int] = None,
+        max_memory: Optional[int] = None
+) -> Alignment:
+    # глобальное выравнивание длинных последовательностей через якоря и chaining (см. выше); не оптимально, если
+    # оптимальный путь уходит с цепочки. k, w - минимизаторы якорей (None - как в MinimizerIndex), threads -
+    # потоки для прямоугольников между якорями; план (engine="genome", ячейки DP прямоугольников, память не
+    # оценивается) - в plan
+    seq1, seq2, _, _, table = _prepare_sequences(seq1, seq2, match_score, mismatch_score, scoring_matrix)
+    if k is None or w is None:
+        default_k, default_w = _default_kw([seq1, seq2])
+        k = default_k if k is None else k
+        w = default_w if w is None else w
+    params = dict(match_score=match_score, mismatch_score=mismatch_score, gap_penalty=gap_penalty,
+                  gap_open=gap_open, gap_extend=gap_extend, scoring_matrix=scoring_matrix)
+    ops, score, cells = _align_region(seq1, seq2, table, params, k, w, threads or os.cpu_count() or 1, max_memory)
+    alignment = Alignment.from_ops(seq1, seq2, ops, score)
+    alignment.plan = Plan("genome", cells, 0)
+    return alignment
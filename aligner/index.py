@@ -0,0 +1,163 @@
+import json
+import os
+import numpy as np
+import numba
+from typing import List, Optional, Tuple
+from aligner.io_utils import load_sequences
+from aligner.optimizers import NUCLEOTIDES, _kmer_keys
+from aligner.scoring import ALPHABET_SIZE, SeqLike, decode_sequence, encode_sequence
+
+# Индекс минимизаторов (Roberts et al., 2004; как в minimap2) по набору reference-последовательностей.
+# Из каждого окна в w подряд идущих k-меров берется k-мер с наименьшим хэшем - минимизатор; соседние окна
+# обычно делят минимизатор, поэтому их около 2 / (w + 1) на позицию, и два совпадающих участка длиной
+# не меньше w + k - 1 гарантированно имеют общий. Индекс - CSR: отсортированные уникальные хэши (keys),
+# границы их вхождений (offsets) и вхождения - номер target и позиция. Кандидаты для query - targets с
+# наибольшим числом общих минимизаторов; полный DP считается только для них.
+# На диске индекс - директория с .npy-массивами и meta.json, читается обратно через mmap.
+
+# k и w по умолчанию: для нуклеотидов - 15 и 10, для белков - 5 и 5
+_ARRAYS = ("keys", "offsets", "targets", "positions", "lengths")
+
+
+@numba.jit(nopython=True, cache=True)
+def _mix(key: np.int64) -> np.int64:
+    # обратимое перемешивание битов (splitmix64): минимизатор - случайный k-мер окна, а не лексикографически меньший
+    x = np.uint64(key)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return np.int64(x)
+
+
+@numba.jit(nopython=True, cache=True)
+def _minimizers(codes: np.ndarray, k: int, w: int, base: int) -> Tuple[np.ndarray, np.ndarray]:
+    # (хэши, позиции) минимизаторов; при равных хэшах в окне - самый левый, повторы подряд - один раз.
+    # Последовательность короче w + k - 1 - одно окно из всех ее k-меров
+    keys = _kmer_keys(codes, k, base)
+    count = len(keys)
+    hashes = np.empty(count, dtype=np.int64)
+    for p in range(count):
+        hashes[p] = _mix(keys[p])
+    out_hashes = np.empty(count, dtype=np.int64)
+    out_positions = np.empty(count, dtype=np.int64)
+    found = 0
+    last = -1
+    for start in range(max(count - w + 1, 1 if count > 0 else 0)):
+        best = start
+        for p in range(start + 1, min(start + w, count)):
+            if hashes[p] < hashes[best]:
+                best = p
+        if best != last:
+            out_hashes[found] = hashes[best]
+            out_positions[found] = best
+            found += 1
+            last = best
+    return out_hashes[:found], out_positions[:found]
+
+
+@numba.jit(nopython=True, cache=True)
+def _count_shared(starts: np.ndarray, stops: np.ndarray, targets: np.ndarray, n_targets: int,
+                  max_occurrences: int) -> np.ndarray:
+    # число разных минимизаторов query, общих с каждым target; starts/stops - вхождения каждого хэша query
+    counts = np.zeros(n_targets, dtype=np.int64)
+    seen = np.full(n_targets, -1, dtype=np.int64)
+    for q in range(len(starts)):
+        if max_occurrences > 0 and stops[q] - starts[q] > max_occurrences:
+            # повторы (минимизатор почти во всех targets) не различают кандидатов
+            continue
+        for p in range(starts[q], stops[q]):
+            t = targets[p]
+            if seen[t] != q:
+                seen[t] = q
+                counts[t] += 1
+    return counts
+
+
+def _default_kw(sequences: List[str]) -> Tuple[int, int]:
+    letters = set()
+    for seq in sequences:
+        letters |= set(seq.upper())
+    return (15, 10) if letters <= NUCLEOTIDES else (5, 5)
+
+
+class MinimizerIndex:
+    # индекс минимизаторов targets; массивы - numpy или np.memmap после load()
+
+    def __init__(self, k: int, w: int, keys: np.ndarray, offsets: np.ndarray, targets: np.ndarray,
+                 positions: np.ndarray, lengths: np.ndarray):
+        self.k = k
+        self.w = w
+        self.keys = keys
+        self.offsets = offsets
+        self.targets = targets
+        self.positions = positions
+        self.lengths = lengths
+
+    @classmethod
+    def build(cls, sequences: List[SeqLike], k: Optional[int] = None, w: Optional[int] = None) -> "MinimizerIndex":
+        # k=None, w=None - по алфавиту sequences (см. выше)
+        if k is None or w is None:
+            default_k, default_w = _default_kw([decode_sequence(s) for s in sequences])
+            k = default_k if k is None else k
+            w = default_w if w is None else w
+        hashes, targets, positions = [], [], []
+        for t, seq in enumerate(sequences):
+            h, p = _minimizers(encode_sequence(seq), k, w, ALPHABET_SIZE)
+            hashes.append(h)
+            positions.append(p)
+            targets.append(np.full(len(h), t, dtype=np.int32))
+        hashes = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.int64)
+        order = np.argsort(hashes, kind="stable")
+        keys, counts = np.unique(hashes[order], return_counts=True)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        targets = np.concatenate(targets)[order] if targets else np.zeros(0, dtype=np.int32)
+        positions = (np.concatenate(positions)[order] if positions else np.zeros(0)).astype(np.int32)
+        lengths = np.array([len(s) for s in sequences], dtype=np.int64)
+        return cls(k, w, keys, offsets, targets, positions, lengths)
+
+    @classmethod
+    def from_fasta(cls, file_path: str, k: Optional[int] = None, w: Optional[int] = None) -> "MinimizerIndex":
+        # индекс всех последовательностей FASTA; номер target - номер записи в файле
+        return cls.build(load_sequences(file_path), k, w)
+
+    def save(self, path: str) -> None:
+        # директория path с .npy на каждый массив и meta.json (k, w)
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(getattr(self, name)))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"k": self.k, "w": self.w}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "MinimizerIndex":
+        # массивы через mmap: индекс не читается в память целиком, страницы подгружаются по мере lookup
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"индекс не найден: {path}")
+        with open(meta_path) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None) for name in _ARRAYS]
+        return cls(meta["k"], meta["w"], *arrays)
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def lookup(self, query: SeqLike, top: Optional[int] = 10, min_shared: int = 1,
+               max_occurrences: int = 0) -> List[Tuple[int, int]]:
+        # [(target, общих минимизаторов)] по убыванию числа общих (при равенстве - по номеру target);
+        # top=None - все с не меньше min_shared общими; max_occurrences > 0 - минимизаторы, встречающиеся
+        # в индексе чаще, не учитываются
+        hashes, _ = _minimizers(encode_sequence(query), self.k, self.w, ALPHABET_SIZE)
+        hashes = np.unique(hashes)
+        slots = np.searchsorted(self.keys, hashes)
+        hit = slots < len(self.keys)
+        hit[hit] = self.keys[slots[hit]] == hashes[hit]
+        slots = slots[hit]
+        counts = _count_shared(np.asarray(self.offsets[slots]), np.asarray(self.offsets[slots + 1]),
+                               np.asarray(self.targets), len(self), max_occurrences)
+        candidates = np.flatnonzero(counts >= max(min_shared, 1))
+        ranked = candidates[np.argsort(-counts[candidates], kind="stable")]
+        if top is not None:
+            ranked = ranked[:top]
+        return [(int(t), int(counts[t])) for t in ranked]
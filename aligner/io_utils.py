@@ -1,10 +1,11 @@
 from Bio import SeqIO
-from typing import List, Tuple
+from typing import List, Optional, Tuple, Union
 import os
 import requests
 import gzip
 import logging
 import time
+from aligner.algorithms import Alignment
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -75,8 +76,13 @@ def download_sequences(url: str, save_path: str, retries: int = 3) -> None:
     raise ValueError(f"Не удалось скачать после {retries} попыток. Проверьте URL в браузере, возможно CAPTCHA.")
 
 
-def format_alignment(align1: str, align2: str) -> str:
-    match_line = ''.join('|' if a == b else ' ' for a, b in zip(align1, align2))
+def format_alignment(align1: Union[str, Alignment], align2: Optional[str] = None) -> str:
+    # Alignment - строки и строка совпадений рендерятся по CIGAR, без посимвольного сравнения в python
+    if isinstance(align1, Alignment):
+        match_line = align1.match_line()
+        align1, align2 = align1.aligned()
+    else:
+        match_line = ''.join('|' if a == b else ' ' for a, b in zip(align1, align2))
     return f"{align1}\n{match_line}\n{align2}"
 
 
@@ -0,0 +1,424 @@
+import numpy as np
+import numba
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+from aligner.algorithms import (
+    OP_MATCH, OP_DEL, OP_INS, _NEG_INF, Alignment, _compiled_fill, _fill_encoded, _prepare_sequences,
+    _traceback_linear
+)
+from aligner.scoring import SeqLike
+
+# Глобальное выравнивание в линейной памяти: Hirschberg (linear gaps) и Myers-Miller (affine gaps).
+# Обе задачи делятся итеративно по списку подзадач (без рекурсии python); подзадачи одного уровня
+# независимы, и их можно считать в потоках - compiled-ядра отпускают GIL.
+#
+# Myers-Miller: глобальное выравнивание с affine gaps за O(n + m) памяти. Как в Hirschberg, прямой проход
+# считает последнюю строку верхней половины, обратный - первую строку нижней, по сумме выбирается точка,
+# через которую идет оптимальный путь, и задача делится на две. В отличие от linear gaps, точка разбиения -
+# это клетка и состояние (M, Ix, Iy), а gap, пересекающий границу, продолжается в нижней половине без нового
+# gap_open. Модель та же, что у _fill_affine: gap открывается только из M, строка 0 и столбец 0 ведут себя
+# как M (из них можно открыть gap любого направления), поэтому score совпадает с needleman_wunsch.
+#
+# Локальное выравнивание в линейной памяти: прямой проход без указателей находит score и клетку конца,
+# обратный проход от этой клетки - клетку начала, после чего прямоугольник между ними выравнивается
+# глобально (Hirschberg или Myers-Miller). Оптимальное локальное выравнивание начинается и заканчивается
+# парой символов, поэтому глобальный score прямоугольника равен локальному.
+
+# состояния: M - последний ход по диагонали, X - gap в seq2 (ход вниз), Y - gap в seq1 (ход вправо);
+# ANY - конечное состояние не задано (вся задача целиком)
+STATE_M, STATE_X, STATE_Y, STATE_ANY = 0, 1, 2, -1
+# подзадачи не больше стольких ячеек решаются полной матрицей указателей
+BASE_CELLS = 1 << 16
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _nw_last_row(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        gap_penalty: int,
+        i0: int,
+        i1: int,
+        j0: int,
+        j1: int,
+        reverse: bool
+) -> np.ndarray:
+    # последняя строка NW для a[i0:i1] x b[j0:j1] без копий и разворотов массивов:
+    # row[k] - score a[i0:i1] против b[j0:j0 + k], при reverse - против b[j1 - k:j1] (проход с конца)
+    m = j1 - j0
+    prev = np.arange(m + 1).astype(np.int64) * gap_penalty
+    curr = np.empty(m + 1, dtype=np.int64)
+    for step in range(i1 - i0):
+        ai = a[i1 - 1 - step] if reverse else a[i0 + step]
+        curr[0] = prev[0] + gap_penalty
+        for k in range(1, m + 1):
+            bj = b[j1 - k] if reverse else b[j0 + k - 1]
+            curr[k] = max(prev[k - 1] + table[ai, bj], prev[k] + gap_penalty, curr[k - 1] + gap_penalty)
+        prev, curr = curr, prev
+    return prev
+
+
+def _divide_and_conquer(root: tuple, step: Callable, threads: int) -> Tuple[np.ndarray, int]:
+    # step(задача) -> ("leaf", (ops, score)) или ("split", (верхняя, нижняя)); список хранит подзадачи
+    # и готовые куски в порядке выравнивания, каждый проход делит все еще не решенные подзадачи
+    items = [(False, root)]
+    executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+    try:
+        while True:
+            pending = [task for solved, task in items if not solved]
+            if not pending:
+                break
+            results = iter(executor.map(step, pending) if executor else [step(task) for task in pending])
+            expanded = []
+            for solved, value in items:
+                if solved:
+                    expanded.append((True, value))
+                    continue
+                kind, value = next(results)
+                if kind == "leaf":
+                    expanded.append((True, value))
+                else:
+                    expanded.extend((False, task) for task in value)
+            items = expanded
+    finally:
+        if executor:
+            executor.shutdown()
+    ops = np.concatenate([value[0] for _, value in items]) if items else np.zeros(0, dtype=np.uint8)
+    return ops, sum(int(value[1]) for _, value in items)
+
+
+def hirschberg_needleman_wunsch(
+        seq1: SeqLike,
+        seq2: SeqLike,
+        match_score: int = 1,
+        mismatch_score: int = -1,
+        gap_penalty: int = -2,
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
+        threads: int = 1,
+        base_cells: int = BASE_CELLS
+) -> Alignment:
+    # Hirschberg: глобальное выравнивание с linear gaps; подзадача - диапазоны (i0, i1, j0, j1) в кодах
+    seq1, seq2, a, b, table = _prepare_sequences(seq1, seq2, match_score, mismatch_score, scoring_matrix)
+
+    def step(task):
+        i0, i1, j0, j1 = task
+        if i1 - i0 <= 1 or (i1 - i0 + 1) * (j1 - j0 + 1) <= base_cells:
+            ptr, score, _, end_i, end_j = _compiled_fill(a[i0:i1], b[j0:j1], table, gap_penalty, None, None, False)
+            ops, _, _ = _traceback_linear(ptr, end_i, end_j, False, 0)
+            return "leaf", (ops, score)
+        mid = (i0 + i1) // 2
+        upper = _nw_last_row(a, b, table, gap_penalty, i0, mid, j0, j1, False)
+        lower = _nw_last_row(a, b, table, gap_penalty, mid, i1, j0, j1, True)
+        split = j0 + int(np.argmax(upper + lower[::-1]))
+        return "split", ((i0, mid, j0, split), (mid, i1, split, j1))
+
+    ops, score = _divide_and_conquer((0, len(a), 0, len(b)), step, threads)
+    return Alignment.from_ops(seq1, seq2, ops, score)
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _mm_forward(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        gap_open: int,
+        gap_extend: int,
+        start: int,
+        top_edge: bool,
+        left_edge: bool,
+        traceback: bool
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # прямой проход по подзадаче, начатой в (0, 0) в состоянии start; top_edge/left_edge - строка 0 / столбец 0
+    # подзадачи совпадают с границей всей матрицы (там только M, ход вдоль границы продлевает gap).
+    # Возвращает последнюю строку M, X, Y и (если traceback) 4-битные указатели как в _fill_affine:
+    # биты 0-1 - откуда пришел M (3 - ход вдоль границы), бит 2 - X продолжает gap, бит 3 - то же для Y
+    n, m = len(a), len(b)
+    ptr = np.zeros((n + 1, m + 1) if traceback else (1, 1), dtype=np.uint8)
+    M_prev = np.full(m + 1, _NEG_INF, dtype=np.int64)
+    X_prev = np.full(m + 1, _NEG_INF, dtype=np.int64)
+    Y_prev = np.full(m + 1, _NEG_INF, dtype=np.int64)
+    M_curr = np.empty(m + 1, dtype=np.int64)
+    X_curr = np.empty(m + 1, dtype=np.int64)
+    Y_curr = np.empty(m + 1, dtype=np.int64)
+    if start == STATE_M:
+        M_prev[0] = 0
+    elif start == STATE_X:
+        X_prev[0] = 0
+    else:
+        Y_prev[0] = 0
+    for j in range(1, m + 1):
+        if top_edge:
+            M_prev[j] = M_prev[j - 1] + (gap_open if j == 1 else gap_extend)
+            if traceback:
+                ptr[0, j] = 3
+        else:
+            y_open = M_prev[j - 1] + gap_open
+            y_ext = Y_prev[j - 1] + gap_extend
+            if y_ext > y_open:
+                Y_prev[j] = y_ext
+                if traceback:
+                    ptr[0, j] = 8
+            else:
+                Y_prev[j] = y_open
+
+    for i in range(1, n + 1):
+        Y_curr[0] = _NEG_INF
+        if left_edge:
+            M_curr[0] = M_prev[0] + (gap_open if i == 1 and top_edge else gap_extend)
+            X_curr[0] = _NEG_INF
+            if traceback:
+                ptr[i, 0] = 3
+        else:
+            M_curr[0] = _NEG_INF
+            x_open = M_prev[0] + gap_open
+            x_ext = X_prev[0] + gap_extend
+            if x_ext > x_open:
+                X_curr[0] = x_ext
+                if traceback:
+                    ptr[i, 0] = 4
+            else:
+                X_curr[0] = x_open
+        ai = a[i - 1]
+        for j in range(1, m + 1):
+            best = M_prev[j - 1]
+            source = 0
+            if X_prev[j - 1] > best:
+                best = X_prev[j - 1]
+                source = 1
+            if Y_prev[j - 1] > best:
+                best = Y_prev[j - 1]
+                source = 2
+            M_curr[j] = best + table[ai, b[j - 1]]
+
+            x_open = M_prev[j] + gap_open
+            x_ext = X_prev[j] + gap_extend
+            if x_ext > x_open:
+                X_curr[j] = x_ext
+                source |= 4
+            else:
+                X_curr[j] = x_open
+
+            y_open = M_curr[j - 1] + gap_open
+            y_ext = Y_curr[j - 1] + gap_extend
+            if y_ext > y_open:
+                Y_curr[j] = y_ext
+                source |= 8
+            else:
+                Y_curr[j] = y_open
+            if traceback:
+                ptr[i, j] = source
+        M_prev, M_curr = M_curr, M_prev
+        X_prev, X_curr = X_curr, X_prev
+        Y_prev, Y_curr = Y_curr, Y_prev
+    return ptr, M_prev, X_prev, Y_prev
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _mm_backward(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        gap_open: int,
+        gap_extend: int,
+        end: int,
+        left_edge: bool
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # обратный проход: B_s[j] - лучший score пути из (0, j) в (n, m), если в (0, j) пришли в состоянии s,
+    # а в (n, m) нужно прийти в состоянии end. Строка 0 подзадачи здесь никогда не граница матрицы
+    n, m = len(a), len(b)
+    M_next = np.full(m + 1, _NEG_INF, dtype=np.int64)
+    X_next = np.full(m + 1, _NEG_INF, dtype=np.int64)
+    Y_next = np.full(m + 1, _NEG_INF, dtype=np.int64)
+    M_curr = np.empty(m + 1, dtype=np.int64)
+    X_curr = np.empty(m + 1, dtype=np.int64)
+    Y_curr = np.empty(m + 1, dtype=np.int64)
+
+    for i in range(n, -1, -1):
+        for j in range(m, -1, -1):
+            if i == n and j == m:
+                M_curr[j] = 0 if end == STATE_ANY or end == STATE_M else _NEG_INF
+                X_curr[j] = 0 if end == STATE_ANY or end == STATE_X else _NEG_INF
+                Y_curr[j] = 0 if end == STATE_ANY or end == STATE_Y else _NEG_INF
+                continue
+            diag = _NEG_INF
+            if i < n and j < m:
+                diag = M_next[j + 1] + table[a[i], b[j]]
+            down_open = down_ext = right_open = right_ext = _NEG_INF
+            if i < n:
+                if left_edge and j == 0:
+                    # вдоль столбца 0 только M, ход вниз продлевает gap
+                    down_open = M_next[0] + gap_extend
+                else:
+                    down_open = X_next[j] + gap_open
+                    down_ext = X_next[j] + gap_extend
+            if j < m:
+                right_open = Y_curr[j + 1] + gap_open
+                right_ext = Y_curr[j + 1] + gap_extend
+            M_curr[j] = max(diag, down_open, right_open)
+            X_curr[j] = max(diag, down_ext)
+            Y_curr[j] = max(diag, right_ext)
+            if left_edge and j == 0:
+                X_curr[j] = _NEG_INF
+                Y_curr[j] = _NEG_INF
+        if i > 0:
+            M_next, M_curr = M_curr, M_next
+            X_next, X_curr = X_curr, X_next
+            Y_next, Y_curr = Y_curr, Y_next
+    return M_curr, X_curr, Y_curr
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _mm_traceback(ptr: np.ndarray, i: int, j: int, state: int) -> np.ndarray:
+    # traceback подзадачи от (i, j) в состоянии state до (0, 0); операции в прямом порядке
+    ops = np.empty(i + j, dtype=np.uint8)
+    length = 0
+    while i > 0 or j > 0:
+        source = ptr[i, j]
+        if state == STATE_M:
+            if source & 3 == 3:
+                if j == 0:
+                    ops[length] = OP_DEL
+                    i -= 1
+                else:
+                    ops[length] = OP_INS
+                    j -= 1
+            else:
+                ops[length] = OP_MATCH
+                state = source & 3
+                i -= 1
+                j -= 1
+        elif state == STATE_X:
+            ops[length] = OP_DEL
+            state = STATE_X if source & 4 else STATE_M
+            i -= 1
+        else:
+            ops[length] = OP_INS
+            state = STATE_Y if source & 8 else STATE_M
+            j -= 1
+        length += 1
+    return ops[:length][::-1].copy()
+
+
+def _end_state(M: int, X: int, Y: int, end: int) -> Tuple[int, int]:
+    # (состояние, score) в конце подзадачи; без ограничения - первое с максимумом: M, X, Y
+    if end != STATE_ANY:
+        return end, (M, X, Y)[end]
+    finals = [M, X, Y]
+    state = int(np.argmax(finals))
+    return state, finals[state]
+
+
+def myers_miller_needleman_wunsch(
+        seq1: SeqLike,
+        seq2: SeqLike,
+        match_score: int = 1,
+        mismatch_score: int = -1,
+        gap_open: int = -5,
+        gap_extend: int = -1,
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
+        threads: int = 1,
+        base_cells: int = BASE_CELLS
+) -> Alignment:
+    # глобальное выравнивание с affine gaps в линейной памяти; тот же score, что у needleman_wunsch.
+    # Подзадача: коды a[i0:i1] x b[j0:j1], состояние на входе и требуемое на выходе, лежит ли она
+    # на строке 0 / столбце 0 всей матрицы
+    seq1, seq2, a, b, table = _prepare_sequences(seq1, seq2, match_score, mismatch_score, scoring_matrix)
+
+    def step(task):
+        i0, i1, j0, j1, start, end = task
+        sub_a, sub_b = a[i0:i1], b[j0:j1]
+        top_edge, left_edge = i0 == 0, j0 == 0
+        n, m = i1 - i0, j1 - j0
+        if n <= 1 or (n + 1) * (m + 1) <= base_cells:
+            ptr, M, X, Y = _mm_forward(sub_a, sub_b, table, gap_open, gap_extend, start, top_edge, left_edge, True)
+            state, score = _end_state(M[m], X[m], Y[m], end)
+            return "leaf", (_mm_traceback(ptr, n, m, state), score)
+
+        mid = n // 2
+        _, FM, FX, FY = _mm_forward(sub_a[:mid], sub_b, table, gap_open, gap_extend, start, top_edge, left_edge,
+                                    False)
+        BM, BX, BY = _mm_backward(sub_a[mid:], sub_b, table, gap_open, gap_extend, end, left_edge)
+        # точка разбиения: клетка (mid, split) и состояние, в котором через нее проходит оптимальный путь
+        totals = np.stack((FM + BM, FX + BX, FY + BY))
+        split, state = np.unravel_index(int(np.argmax(totals.T)), (m + 1, 3))
+        split, state = j0 + int(split), int(state)
+        return "split", ((i0, i0 + mid, j0, split, start, state), (i0 + mid, i1, split, j1, state, end))
+
+    ops, score = _divide_and_conquer((0, len(a), 0, len(b), STATE_M, STATE_ANY), step, threads)
+    return Alignment.from_ops(seq1, seq2, ops, score)
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _local_start(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        gap_open: int,
+        gap_extend: int,
+        linear: bool,
+        end_i: int,
+        end_j: int,
+        score: int
+) -> Tuple[int, int]:
+    # обратный проход от (end_i, end_j): DP по развернутым префиксам a[:end_i], b[:end_j], привязанная к концу
+    # (без обнуления); первая по строкам клетка, где пара символов набирает score, - начало выравнивания.
+    # При linear gaps gap_open = gap_extend = gap_penalty, и X, Y совпадают с ходами из H
+    M_prev = np.full(end_j + 1, _NEG_INF, dtype=np.int64)
+    X_prev = np.full(end_j + 1, _NEG_INF, dtype=np.int64)
+    Y_prev = np.full(end_j + 1, _NEG_INF, dtype=np.int64)
+    M_curr = np.full(end_j + 1, _NEG_INF, dtype=np.int64)
+    X_curr = np.full(end_j + 1, _NEG_INF, dtype=np.int64)
+    Y_curr = np.full(end_j + 1, _NEG_INF, dtype=np.int64)
+    M_prev[0] = 0
+    for i in range(1, end_i + 1):
+        ai = a[end_i - i]
+        for j in range(1, end_j + 1):
+            diag = max(M_prev[j - 1], max(X_prev[j - 1], Y_prev[j - 1]))
+            M_curr[j] = diag + table[ai, b[end_j - j]]
+            if linear:
+                up = max(M_prev[j], max(X_prev[j], Y_prev[j]))
+                left = max(M_curr[j - 1], max(X_curr[j - 1], Y_curr[j - 1]))
+                X_curr[j] = up + gap_open
+                Y_curr[j] = left + gap_open
+            else:
+                X_curr[j] = max(M_prev[j] + gap_open, X_prev[j] + gap_extend)
+                Y_curr[j] = max(M_curr[j - 1] + gap_open, Y_curr[j - 1] + gap_extend)
+            if M_curr[j] == score:
+                return end_i - i, end_j - j
+        M_prev, M_curr = M_curr, M_prev
+        X_prev, X_curr = X_curr, X_prev
+        Y_prev, Y_curr = Y_curr, Y_prev
+        M_curr[0] = _NEG_INF
+    return end_i, end_j
+
+
+def linear_space_smith_waterman(
+        seq1: SeqLike,
+        seq2: SeqLike,
+        match_score: int = 1,
+        mismatch_score: int = -1,
+        gap_penalty: int = -2,
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
+        gap_open: Optional[int] = None,
+        gap_extend: Optional[int] = None,
+        engine: str = "compiled",
+        threads: int = 1,
+        base_cells: int = BASE_CELLS
+) -> Alignment:
+    # Smith-Waterman за O(n + m) памяти; тот же score, что у smith_waterman (linear или affine gaps)
+    seq1, seq2, a, b, table = _prepare_sequences(seq1, seq2, match_score, mismatch_score, scoring_matrix)
+    _, score, _, end_i, end_j = _fill_encoded(a, b, table, gap_penalty, gap_open, gap_extend, True, None, engine,
+                                              traceback=False)
+    if score <= 0:
+        return Alignment.from_ops(seq1, seq2, np.empty(0, dtype=np.uint8), 0)
+    linear = gap_open is None or gap_extend is None
+    start_i, start_j = _local_start(a, b, table, gap_penalty if linear else gap_open,
+                                    gap_penalty if linear else gap_extend, linear, end_i, end_j, score)
+    sub1, sub2 = seq1[start_i:end_i], seq2[start_j:end_j]
+    if linear:
+        sub = hirschberg_needleman_wunsch(sub1, sub2, match_score, mismatch_score, gap_penalty, scoring_matrix,
+                                          threads, base_cells)
+    else:
+        sub = myers_miller_needleman_wunsch(sub1, sub2, match_score, mismatch_score, gap_open, gap_extend,
+                                            scoring_matrix, threads, base_cells)
+    return sub.offset(seq1, seq2, start_i, start_j, int(score))
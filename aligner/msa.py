@@ -1,8 +1,15 @@
 import numpy as np
-from typing import List, Tuple, Optional, Dict
-from aligner.algorithms import needleman_wunsch, hirschberg_needleman_wunsch
+from typing import List, Tuple, Optional, Dict, Union
+from aligner.algorithms import (AFFINE_BITS, LINEAR_BITS, MATRIX_MEMORY_BUDGET, OP_DEL, OP_INS, _align_encoded,
+                               _pointer_bytes, needleman_wunsch)
+from aligner.batch import BATCH_SIZE, align_batch
+from aligner.bitparallel import edit_distance
+from aligner.cache import ResultCache, lookup_many
+from aligner.optimizers import NUCLEOTIDES, _kmer_keys
+from aligner.scoring import ALPHABET_SIZE, GAP_CODE, decode_sequence, encode_sequence, score_table
 import logging
-import random
+import numba
+import re
 from multiprocessing import Pool, cpu_count
 
 
@@ -14,19 +21,80 @@ class MSAError(Exception):
     pass
 
 
+# backends дистанции для guide tree: align - score needleman_wunsch, edit - bit-parallel edit distance,
+# kmer - без выравнивания, по общим k-мерам (как в MUSCLE / Clustal Omega)
+DISTANCES = ("align", "edit", "kmer")
+# методы guide tree: upgma - среднее связывание, nj - neighbour-joining (Saitou & Nei)
+TREE_METHODS = ("upgma", "nj")
+# embedded guide tree (mBed, Blackshields et al., 2010): выше EMBED_THRESHOLD последовательностей полная
+# матрица дистанций не считается; seeds - ceil(EMBED_SEEDS_PER_LOG * log2 n) опорных последовательностей,
+# кластер - не больше EMBED_CLUSTER_SIZE (полная матрица внутри него)
+EMBED_THRESHOLD = 100
+EMBED_SEEDS_PER_LOG = 4
+EMBED_CLUSTER_SIZE = 100
+# итераций k-means на одно деление
+KMEANS_ITERATIONS = 20
+# длина k-мера для kmer: для нуклеотидов - 4, для белков - 2
+KMER_SIZES = (4, 2)
+# сколько элементов (строк x последовательностей x k-меров) считается за один шаг kmer_distance_matrix
+_KMER_BLOCK = 1 << 24
+
+
+def _normalize(raw: np.ndarray, max_len: np.ndarray, distance: str) -> np.ndarray:
+    # edit - доля правок на позицию (0 - идентичные, 1 - ничего общего), align - -score на позицию
+    values = raw if distance == "edit" else -raw
+    return np.divide(values, max_len, out=np.zeros_like(values), where=max_len > 0)
+
+
+def kmer_distance_matrix(sequences: List[str], k: Optional[int] = None,
+                         columns: Optional[np.ndarray] = None) -> np.ndarray:
+    # дистанция MUSCLE: 1 - F, F - доля общих k-меров (сумма min числа вхождений каждого k-мера на число
+    # k-меров в более короткой последовательности). Векторы числа k-меров - строки матрицы counts по всем
+    # встреченным k-мерам; min и сумма считаются блоками строк сразу против всех последовательностей.
+    # columns - номера последовательностей, с которыми сравниваются все (матрица n x len(columns))
+    n = len(sequences)
+    if k is None:
+        letters = set("".join(sequences).upper())
+        k = KMER_SIZES[0] if letters <= NUCLEOTIDES else KMER_SIZES[1]
+    k = max(1, min([k] + [len(s) for s in sequences]))
+    keys = [_kmer_keys(encode_sequence(s), k, ALPHABET_SIZE) for s in sequences]
+    sizes = np.array([len(kk) for kk in keys])
+    unique, inverse = np.unique(np.concatenate(keys + [np.zeros(0, dtype=np.int64)]),
+                                return_inverse=True)
+    counts = np.zeros((n, len(unique)), dtype=np.int32)
+    np.add.at(counts, (np.repeat(np.arange(n), sizes), inverse), 1)
+    columns = np.arange(n) if columns is None else np.asarray(columns)
+    others = counts[columns]
+
+    shared = np.empty((n, len(columns)), dtype=np.int64)
+    step = max(1, _KMER_BLOCK // max(len(columns) * len(unique), 1))
+    for start in range(0, n, step):
+        block = counts[start:start + step]
+        shared[start:start + step] = np.minimum(block[:, None, :], others[None, :, :]).sum(axis=2)
+    shortest = np.minimum(sizes[:, None], sizes[columns][None, :])
+    dist = 1.0 - np.divide(shared, shortest, out=np.zeros(shared.shape), where=shortest > 0)
+    dist[columns, np.arange(len(columns))] = 0.0
+    return dist
+
+
 def pairwise_distance(args):
-    # Функция для parallel вычисления расстояний
-    i, j, sequences, match, mismatch, gap, gap_open, gap_extend, scoring_matrix = args
-    seq_i, seq_j = sequences[i], sequences[j]
-    if seq_i == seq_j:
-        score = len(seq_i) * match  # For identical, max score
-    elif max(len(seq_i), len(seq_j)) > 5000:
-        _, _, score = hirschberg_needleman_wunsch(seq_i, seq_j, match, mismatch, gap, scoring_matrix)
-    else:
-        _, _, score = needleman_wunsch(seq_i, seq_j, match, mismatch, gap, gap_open, gap_extend, scoring_matrix)
-    max_len = max(len(seq_i), len(seq_j))
-    normalized = -score / max_len if max_len > 0 else 0
-    return i, j, normalized
+    # Функция для parallel вычисления расстояний: i, j - массивы индексов блока пар;
+    # возвращает i, j, дистанции и сырые значения (edit distance или score) - их хранит кэш
+    i, j, sequences, match, mismatch, gap, gap_open, gap_extend, scoring_matrix, distance = args
+    i, j = np.atleast_1d(i), np.atleast_1d(j)
+    max_len = np.array([max(len(sequences[p]), len(sequences[q])) for p, q in zip(i, j)], dtype=float)
+    if distance == "edit":
+        edits = np.array([edit_distance(sequences[p], sequences[q]) for p, q in zip(i, j)], dtype=float)
+        return i, j, _normalize(edits, max_len, distance), edits
+    # для дистанции нужен только score, без traceback; короткие пары блока считаются пачкой (align_batch),
+    # длинные - по одной движком по модели стоимости (две строки DP, band, WFA)
+    results = align_batch([(sequences[p], sequences[q]) for p, q in zip(i, j)], "global", match, mismatch, gap,
+                          gap_open, gap_extend, scoring_matrix, num_workers=1)
+    scores = np.array([r.score for r in results], dtype=float)
+    for k, (p, q) in enumerate(zip(i, j)):
+        if sequences[p] == sequences[q]:
+            scores[k] = len(sequences[p]) * match  # For identical, max score
+    return i, j, _normalize(scores, max_len, distance), scores
 
 
 def compute_distance_matrix(
@@ -37,70 +105,368 @@ def compute_distance_matrix(
         gap_open: Optional[int] = None,
         gap_extend: Optional[int] = None,
         scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
-        threads: int = cpu_count()
+        threads: int = cpu_count(),
+        distance: str = "align",
+        cache: Optional[ResultCache] = None
 ) -> np.ndarray:
-    # дистанционная матрица с параллелизацией
+    # дистанционная матрица с параллелизацией; с cache в пул уходят только пары, которых в нем нет
     n = len(sequences)
     if n > 100:
-        raise MSAError("Слишком много последовательностей для MSA (max 100)")
+        raise MSAError("Слишком много последовательностей для полной матрицы дистанций (max 100), "
+                       "нужен embedded_guide_tree")
+    if distance not in DISTANCES:
+        raise MSAError(f"Неизвестная дистанция '{distance}'. Доступны: {', '.join(DISTANCES)}")
+    if distance == "kmer":
+        # k-меры считаются за миллисекунды - ни пул, ни кэш не нужны
+        return kmer_distance_matrix(sequences)
     dist = np.zeros((n, n))
-    tasks = [(i, j, sequences, match, mismatch, gap, gap_open, gap_extend, scoring_matrix) for i in range(n) for j in range(i + 1, n)]
+    rows, cols = np.triu_indices(n, 1)
+    keys = [ResultCache.key(sequences[i], sequences[j], f"msa-{distance}", scoring_matrix, match=match,
+                            mismatch=mismatch, gap=gap, gap_open=gap_open, gap_extend=gap_extend)
+            for i, j in zip(rows, cols)] if cache is not None else []
+    cached = lookup_many(cache, keys)
+    if cached:
+        hit = np.array(sorted(cached))
+        max_len = np.array([max(len(sequences[i]), len(sequences[j])) for i, j in zip(rows[hit], cols[hit])],
+                           dtype=float)
+        raw = np.array([cached[k][0] for k in hit], dtype=float)
+        dist[rows[hit], cols[hit]] = dist[cols[hit], rows[hit]] = _normalize(raw, max_len, distance)
+        missing = np.setdiff1d(np.arange(len(rows)), hit)
+        rows, cols, keys = rows[missing], cols[missing], [keys[k] for k in missing]
+    if len(rows) == 0:
+        return dist
+
+    # задача пула - блок пар, а не одна пара: внутри блока пары выравниваются пачками
+    blocks = max(1, min(threads, -(-len(rows) // BATCH_SIZE)))
+    tasks = [(i, j, sequences, match, mismatch, gap, gap_open, gap_extend, scoring_matrix, distance)
+             for i, j in zip(np.array_split(rows, blocks), np.array_split(cols, blocks))]
 
     with Pool(threads) as pool:
         results = pool.map(pairwise_distance, tasks)
 
-    for i, j, normalized in results:
-        dist[i][j] = dist[j][i] = normalized
+    for i, j, normalized, _ in results:
+        dist[i, j] = dist[j, i] = normalized
+    if cache is not None:
+        raw = np.concatenate([values for _, _, _, values in results])
+        for key, value in zip(keys, raw):
+            cache.put(key, int(value))
     return dist
 
 
-def build_guide_tree(dist: np.ndarray) -> List[Tuple[int, int]]:
-    # guide tree
-    n = dist.shape[0]
-    clusters = [[i] for i in range(n)]
-    tree = []
-    current_dist = dist.copy()
+@numba.jit(nopython=True, cache=True)
+def _join(dist: np.ndarray, neighbor_joining: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # агломеративная кластеризация: на каждом шаге - пара активных кластеров (строк dist) с наименьшей
+    # дистанцией (UPGMA) или наименьшим Q (NJ); объединенный кластер занимает строку левого, его дистанции
+    # пересчитываются на месте по формуле Lance-Williams. Возвращает строки пар и длины ветвей к ним
+    n = len(dist)
+    d = dist.copy()
+    active = np.ones(n, dtype=np.bool_)
+    size = np.ones(n, dtype=np.float64)
+    height = np.zeros(n, dtype=np.float64)
+    sums = d.sum(axis=1)
+    pairs = np.empty((max(n - 1, 0), 2), dtype=np.int64)
+    lengths = np.empty((max(n - 1, 0), 2), dtype=np.float64)
+    for step in range(n - 1):
+        r = n - step
+        best, bi, bj = np.inf, -1, -1
+        for i in range(n):
+            if not active[i]:
+                continue
+            for j in range(i + 1, n):
+                if not active[j]:
+                    continue
+                value = d[i, j]
+                if neighbor_joining and r > 2:
+                    value = (r - 2) * d[i, j] - sums[i] - sums[j]
+                if bi < 0 or value < best:
+                    best, bi, bj = value, i, j
+        dij = d[bi, bj]
+        if neighbor_joining:
+            li = dij / 2 + ((sums[bi] - sums[bj]) / (2 * (r - 2)) if r > 2 else 0.0)
+            li, lj = max(li, 0.0), max(dij - li, 0.0)
+        else:
+            li, lj = dij / 2 - height[bi], dij / 2 - height[bj]
+            height[bi] = dij / 2
+        total = 0.0
+        for k in range(n):
+            if not active[k] or k == bi or k == bj:
+                continue
+            if neighbor_joining:
+                value = (d[bi, k] + d[bj, k] - dij) / 2
+                sums[k] += value - d[bi, k] - d[bj, k]
+            else:
+                value = (size[bi] * d[bi, k] + size[bj] * d[bj, k]) / (size[bi] + size[bj])
+            d[bi, k] = d[k, bi] = value
+            total += value
+        sums[bi] = total
+        size[bi] += size[bj]
+        active[bj] = False
+        pairs[step, 0], pairs[step, 1] = bi, bj
+        lengths[step, 0], lengths[step, 1] = li, lj
+    return pairs, lengths
 
-    while len(clusters) > 1:
-        nonzero = np.nonzero(current_dist)
-        if len(nonzero[0]) == 0 or np.all(current_dist[nonzero] == 0):
-            for k in range(1, len(clusters)):
-                tree.append((0, k))
-            break
-        min_val = np.min(current_dist[nonzero])
-        i, j = np.where(current_dist == min_val)
-        i, j = i[0], j[0]
+
+def join_clusters(dist: np.ndarray, method: str = "upgma") -> Tuple[List[Tuple[int, int]], List[Tuple[float, float]]]:
+    # guide tree и длины ветвей (i, j) каждого слияния. Слияния - в соглашении progressive_align: (i, j),
+    # i < j - позиции в текущем списке кластеров, после слияния оба убираются, новый дописывается в конец
+    if method not in TREE_METHODS:
+        raise MSAError(f"Неизвестный метод guide tree '{method}'. Доступны: {', '.join(TREE_METHODS)}")
+    dist = np.nan_to_num(np.asarray(dist, dtype=np.float64))
+    pairs, branch = _join(dist, method == "nj")
+    order = list(range(len(dist)))
+    tree, lengths = [], []
+    for (a, b), (la, lb) in zip(pairs, branch):
+        i, j = order.index(a), order.index(b)
         if i > j:
-            i, j = j, i
+            i, j, la, lb = j, i, lb, la
         tree.append((i, j))
-        new_cluster = clusters[i] + clusters[j]
-        clusters = [c for k, c in enumerate(clusters) if k not in (i, j)] + [new_cluster]
-        new_dist = np.full((len(clusters), len(clusters)), np.inf)
-        for a in range(len(clusters)):
-            for b in range(a + 1, len(clusters)):
-                scores = [current_dist[p, q] for p in clusters[a] for q in clusters[b] if p != q and 0 <= p < current_dist.shape[0] and 0 <= q < current_dist.shape[0]]
-                if scores:
-                    avg = np.mean(scores)
-                else:
-                    avg = 0.0
-                new_dist[a, b] = new_dist[b, a] = avg if not np.isnan(avg) else 0.0
-        current_dist = new_dist
+        lengths.append((float(la), float(lb)))
+        order.pop(j)
+        order.pop(i)
+        order.append(a)
+    return tree, lengths
+
+
+def build_guide_tree(dist: np.ndarray, method: str = "upgma") -> List[Tuple[int, int]]:
+    # guide tree
+    return join_clusters(dist, method)[0]
+
+
+def to_newick(tree: List[Tuple[int, int]], names: List[str],
+              lengths: Optional[List[Tuple[float, float]]] = None) -> str:
+    # Newick-строка guide tree; символы, служебные для Newick, в именах заменяются на "_"
+    nodes = [re.sub(r"[\s(),:;\[\]']", "_", name) for name in names]
+    for k, (i, j) in enumerate(tree):
+        if lengths is None:
+            left, right = nodes[i], nodes[j]
+        else:
+            left, right = f"{nodes[i]}:{lengths[k][0]:.5g}", f"{nodes[j]}:{lengths[k][1]:.5g}"
+        nodes.pop(j)
+        nodes.pop(i)
+        nodes.append(f"({left},{right})")
+    return (nodes[0] if nodes else "") + ";"
+
 
+def _nest(tree: List[Tuple[int, int]], members: List) -> object:
+    # слияния guide tree над members -> вложенные пары (лист - номер последовательности)
+    nodes = list(members)
+    for i, j in tree:
+        node = (nodes[i], nodes[j])
+        nodes.pop(j)
+        nodes.pop(i)
+        nodes.append(node)
+    return nodes[0]
+
+
+def _flatten(root: object, n: int) -> List[Tuple[int, int]]:
+    # вложенные пары -> слияния в соглашении progressive_align (обход в post-order без рекурсии)
+    order = list(range(n))
+    tree = []
+    done = []
+    next_key = n
+    stack = [(root, False)]
+    while stack:
+        node, ready = stack.pop()
+        if not isinstance(node, tuple):
+            done.append(node)
+        elif not ready:
+            stack += [(node, True), (node[1], False), (node[0], False)]
+        else:
+            right, left = done.pop(), done.pop()
+            i, j = sorted((order.index(left), order.index(right)))
+            tree.append((i, j))
+            order.pop(j)
+            order.pop(i)
+            order.append(next_key)
+            done.append(next_key)
+            next_key += 1
     return tree
 
 
-def get_consensus_columnwise(group: List[str]) -> str:
-    consensus = ''
-    for chars in zip(*group):
-        non_gap_chars = [c for c in chars if c != '-']
-        if non_gap_chars:
-            counts = {c: non_gap_chars.count(c) for c in set(non_gap_chars)}
-            max_count = max(counts.values())
-            candidates = [c for c, count in counts.items() if count == max_count]
-            consensus += random.choice(candidates) if len(candidates) > 1 else candidates[0]
+def _bisect(vectors: np.ndarray, members: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # деление кластера 2-means; начальные центры - самая далекая от центроида точка и самая далекая от нее
+    points = vectors[members]
+    first = np.argmax(((points - points.mean(axis=0)) ** 2).sum(axis=1))
+    second = np.argmax(((points - points[first]) ** 2).sum(axis=1))
+    centers = points[[first, second]]
+    side = np.zeros(len(points), dtype=bool)
+    for _ in range(KMEANS_ITERATIONS):
+        new_side = ((points - centers[1]) ** 2).sum(axis=1) < ((points - centers[0]) ** 2).sum(axis=1)
+        if new_side.all() or not new_side.any() or np.array_equal(new_side, side):
+            side = new_side
+            break
+        side = new_side
+        centers = np.array([points[~side].mean(axis=0), points[side].mean(axis=0)])
+    if side.all() or not side.any():
+        # все векторы совпадают - пополам
+        side = np.arange(len(points)) >= len(points) // 2
+    return members[~side], members[side]
+
+
+def embedded_guide_tree(
+        sequences: List[str],
+        match: int = 1,
+        mismatch: int = -1,
+        gap: int = -2,
+        gap_open: Optional[int] = None,
+        gap_extend: Optional[int] = None,
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
+        threads: int = cpu_count(),
+        distance: str = "align",
+        cache: Optional[ResultCache] = None,
+        method: str = "upgma",
+        cluster_size: int = EMBED_CLUSTER_SIZE
+) -> List[Tuple[int, int]]:
+    # guide tree без полной матрицы дистанций (mBed): каждая последовательность - вектор k-мерных дистанций
+    # до seeds (равномерно по длине), bisecting k-means делит векторы до кластеров не больше cluster_size,
+    # внутри кластера - полная матрица дистанции distance и join_clusters, над кластерами - дерево делений.
+    # Дистанций distance - O(n * cluster_size), k-мерных - O(n log n)
+    n = len(sequences)
+    if distance not in DISTANCES:
+        raise MSAError(f"Неизвестная дистанция '{distance}'. Доступны: {', '.join(DISTANCES)}")
+    if method not in TREE_METHODS:
+        raise MSAError(f"Неизвестный метод guide tree '{method}'. Доступны: {', '.join(TREE_METHODS)}")
+    cluster_size = max(1, min(cluster_size, EMBED_CLUSTER_SIZE))
+    by_length = np.argsort([len(s) for s in sequences], kind="stable")
+    seeds = min(n, int(np.ceil(EMBED_SEEDS_PER_LOG * np.log2(max(n, 2)))))
+    seeds = np.unique(by_length[np.linspace(0, n - 1, seeds).astype(np.int64)])
+    vectors = kmer_distance_matrix(sequences, columns=seeds)
+
+    def subtree(members: np.ndarray) -> object:
+        if len(members) == 1:
+            return int(members[0])
+        dist = compute_distance_matrix([sequences[m] for m in members], match, mismatch, gap, gap_open, gap_extend,
+                                       scoring_matrix, threads, distance, cache)
+        return _nest(join_clusters(dist, method)[0], [int(m) for m in members])
+
+    # деления - стеком, без рекурсии: k-means может отщеплять по несколько точек
+    built = []
+    stack = [(np.arange(n), False)]
+    while stack:
+        members, ready = stack.pop()
+        if ready:
+            right, left = built.pop(), built.pop()
+            built.append((left, right))
+        elif len(members) <= cluster_size:
+            built.append(subtree(members))
         else:
-            consensus += '-'
-    return consensus
+            left, right = _bisect(vectors, members)
+            stack += [(members, True), (right, False), (left, False)]
+    return _flatten(built[0], n)
+
+
+# gap в строках MSABlock
+_GAP_BYTE = ord("-")
+# score выравнивания профилей - в фиксированной точке: score пар столбцов и штрафы gaps умножаются на
+# PROFILE_SCALE и округляются, DP остается целочисленным (_compiled_fill)
+PROFILE_SCALE = 100
+# сколько байт float64 score столбцов считается за один шаг (_scaled_profile_scores)
+PROFILE_BLOCK_BYTES = 1 << 22
+
+
+class MSABlock:
+    # выравненная группа: rows - 2-D uint8 (последовательность x столбец) с исходными символами и b"-" в gaps,
+    # counts - профиль: число каждого кода ALPHABET в столбце (gaps - в GAP_CODE). Слияние двух блоков по
+    # выравниванию профилей - scatter столбцов обоих блоков в новые позиции; профиль складывается из
+    # профилей блоков, строки заново не просматриваются
+
+    def __init__(self, rows: np.ndarray, counts: np.ndarray):
+        self.rows = rows
+        self.counts = counts
+
+    @classmethod
+    def from_sequence(cls, seq: str) -> "MSABlock":
+        codes = encode_sequence(seq)
+        counts = np.zeros((len(codes), ALPHABET_SIZE), dtype=np.int32)
+        counts[np.arange(len(codes)), codes] = 1
+        return cls(np.frombuffer(seq.encode("latin-1", "replace"), dtype=np.uint8)[None, :].copy(), counts)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def width(self) -> int:
+        return self.rows.shape[1]
+
+    def sequences(self) -> List[str]:
+        return [row.tobytes().decode("latin-1") for row in self.rows]
+
+    def consensus(self) -> np.ndarray:
+        # коды самого частого не-gap символа столбца (при равенстве - первый в ALPHABET), GAP_CODE - если
+        # в столбце одни gaps
+        residues = self.counts.copy()
+        residues[:, GAP_CODE] = 0
+        codes = residues.argmax(axis=1).astype(np.uint8)
+        codes[residues.max(axis=1) == 0] = GAP_CODE
+        return codes
+
+    def _scatter(self, columns: np.ndarray, width: int) -> Tuple[np.ndarray, np.ndarray]:
+        # столбцы блока -> позиции columns среди width столбцов, остальные - gaps
+        rows = np.full((len(self), width), _GAP_BYTE, dtype=np.uint8)
+        rows[:, columns] = self.rows
+        counts = np.zeros((width, ALPHABET_SIZE), dtype=np.int32)
+        counts[:, GAP_CODE] = len(self)
+        counts[columns] = self.counts
+        return rows, counts
+
+    def merge(self, other: "MSABlock", ops: np.ndarray) -> "MSABlock":
+        # блок из self и other по ops выравнивания их профилей (OP_DEL - столбец только self, OP_INS - только other)
+        rows1, counts1 = self._scatter(np.flatnonzero(ops != OP_INS), len(ops))
+        rows2, counts2 = other._scatter(np.flatnonzero(ops != OP_DEL), len(ops))
+        return MSABlock(np.vstack((rows1, rows2)), counts1 + counts2)
+
+
+def profile_scores(block1: MSABlock, block2: MSABlock, table: np.ndarray, rows: slice = slice(None)) -> np.ndarray:
+    # score пар столбцов: средний score пар остатков, F1 @ table @ F2.T, F - доли кодов в столбцах;
+    # пары с gap дают 0. rows - только эти столбцы block1 (строки результата)
+    weights = table.astype(np.float64)
+    weights[GAP_CODE, :] = 0
+    weights[:, GAP_CODE] = 0
+    return (block1.counts[rows] / len(block1)) @ weights @ (block2.counts / len(block2)).T
+
+
+def _scaled_profile_scores(block1: MSABlock, block2: MSABlock, table: np.ndarray) -> np.ndarray:
+    # profile_scores * PROFILE_SCALE, округленные до int64; считается блоками по PROFILE_BLOCK_BYTES строк,
+    # чтобы рядом с итоговой матрицей не было полноразмерной float64 копии
+    n, m = block1.width, block2.width
+    scores = np.empty((n, m), dtype=np.int64)
+    step = max(1, PROFILE_BLOCK_BYTES // (8 * m))
+    for start in range(0, n, step):
+        part = profile_scores(block1, block2, table, slice(start, start + step))
+        part *= PROFILE_SCALE
+        np.rint(part, out=part)
+        scores[start:start + step] = part
+    return scores
+
+
+def profile_align(
+        block1: MSABlock,
+        block2: MSABlock,
+        match: int = 1,
+        mismatch: int = -1,
+        gap: int = -2,
+        gap_open: Optional[int] = None,
+        gap_extend: Optional[int] = None,
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None
+) -> np.ndarray:
+    # глобальное выравнивание профилей двух блоков, ops для MSABlock.merge: "последовательности" DP - номера
+    # столбцов, таблица score - profile_scores, заполнение и traceback - compiled. Если матрица указателей
+    # вместе с int64 таблицей score (n x m) не влезает в MATRIX_MEMORY_BUDGET - выравниваются консенсусы
+    # (needleman_wunsch в линейной памяти)
+    n, m = block1.width, block2.width
+    affine = gap_open is not None and gap_extend is not None
+    if n == 0 or m == 0:
+        return np.array([OP_DEL] * n + [OP_INS] * m, dtype=np.uint8)
+    needed = _pointer_bytes(n + 1, m + 1, AFFINE_BITS if affine else LINEAR_BITS) + 8 * n * m + PROFILE_BLOCK_BYTES
+    if needed > MATRIX_MEMORY_BUDGET:
+        return needleman_wunsch(block1.consensus(), block2.consensus(), match, mismatch, gap, gap_open, gap_extend,
+                                scoring_matrix).ops()
+    table = score_table(match, mismatch, scoring_matrix)
+    scores = _scaled_profile_scores(block1, block2, table)
+    ops, _, _, _ = _align_encoded(np.arange(n), np.arange(m), scores, gap * PROFILE_SCALE,
+                                  gap_open * PROFILE_SCALE if affine else None,
+                                  gap_extend * PROFILE_SCALE if affine else None, False, None, "compiled")
+    return ops
 
 
 def progressive_align(
@@ -113,45 +479,24 @@ def progressive_align(
         gap_extend: Optional[int] = None,
         scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None
 ) -> List[str]:
-    alignments = [[s] for s in sequences]
+    blocks = [MSABlock.from_sequence(s) for s in sequences]
 
     for merge in tree:
         logging.debug(f"Merging clusters {merge}")
         i, j = min(merge), max(merge)  # Ensure i < j
-        align_i = alignments[i]
-        align_j = alignments[j]
-
-        cons_i = get_consensus_columnwise(align_i)
-        cons_j = get_consensus_columnwise(align_j)
-
-        prof_align1, prof_align2, _ = needleman_wunsch(cons_i, cons_j, match, mismatch, gap, gap_open, gap_extend, scoring_matrix)
-
-        def expand_alignment(original_group, profile_alignment):
-            expanded = []
-            for seq in original_group:
-                new_seq = []
-                pos = 0
-                for char in profile_alignment:
-                    if char == '-':
-                        new_seq.append('-')
-                    else:
-                        new_seq.append(seq[pos])
-                        pos += 1
-                expanded.append(''.join(new_seq))
-            return expanded
-
-        new_align_i = expand_alignment(align_i, prof_align1)
-        new_align_j = expand_alignment(align_j, prof_align2)
-        new_align = new_align_i + new_align_j
-
-        alignments.pop(j)
-        alignments.pop(i)
-        alignments.append(new_align)
-
-    final_align = alignments[0]
-    consensus = get_consensus_columnwise(final_align)
-    logging.info(f"Consensus sequence: {consensus}")
-    return final_align
+        block_i = blocks[i]
+        block_j = blocks[j]
+
+        ops = profile_align(block_i, block_j, match, mismatch, gap, gap_open, gap_extend, scoring_matrix)
+        new_block = block_i.merge(block_j, ops)
+
+        blocks.pop(j)
+        blocks.pop(i)
+        blocks.append(new_block)
+
+    final_block = blocks[0]
+    logging.info(f"Consensus sequence: {decode_sequence(final_block.consensus())}")
+    return final_block.sequences()
 
 
 def multiple_sequence_alignment(
@@ -162,11 +507,25 @@ def multiple_sequence_alignment(
         gap_open: Optional[int] = None,
         gap_extend: Optional[int] = None,
         scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
-        threads: int = cpu_count()
-) -> List[str]:
-
+        threads: int = cpu_count(),
+        distance: str = "align",
+        cache: Optional[ResultCache] = None,
+        tree_method: str = "upgma",
+        return_tree: bool = False,
+        embed_above: int = EMBED_THRESHOLD
+) -> Union[List[str], Tuple[List[str], str]]:
+    # return_tree=True - еще guide tree в Newick (листья Seq1..SeqN по порядку входных последовательностей);
+    # больше embed_above последовательностей - embedded guide tree (в Newick тогда без длин ветвей)
     if len(sequences) < 2:
         raise MSAError("Нужны хотя бы 2 последовательности для MSA")
-    dist = compute_distance_matrix(sequences, match, mismatch, gap, gap_open, gap_extend, scoring_matrix, threads)
-    tree = build_guide_tree(dist)
-    return progressive_align(sequences, tree, match, mismatch, gap, gap_open, gap_extend, scoring_matrix)
\ No newline at end of file
+    if len(sequences) > embed_above:
+        tree, lengths = embedded_guide_tree(sequences, match, mismatch, gap, gap_open, gap_extend, scoring_matrix,
+                                            threads, distance, cache, tree_method), None
+    else:
+        dist = compute_distance_matrix(sequences, match, mismatch, gap, gap_open, gap_extend, scoring_matrix,
+                                       threads, distance, cache)
+        tree, lengths = join_clusters(dist, tree_method)
+    aligned = progressive_align(sequences, tree, match, mismatch, gap, gap_open, gap_extend, scoring_matrix)
+    if return_tree:
+        return aligned, to_newick(tree, [f"Seq{k + 1}" for k in range(len(sequences))], lengths)
+    return aligned
\ No newline at end of file
@@ -1,106 +1,316 @@
 import numpy as np
-from typing import Tuple, Optional, Dict
-from collections import defaultdict
-from aligner.algorithms import _get_pair_score, smith_waterman, needleman_wunsch
+import numba
+from functools import partial
+from typing import List, Tuple, Optional, Dict, Union
+from aligner.algorithms import _NEG_INF, _prepare_sequences, needleman_wunsch, Alignment, ScoreResult
+# единственная реализация Hirschberg - compiled-версия из linear_space (импорт для совместимости)
+from aligner.linear_space import hirschberg_needleman_wunsch
+from aligner.scoring import ALPHABET_SIZE, SeqLike
+from aligner.suffix_array import SuffixArrayIndex
 
+# Seed-and-extend (как в BLAST): точные совпадения k-меров - затравки, без gaps каждая продлевается в обе стороны
+# до X-drop (score упал на x_drop ниже лучшего), затравки на диагонали, уже покрытой продлением, пропускаются.
+# Лучшие из найденных HSP продлеваются с gaps тем же X-drop по строкам DP (в строке живут только ячейки, не
+# упавшие ниже лучшего на x_drop), и только прямоугольник лучшего gapped-продления выравнивается заново - banded
+# needleman_wunsch с bandwidth="auto". Стоимость растет с числом затравок, а не с произведением длин.
 
-def hirschberg_needleman_wunsch(
-        seq1: str,
-        seq2: str,
-        match_score: int = 1,
-        mismatch_score: int = -1,
-        gap_penalty: int = -2,
-        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None
-) -> Tuple[str, str, int]:
-    seq1 = seq1.upper()
-    seq2 = seq2.upper()
-    n, m = len(seq1), len(seq2)
+# seeding="smem" - затравки не k-меры, а супер-максимальные точные совпадения (SMEM) любой длины не меньше k
+# из суффиксного массива seq2 (aligner.suffix_array): на повторах одна длинная затравка вместо сотен k-меров.
+
+# k по умолчанию: для нуклеотидов - 11, для белков - 3
+NUCLEOTIDES = frozenset("ACGTUN")
+SEEDINGS = ("kmer", "smem")
+# SMEM с большим числом вхождений в target - повтор, затравкой не берется (как -c 500 в BWA-MEM)
+MAX_SEED_OCCURRENCES = 500
+
+
+@numba.jit(nopython=True, cache=True)
+def _kmer_keys(codes: np.ndarray, k: int, base: int) -> np.ndarray:
+    # ключ k-мера, начинающегося в каждой позиции; при k, не влезающем в int64, ключ - хэш по модулю 2^64,
+    # совпадения затравок все равно проверяются по кодам
+    count = max(len(codes) - k + 1, 0)
+    keys = np.empty(count, dtype=np.int64)
+    top = 1
+    for _ in range(k - 1):
+        top *= base
+    key = 0
+    for p in range(len(codes)):
+        if p >= k:
+            key -= codes[p - k] * top
+        key = key * base + codes[p]
+        if p >= k - 1:
+            keys[p - k + 1] = key
+    return keys
 
-    if n == 0:
-        return '-' * m, seq2, gap_penalty * m
-    if m == 0:
-        return seq1, '-' * n, gap_penalty * n
-    if n == 1 or m == 1:
-        return needleman_wunsch(seq1, seq2, match_score, mismatch_score, gap_penalty, scoring_matrix)
 
-    mid = n // 2
-    score_left = _compute_nw_row(seq1[:mid], seq2, match_score, mismatch_score, gap_penalty, scoring_matrix)
-    score_right = _compute_nw_row(seq1[mid:][::-1], seq2[::-1], match_score, mismatch_score, gap_penalty,
-                                  scoring_matrix)[::-1]
+@numba.jit(nopython=True, cache=True)
+def _extend_seed(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        i: int,
+        j: int,
+        k: int,
+        seed: int,
+        x_drop: int,
+        reach: np.ndarray
+) -> int:
+    # score HSP без gaps вокруг точной затравки a[i:i + k] == b[j:j + k] (seed - ее score); reach[d] - до какой
+    # позиции a уже продлена диагональ d = j - i + n
+    n, m = len(a), len(b)
+    # вправо от затравки
+    score, best, end = 0, 0, 0
+    t = 0
+    while i + k + t < n and j + k + t < m:
+        score += table[a[i + k + t], b[j + k + t]]
+        t += 1
+        if score > best:
+            best, end = score, t
+        elif score < best - x_drop:
+            break
+    right = best
+    reach[j - i + n] = i + k + end
+    # влево от затравки
+    score, best = 0, 0
+    t = 0
+    while i - t > 0 and j - t > 0:
+        t += 1
+        score += table[a[i - t], b[j - t]]
+        if score > best:
+            best = score
+        elif score < best - x_drop:
+            break
+    return seed + right + best
 
-    split = np.argmax(score_left + score_right)
 
-    align1_left, align2_left, _ = hirschberg_needleman_wunsch(seq1[:mid], seq2[:split], match_score, mismatch_score,
-                                                              gap_penalty, scoring_matrix)
-    align1_right, align2_right, _ = hirschberg_needleman_wunsch(seq1[mid:], seq2[split:], match_score, mismatch_score,
-                                                                gap_penalty, scoring_matrix)
+@numba.jit(nopython=True, cache=True)
+def _ungapped_hsps(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        k: int,
+        keys_a: np.ndarray,
+        order_b: np.ndarray,
+        sorted_b: np.ndarray,
+        x_drop: int
+) -> List[Tuple[int, int, int]]:
+    # HSP без gaps: (score, i, j) затравки
+    n, m = len(a), len(b)
+    reach = np.zeros(n + m + 1, dtype=np.int64)
+    hsps = [(0, 0, 0)]
+    hsps.pop()
+    for i in range(len(keys_a)):
+        first = np.searchsorted(sorted_b, keys_a[i])
+        for p in range(first, len(sorted_b)):
+            if sorted_b[p] != keys_a[i]:
+                break
+            j = order_b[p]
+            if i < reach[j - i + n]:
+                continue
+            seed = 0
+            exact = True
+            for t in range(k):
+                if a[i + t] != b[j + t]:
+                    exact = False
+                    break
+                seed += table[a[i + t], b[j + t]]
+            if not exact:
+                continue
+            hsps.append((_extend_seed(a, b, table, i, j, k, seed, x_drop, reach), i, j))
+    return hsps
 
-    full_align1 = align1_left + align1_right
-    full_align2 = align2_left + align2_right
-    full_score = score_left[split] + score_right[split]
 
-    return full_align1, full_align2, full_score
+@numba.jit(nopython=True, cache=True)
+def _mem_hsps(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        seed_i: np.ndarray,
+        seed_j: np.ndarray,
+        seed_length: np.ndarray,
+        x_drop: int
+) -> List[Tuple[int, int, int]]:
+    # HSP без gaps из точных совпадений произвольной длины (по возрастанию seed_i): (score, i, j) затравки
+    n, m = len(a), len(b)
+    reach = np.zeros(n + m + 1, dtype=np.int64)
+    hsps = [(0, 0, 0)]
+    hsps.pop()
+    for s in range(len(seed_i)):
+        i, j, k = seed_i[s], seed_j[s], seed_length[s]
+        if i < reach[j - i + n]:
+            continue
+        seed = 0
+        for t in range(k):
+            seed += table[a[i + t], b[j + t]]
+        hsps.append((_extend_seed(a, b, table, i, j, k, seed, x_drop, reach), i, j))
+    return hsps
 
 
-def _compute_nw_row(
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _xdrop_extend(
+        a: np.ndarray,
+        b: np.ndarray,
+        table: np.ndarray,
+        gap_open: int,
+        gap_extend: int,
+        linear: bool,
+        i0: int,
+        j0: int,
+        forward: bool,
+        x_drop: int
+) -> Tuple[int, int, int]:
+    # gapped X-drop от (i0, j0) вперед (a[i0:], b[j0:]) или назад (a[:i0], b[:j0] с конца); строка r, столбец c -
+    # r символов a и c символов b от точки старта. В строке считаются только столбцы [lo, hi], где ячейки
+    # предыдущей строки еще живы; ячейка ниже лучшего score на x_drop умирает. Возвращает (best, r, c) -
+    # лучший score ячейки, заканчивающейся парой символов. Модель gaps та же, что у _fill_affine
+    rows = len(a) - i0 if forward else i0
+    cols = len(b) - j0 if forward else j0
+    M_prev = np.full(cols + 1, _NEG_INF, dtype=np.int64)
+    X_prev = np.full(cols + 1, _NEG_INF, dtype=np.int64)
+    Y_prev = np.full(cols + 1, _NEG_INF, dtype=np.int64)
+    M_curr = np.full(cols + 1, _NEG_INF, dtype=np.int64)
+    X_curr = np.full(cols + 1, _NEG_INF, dtype=np.int64)
+    Y_curr = np.full(cols + 1, _NEG_INF, dtype=np.int64)
+    best, best_r, best_c = 0, 0, 0
+    M_prev[0] = 0
+    lo, hi = 0, 0
+    for c in range(1, cols + 1):
+        Y_prev[c] = gap_open if c == 1 else Y_prev[c - 1] + gap_extend
+        if Y_prev[c] < -x_drop:
+            break
+        hi = c
+
+    for r in range(1, rows + 1):
+        ai = a[i0 + r - 1] if forward else a[i0 - r]
+        new_lo, new_hi = -1, -1
+        left_M, left_X, left_Y = _NEG_INF, _NEG_INF, _NEG_INF
+        c = lo
+        while c <= cols:
+            if c > hi + 1 and max(left_M, max(left_X, left_Y)) == _NEG_INF:
+                break
+            M, X, Y = _NEG_INF, _NEG_INF, _NEG_INF
+            if c >= 1 and lo <= c - 1 <= hi:
+                bj = b[j0 + c - 1] if forward else b[j0 - c]
+                M = max(M_prev[c - 1], max(X_prev[c - 1], Y_prev[c - 1])) + table[ai, bj]
+            if c <= hi:
+                if linear:
+                    X = max(M_prev[c], max(X_prev[c], Y_prev[c])) + gap_open
+                else:
+                    X = max(M_prev[c] + gap_open, X_prev[c] + gap_extend)
+            if linear:
+                Y = max(left_M, max(left_X, left_Y)) + gap_open
+            else:
+                Y = max(left_M + gap_open, left_Y + gap_extend)
+            if max(M, max(X, Y)) < best - x_drop:
+                M, X, Y = _NEG_INF, _NEG_INF, _NEG_INF
+            else:
+                if new_lo < 0:
+                    new_lo = c
+                new_hi = c
+                if M > best:
+                    best, best_r, best_c = M, r, c
+            M_curr[c], X_curr[c], Y_curr[c] = M, X, Y
+            left_M, left_X, left_Y = M, X, Y
+            c += 1
+        if new_lo < 0:
+            break
+        lo, hi = new_lo, new_hi
+        M_prev, M_curr = M_curr, M_prev
+        X_prev, X_curr = X_curr, X_prev
+        Y_prev, Y_curr = Y_curr, Y_prev
+    return best, best_r, best_c
+
+
+def _rectangle_alignment(
         seq1: str,
         seq2: str,
+        start_i: int,
+        start_j: int,
         match_score: int,
         mismatch_score: int,
         gap_penalty: int,
-        scoring_matrix: Optional[Dict[Tuple[str, str], int]]
-) -> np.ndarray:
-    m = len(seq2)
-    prev = np.arange(0, gap_penalty * (m + 1), gap_penalty)
-    for char1 in seq1:
-        curr = np.zeros(m + 1, dtype=int)
-        curr[0] = prev[0] + gap_penalty
-        for j in range(1, m + 1):
-            pair_score = _get_pair_score(char1, seq2[j - 1], match_score, mismatch_score, scoring_matrix)
-            curr[j] = max(
-                prev[j - 1] + pair_score,
-                prev[j] + gap_penalty,
-                curr[j - 1] + gap_penalty
-            )
-        prev = curr
-    return prev
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]],
+        gap_open: Optional[int],
+        gap_extend: Optional[int]
+) -> Alignment:
+    # traceback только по прямоугольнику лучшего HSP (seq1, seq2 уже обрезаны по его концу)
+    return needleman_wunsch(seq1[start_i:], seq2[start_j:], match_score, mismatch_score, gap_penalty, gap_open,
+                            gap_extend, scoring_matrix, bandwidth="auto").offset(seq1, seq2, start_i, start_j)
 
 
 def heuristic_local_align(
-        seq1: str,
-        seq2: str,
-        k: int = 3,
+        seq1: SeqLike,
+        seq2: SeqLike,
+        k: Optional[int] = None,
         match_score: int = 1,
         mismatch_score: int = -1,
         gap_penalty: int = -2,
-        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None
-) -> Tuple[str, str, int]:
-    index = defaultdict(list)
-    for i in range(len(seq2) - k + 1):
-        kmer = seq2[i:i + k]
-        index[kmer].append(i)
-
-    best_score = 0
-    best_align = ("", "", 0)
-    for i in range(len(seq1) - k + 1):
-        kmer = seq1[i:i + k]
-        for j in index.get(kmer, []):
-            left1 = seq1[:i]
-            left2 = seq2[:j]
-            right1 = seq1[i + k:]
-            right2 = seq2[j + k:]
-
-            _, _, left_score = smith_waterman(left1[::-1], left2[::-1], match_score, mismatch_score, gap_penalty,
-                                              scoring_matrix)
-            _, _, right_score = smith_waterman(right1, right2, match_score, mismatch_score, gap_penalty, scoring_matrix)
-            hit_score = k * match_score + left_score + right_score
-
-            if hit_score > best_score:
-                full_align1, full_align2, full_score = smith_waterman(seq1[max(0, i - 50):i + k + 50],
-                                                                      seq2[max(0, j - 50):j + k + 50], match_score,
-                                                                      mismatch_score, gap_penalty, scoring_matrix)
-                if full_score > best_score:
-                    best_score = full_score
-                    best_align = (full_align1, full_align2, full_score)
-
-    return best_align
\ No newline at end of file
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
+        gap_open: Optional[int] = None,
+        gap_extend: Optional[int] = None,
+        x_drop: Optional[int] = None,
+        max_extensions: int = 50,
+        score_only: bool = False,
+        seeding: str = "kmer",
+        seed_index: Optional[SuffixArrayIndex] = None,
+        target: int = 0
+) -> Union[Alignment, ScoreResult]:
+    # эвристическое локальное выравнивание seed-and-extend; без затравок - пустое выравнивание со score 0.
+    # k=None - 11 для нуклеотидов и 3 для белков, x_drop=None - 20 лучших score пары;
+    # gapped-продлений не больше max_extensions (лучшие по score HSP, не лежащие внутри уже найденных);
+    # seeding="smem" - затравки SMEM длиной от k по seed_index (готовый индекс, seq2 в нем - target с номером
+    # target; без seed_index индекс строится по seq2), заданный seed_index включает smem сам
+    if seeding not in SEEDINGS:
+        raise ValueError(f"Неизвестный способ затравок '{seeding}'. Доступны: {', '.join(SEEDINGS)}")
+    if seed_index is not None:
+        seeding = "smem"
+    seq1, seq2, a, b, table = _prepare_sequences(seq1, seq2, match_score, mismatch_score, scoring_matrix)
+    if k is None:
+        k = 11 if set(seq1) | set(seq2) <= NUCLEOTIDES else 3
+    if x_drop is None:
+        x_drop = 20 * max(int(table.max()), 1)
+    linear = gap_open is None or gap_extend is None
+    go, ge = (gap_penalty, gap_penalty) if linear else (gap_open, gap_extend)
+    params = dict(match_score=match_score, mismatch_score=mismatch_score, gap_penalty=gap_penalty,
+                  scoring_matrix=scoring_matrix, gap_open=gap_open, gap_extend=gap_extend)
+
+    hsps = []
+    if seeding == "smem":
+        if seed_index is None:
+            seed_index, target = SuffixArrayIndex.build([b]), 0
+        seeds = [(i, j, length) for i, length, hits in seed_index.smems(a, k, MAX_SEED_OCCURRENCES, target)
+                 for _, j in hits]
+        if seeds:
+            seed_i, seed_j, seed_length = (np.array(column, dtype=np.int64) for column in zip(*seeds))
+            hsps = _mem_hsps(a, b, table, seed_i, seed_j, seed_length, x_drop)
+    elif len(a) >= k and len(b) >= k:
+        keys_b = _kmer_keys(b, k, ALPHABET_SIZE)
+        order_b = np.argsort(keys_b, kind="stable")
+        hsps = _ungapped_hsps(a, b, table, k, _kmer_keys(a, k, ALPHABET_SIZE), order_b, keys_b[order_b], x_drop)
+
+    best, best_rect = 0, None
+    extended = []
+    for _, i, j in sorted(hsps, key=lambda hsp: -hsp[0]):
+        if len(extended) >= max_extensions:
+            break
+        if any(si <= i < ei and sj <= j < ej for si, sj, ei, ej in extended):
+            continue
+        right, di, dj = _xdrop_extend(a, b, table, go, ge, linear, i, j, True, x_drop)
+        left, li, lj = _xdrop_extend(a, b, table, go, ge, linear, i, j, False, x_drop)
+        rect = (i - li, j - lj, i + di, j + dj)
+        extended.append(rect)
+        if right + left > best:
+            best, best_rect = right + left, rect
+
+    if best_rect is None:
+        if score_only:
+            return ScoreResult(0, 0, 0, heuristic_local_align, seq1, seq2, k=k, x_drop=x_drop,
+                               seeding=seeding, **params)
+        return Alignment.from_ops(seq1, seq2, np.empty(0, dtype=np.uint8), 0)
+    start_i, start_j, end_i, end_j = best_rect
+    if score_only:
+        score = needleman_wunsch(seq1[start_i:end_i], seq2[start_j:end_j], match_score, mismatch_score, gap_penalty,
+                                 gap_open, gap_extend, scoring_matrix, bandwidth="auto", score_only=True).score
+        return ScoreResult(score, end_i, end_j, partial(_rectangle_alignment, start_i=start_i, start_j=start_j),
+                           seq1, seq2, **params)
+    return _rectangle_alignment(seq1[:end_i], seq2[:end_j], start_i, start_j, **params)
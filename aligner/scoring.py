@@ -1,18 +1,112 @@
 from Bio.Align import substitution_matrices
-from typing import Dict, Tuple, Optional
+from functools import lru_cache
+from typing import Dict, Tuple, Optional, Union
+import numpy as np
 
-def load_scoring_matrix(name: str = "BLOSUM62") -> Dict[Tuple[str, str], int]:
+# алфавит кодирования: все буквы, стоп-кодон и gap; прочие символы -> UNKNOWN_CODE.
+# Кодирование не различает регистр: 'a' и 'A' - один код, и score пары 'a'/'A' - как у 'A'/'A'.
+# UNKNOWN_CODE не совпадает ни с чем, даже сам с собой: разные неизвестные символы неразличимы после кодирования
+ALPHABET = "ARNDCQEGHILKMFPSTWYVBZXJOU*-"
+UNKNOWN_CODE = len(ALPHABET)
+ALPHABET_SIZE = len(ALPHABET) + 1
+GAP_CODE = ALPHABET.index('-')
 
-    #Загружает scoring matrix из биопит
+_ENCODE_TABLE = np.full(256, UNKNOWN_CODE, dtype=np.uint8)
+for _code, _char in enumerate(ALPHABET):
+    _ENCODE_TABLE[ord(_char)] = _code
+    _ENCODE_TABLE[ord(_char.lower())] = _code
+_DECODE_TABLE = np.frombuffer((ALPHABET + 'X').encode('ascii'), dtype=np.uint8)
+
+SeqLike = Union[str, np.ndarray]
+
+
+class ScoringMatrix(dict):
+    # {(a, b): score} как раньше + плотная int-матрица в алфавите biopython. Только для чтения: load_scoring_matrix
+    # кэширует матрицу по имени, и изменение одной копии испортило бы все следующие; изменяемая копия - dict(matrix)
+
+    def __init__(self, name: str, alphabet: str, array: np.ndarray):
+        super().__init__(
+            ((alphabet[i], alphabet[j]), int(array[i, j]))
+            for i in range(len(alphabet)) for j in range(len(alphabet))
+        )
+        self.name = name
+        self.alphabet = alphabet
+        self.array = array
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f"матрица '{self.name}' только для чтения, изменяемая копия - dict(matrix)")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        # pickle (задачи multiprocessing) - заново из массива, не через __setitem__
+        return ScoringMatrix, (self.name, self.alphabet, self.array)
+
+
+@lru_cache(maxsize=None)
+def load_scoring_matrix(name: str = "BLOSUM62") -> ScoringMatrix:
+
+    #Загружает scoring matrix из биопит (результат кэшируется по имени)
 
 
     try:
         matrix = substitution_matrices.load(name)
-        scoring_dict = {}
-        for i, row in enumerate(matrix):
-            for j, score in enumerate(row):
-                key = (matrix.alphabet[i], matrix.alphabet[j])
-                scoring_dict[key] = int(score)
-        return scoring_dict
-    except ValueError:
-        raise ValueError(f"маттрица '{name}' не найдена в biopython.")
\ No newline at end of file
+    except (ValueError, FileNotFoundError):
+        raise ValueError(f"маттрица '{name}' не найдена в biopython.")
+    array = np.asarray(matrix, dtype=np.int32)
+    array.setflags(write=False)
+    return ScoringMatrix(name, ''.join(matrix.alphabet), array)
+
+
+def encode_sequence(seq: SeqLike) -> np.ndarray:
+    # строка -> uint8-коды ALPHABET (регистр не важен: строчные буквы - коды заглавных); готовые массивы не
+    # перекодируются
+    if isinstance(seq, np.ndarray):
+        return np.ascontiguousarray(seq, dtype=np.uint8)
+    return _ENCODE_TABLE[np.frombuffer(seq.encode('latin-1', 'replace'), dtype=np.uint8)]
+
+
+def decode_sequence(seq: SeqLike) -> str:
+    # обратно в строку; неизвестные символы выводятся как 'X'
+    if isinstance(seq, str):
+        return seq.upper()
+    return _DECODE_TABLE[seq].tobytes().decode('ascii')
+
+
+def _build_table(scoring_matrix: Dict[Tuple[str, str], int], mismatch_score: int) -> np.ndarray:
+    table = np.full((ALPHABET_SIZE, ALPHABET_SIZE), mismatch_score, dtype=np.int32)
+    for i, a in enumerate(ALPHABET):
+        for j, b in enumerate(ALPHABET):
+            table[i, j] = scoring_matrix.get((a, b), mismatch_score)
+    table.setflags(write=False)
+    return table
+
+
+@lru_cache(maxsize=None)
+def _named_table(name: str, mismatch_score: int) -> np.ndarray:
+    return _build_table(load_scoring_matrix(name), mismatch_score)
+
+
+@lru_cache(maxsize=None)
+def _simple_table(match_score: int, mismatch_score: int) -> np.ndarray:
+    table = np.full((ALPHABET_SIZE, ALPHABET_SIZE), mismatch_score, dtype=np.int32)
+    np.fill_diagonal(table, match_score)
+    table[UNKNOWN_CODE, UNKNOWN_CODE] = mismatch_score
+    table.setflags(write=False)
+    return table
+
+
+def score_table(
+        match_score: int = 1,
+        mismatch_score: int = -1,
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None
+) -> np.ndarray:
+    # плотная матрица ALPHABET_SIZE x ALPHABET_SIZE: score пары = table[code1, code2]
+    # (пары, которых нет в scoring_matrix, получают mismatch_score, как и раньше)
+    if scoring_matrix:
+        name = getattr(scoring_matrix, 'name', None)
+        if name is not None:
+            return _named_table(name, mismatch_score)
+        return _build_table(scoring_matrix, mismatch_score)
+    return _simple_table(match_score, mismatch_score)
@@ -0,0 +1,226 @@
+import os
+import numpy as np
+import numba
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple, Union
+from aligner.scoring import SeqLike, encode_sequence, score_table
+
+# Striped Smith-Waterman (Farrar, 2007) для поиска одного query по многим targets.
+# Query раскладывается "полосами": позиция i лежит в сегменте i % seg_len и lane i // seg_len, поэтому
+# соседние по query ячейки одного столбца попадают в разные lanes и обновляются одним векторным шагом.
+# Профиль query (score каждой позиции против каждой буквы алфавита) строится один раз и переиспользуется
+# для всех targets. Рекуррентности те же, что у smith_waterman: при affine gaps (M, Ix, Iy) gap открывается
+# только из M, при linear - из H (любой ячейки), поэтому score совпадает с smith_waterman.
+
+LANES = 16
+# "минус бесконечность" и score позиций-заглушек (хвост последнего lane) для int16/int32 профилей;
+# заглушки никогда не попадают в выравнивание, а E/F не опускаются ниже _PAD + gap_open
+_LIMITS = {np.int16: (-16384, -8192), np.int32: (-(1 << 29), -(1 << 20))}
+
+
+@numba.jit(nopython=True, cache=True)
+def _build_profile(query: np.ndarray, table: np.ndarray, lanes: int, pad: int, profile: np.ndarray) -> None:
+    n = len(query)
+    seg_len = profile.shape[1]
+    for c in range(table.shape[0]):
+        for s in range(seg_len):
+            for lane in range(lanes):
+                i = s + lane * seg_len
+                profile[c, s, lane] = table[query[i], c] if i < n else pad
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _striped_align(
+        profile: np.ndarray,
+        target: np.ndarray,
+        gap_open: int,
+        gap_extend: int,
+        linear: bool,
+        neg_inf: int
+) -> Tuple[int, int, int]:
+    # все буферы и скаляры (gap_open, gap_extend, neg_inf) в dtype профиля (int16 или int32):
+    # тогда внутренний цикл по lanes без ветвлений векторизуется в узкие SIMD-операции
+    seg_len, lanes = profile.shape[1], profile.shape[2]
+    dtype = profile.dtype
+    H_load = np.zeros((seg_len, lanes), dtype=dtype)
+    H_store = np.zeros((seg_len, lanes), dtype=dtype)
+    M_col = np.zeros((seg_len, lanes), dtype=dtype)
+    E = np.full((seg_len, lanes), neg_inf, dtype=dtype)
+    F = np.empty((seg_len, lanes), dtype=dtype)
+    diag = np.empty(lanes, dtype=dtype)
+    vF = np.empty(lanes, dtype=dtype)
+    vMax = np.empty(lanes, dtype=dtype)
+    zero = H_load[0, 0]
+    best, best_i, best_j = 0, 0, 0
+
+    for j in range(len(target)):
+        prof = profile[target[j]]
+        # H(i-1, j-1) для сегмента 0: последний сегмент предыдущего столбца, сдвинутый на один lane
+        diag[0] = 0
+        for lane in range(1, lanes):
+            diag[lane] = H_load[seg_len - 1, lane - 1]
+        vF[:] = neg_inf
+        vMax[:] = 0
+        for s in range(seg_len):
+            p, Es, Fs, Ms, Hs, Hl = prof[s], E[s], F[s], M_col[s], H_store[s], H_load[s]
+            for lane in range(lanes):
+                vM = max(diag[lane], zero) + p[lane]
+                vE = Es[lane]
+                f = vF[lane]
+                vH = max(max(vM, vE), f)
+                vMax[lane] = max(vMax[lane], vM)
+                Ms[lane] = vM
+                Hs[lane] = vH
+                Fs[lane] = f
+                opened = (vH if linear else vM) + gap_open
+                Es[lane] = max(opened, vE + gap_extend)
+                vF[lane] = max(opened, f + gap_extend)
+                diag[lane] = Hl[lane]
+
+        # lazy-F: F переходит из последнего сегмента lane l-1 в сегмент 0 lane l; продолжаем, пока что-то меняется.
+        # F <= 0 не влияет ни на одну положительную ячейку (H обнуляется при переходе по диагонали), его не несем
+        for lane in range(lanes - 1, 0, -1):
+            vF[lane] = vF[lane - 1]
+        vF[0] = neg_inf
+        s = 0
+        while True:
+            # max-обновления идемпотентны, поэтому сегмент пересчитывается целиком, без ветвлений по lanes
+            Es, Fs, Ms, Hs = E[s], F[s], M_col[s], H_store[s]
+            changed = 0
+            for lane in range(lanes):
+                f = vF[lane]
+                changed += (f > Fs[lane]) & (f > zero)
+                Fs[lane] = max(Fs[lane], f)
+                vH = max(Hs[lane], f)
+                Hs[lane] = vH
+                if linear:
+                    Es[lane] = max(Es[lane], vH + gap_open)
+                opened = (vH if linear else Ms[lane]) + gap_open
+                vF[lane] = max(opened, Fs[lane] + gap_extend)
+            if changed == 0:
+                break
+            s += 1
+            if s == seg_len:
+                s = 0
+                for lane in range(lanes - 1, 0, -1):
+                    vF[lane] = vF[lane - 1]
+                vF[0] = neg_inf
+
+        # конец выравнивания: как в smith_waterman, при равенстве берется меньшая позиция query
+        col_max = vMax.max()
+        if col_max > 0 and col_max >= best:
+            for s in range(seg_len):
+                for lane in range(lanes):
+                    if M_col[s, lane] == col_max:
+                        i = s + lane * seg_len + 1
+                        if col_max > best or i < best_i:
+                            best, best_i, best_j = col_max, i, j + 1
+        H_load, H_store = H_store, H_load
+    return best, best_i, best_j
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _striped_search(
+        profile: np.ndarray,
+        targets: np.ndarray,
+        offsets: np.ndarray,
+        gap_open: int,
+        gap_extend: int,
+        linear: bool,
+        neg_inf: int,
+        first: int,
+        last: int,
+        scores: np.ndarray,
+        query_ends: np.ndarray,
+        target_ends: np.ndarray
+) -> None:
+    # targets first..last-1 из упакованного массива; без GIL, чтобы куски шли параллельно в потоках
+    for t in range(first, last):
+        score, i, j = _striped_align(profile, targets[offsets[t]:offsets[t + 1]], gap_open, gap_extend, linear,
+                                     neg_inf)
+        scores[t] = score
+        query_ends[t] = i
+        target_ends[t] = j
+
+
+class QueryProfile:
+    # профиль query для striped SW: строится один раз и переиспользуется для всех targets
+
+    def __init__(
+            self,
+            query: SeqLike,
+            match_score: int = 1,
+            mismatch_score: int = -1,
+            scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
+            lanes: int = LANES
+    ):
+        self.query = encode_sequence(query)
+        table = score_table(match_score, mismatch_score, scoring_matrix)
+        # int16 вдвое шире по lanes в SIMD-регистре; берется, только если ни один score не может переполниться
+        max_score = len(self.query) * max(int(table.max()), 0)
+        self.dtype = np.int16 if max_score < 8192 and int(table.min()) >= -8192 else np.int32
+        self.neg_inf, pad = _LIMITS[self.dtype]
+        seg_len = max(1, (len(self.query) + lanes - 1) // lanes)
+        self.profile = np.empty((table.shape[0], seg_len, lanes), dtype=self.dtype)
+        _build_profile(self.query, table, lanes, pad, self.profile)
+
+    def _gap_model(self, gap_penalty: int, gap_open: Optional[int], gap_extend: Optional[int]) -> Tuple[int, int, bool]:
+        # linear gaps - gap открывается из любой ячейки; штрафы, не влезающие в int16, переводят профиль в int32
+        linear = gap_open is None or gap_extend is None
+        if linear:
+            gap_open = gap_extend = gap_penalty
+        if self.dtype == np.int16 and min(gap_open, gap_extend) < -8192:
+            self.profile = self.profile.astype(np.int32)
+            self.dtype = np.int32
+            self.neg_inf = _LIMITS[np.int32][0]
+        return self.dtype(gap_open), self.dtype(gap_extend), linear
+
+    def align(
+            self,
+            target: SeqLike,
+            gap_penalty: int = -2,
+            gap_open: Optional[int] = None,
+            gap_extend: Optional[int] = None
+    ) -> Tuple[int, int, int]:
+        # (score, конец в query, конец в target); концы - exclusive индексы, 0 если выравнивания нет
+        gap_open, gap_extend, linear = self._gap_model(gap_penalty, gap_open, gap_extend)
+        return _striped_align(self.profile, encode_sequence(target), gap_open, gap_extend, linear, self.dtype(self.neg_inf))
+
+
+def search(
+        query: Union[SeqLike, QueryProfile],
+        targets: Iterable[SeqLike],
+        match_score: int = 1,
+        mismatch_score: int = -1,
+        gap_penalty: int = -2,
+        gap_open: Optional[int] = None,
+        gap_extend: Optional[int] = None,
+        scoring_matrix: Optional[Dict[Tuple[str, str], int]] = None,
+        num_workers: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # локальное выравнивание query против всех targets (параллельно по targets);
+    # возвращает массивы score, концов в query и концов в target (exclusive, 0 - нет выравнивания)
+    if not isinstance(query, QueryProfile):
+        query = QueryProfile(query, match_score, mismatch_score, scoring_matrix)
+    gap_open, gap_extend, linear = query._gap_model(gap_penalty, gap_open, gap_extend)
+    encoded = [encode_sequence(t) for t in targets]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(t) for t in encoded])
+    packed = np.concatenate(encoded) if encoded else np.zeros(0, dtype=np.uint8)
+    count = len(encoded)
+    scores = np.zeros(count, dtype=np.int64)
+    query_ends = np.zeros(count, dtype=np.int64)
+    target_ends = np.zeros(count, dtype=np.int64)
+    args = (query.profile, packed, offsets, gap_open, gap_extend, linear, query.dtype(query.neg_inf))
+
+    # потоки, а не numba parallel: threading layer numba не переживает fork() в multiprocessing.Pool
+    workers = min(num_workers or os.cpu_count() or 1, count)
+    if workers <= 1:
+        _striped_search(*args, 0, count, scores, query_ends, target_ends)
+    else:
+        bounds = np.linspace(0, count, workers + 1).astype(int)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(_striped_search, *args, bounds[k], bounds[k + 1], scores, query_ends,
+                                           target_ends) for k in range(workers)]:
+                future.result()
+    return scores, query_ends, target_ends
@@ -0,0 +1,199 @@
+import json
+import os
+import numpy as np
+import numba
+from typing import List, Optional, Tuple
+from aligner.io_utils import load_sequences
+from aligner.scoring import ALPHABET_SIZE, SeqLike, encode_sequence
+
+# Суффиксный массив набора targets для затравок из точных совпадений любой длины (MEM / SMEM, как в BWA-MEM).
+# Targets склеиваются в один текст через разделитель SEP (его нет в query, поэтому совпадение не переходит
+# границу target); суффиксный массив строится удвоением префиксов (ранги пар -> argsort, O(n log^2 n) в numpy).
+# Совпадения query ищутся сужением интервала суффиксного массива по одному символу: интервал суффиксов,
+# начинающихся с query[i:i + d], для d + 1 находится двумя бинарными поисками внутри текущего.
+# Самое длинное совпадение с позиции i заканчивается в end(i), и end(i) не убывает по i - совпадение с i
+# супер-максимально (SMEM, не лежит внутри другого), если end(i) > end(i - 1).
+# На диске индекс - директория с .npy-массивами и meta.json, как у MinimizerIndex; читается через mmap.
+
+SEP = ALPHABET_SIZE
+_ARRAYS = ("text", "sa", "starts")
+
+
+def build_suffix_array(text: np.ndarray) -> np.ndarray:
+    # суффиксный массив: sa[r] - начало r-го по порядку суффикса; конец текста меньше любого символа
+    n = len(text)
+    rank = text.astype(np.int64)
+    sa = np.argsort(rank, kind="stable")
+    step = 1
+    while step < n:
+        second = np.zeros(n, dtype=np.int64)
+        second[:n - step] = rank[step:] + 1
+        key = rank * (int(rank.max()) + 2) + second
+        sa = np.argsort(key, kind="stable")
+        sorted_key = key[sa]
+        rank = np.empty(n, dtype=np.int64)
+        rank[sa] = np.concatenate(([0], np.cumsum(sorted_key[1:] != sorted_key[:-1])))
+        if rank[sa[-1]] == n - 1:
+            break
+        step *= 2
+    return sa
+
+
+@numba.jit(nopython=True, cache=True)
+def _narrow(text: np.ndarray, sa: np.ndarray, lo: int, hi: int, depth: int, c: int) -> Tuple[int, int]:
+    # подинтервал [lo, hi), где text[sa[r] + depth] == c; суффиксы [lo, hi) совпадают в первых depth символах
+    n = len(text)
+    left, right = lo, hi
+    while left < right:
+        mid = (left + right) // 2
+        p = sa[mid] + depth
+        if (text[p] if p < n else -1) < c:
+            left = mid + 1
+        else:
+            right = mid
+    start = left
+    right = hi
+    while left < right:
+        mid = (left + right) // 2
+        p = sa[mid] + depth
+        if (text[p] if p < n else -1) <= c:
+            left = mid + 1
+        else:
+            right = mid
+    return start, left
+
+
+@numba.jit(nopython=True, cache=True)
+def _match(query: np.ndarray, text: np.ndarray, sa: np.ndarray, start: int, stop: int) -> Tuple[int, int, int]:
+    # самое длинное совпадение query[start:stop] с началом суффикса: (интервал [lo, hi), длина)
+    lo, hi = 0, len(sa)
+    depth = 0
+    while start + depth < stop:
+        new_lo, new_hi = _narrow(text, sa, lo, hi, depth, query[start + depth])
+        if new_lo == new_hi:
+            break
+        lo, hi = new_lo, new_hi
+        depth += 1
+    return lo, hi, depth
+
+
+@numba.jit(nopython=True, cache=True)
+def _smems(query: np.ndarray, text: np.ndarray, sa: np.ndarray,
+           min_length: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # SMEM длиной не меньше min_length: (начало в query, длина, интервал [lo, hi) суффиксного массива).
+    # Совпадение с i заканчивается в end; следующий SMEM обязан покрыть query[end] - его начало - самое левое
+    # i' из (i, end], для которого query[i':end + 1] встречается в тексте (свойство монотонно по i', поэтому
+    # бинарный поиск). Позиции между i и i' не перебираются: O(L log L log N) на SMEM вместо O(n L log N)
+    nq = len(query)
+    positions = np.empty(nq, dtype=np.int64)
+    lengths = np.empty(nq, dtype=np.int64)
+    los = np.empty(nq, dtype=np.int64)
+    his = np.empty(nq, dtype=np.int64)
+    found = 0
+    i = 0
+    while i < nq:
+        lo, hi, depth = _match(query, text, sa, i, nq)
+        end = i + depth
+        if depth >= min_length:
+            positions[found] = i
+            lengths[found] = depth
+            los[found] = lo
+            his[found] = hi
+            found += 1
+        if end >= nq:
+            break
+        left, right = i + 1, end + 1
+        while left < right:
+            mid = (left + right) // 2
+            if mid + _match(query, text, sa, mid, end + 1)[2] == end + 1:
+                right = mid
+            else:
+                left = mid + 1
+        i = left
+    return positions[:found], lengths[:found], los[:found], his[:found]
+
+
+class SuffixArrayIndex:
+    # суффиксный массив targets; text - склеенные коды с SEP после каждого target, starts - начала targets
+
+    def __init__(self, text: np.ndarray, sa: np.ndarray, starts: np.ndarray):
+        self.text = text
+        self.sa = sa
+        self.starts = starts
+        self._target_sa = (None, None)
+
+    @classmethod
+    def build(cls, sequences: List[SeqLike]) -> "SuffixArrayIndex":
+        parts = []
+        for seq in sequences:
+            parts.append(encode_sequence(seq))
+            parts.append(np.array([SEP], dtype=np.uint8))
+        text = np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint8)
+        starts = np.zeros(len(sequences), dtype=np.int64)
+        if sequences:
+            np.cumsum([len(seq) + 1 for seq in sequences[:-1]], out=starts[1:])
+        return cls(text, build_suffix_array(text), starts)
+
+    @classmethod
+    def from_fasta(cls, file_path: str) -> "SuffixArrayIndex":
+        # индекс всех последовательностей FASTA; номер target - номер записи в файле
+        return cls.build(load_sequences(file_path))
+
+    def save(self, path: str) -> None:
+        # директория path с .npy на каждый массив и meta.json
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(getattr(self, name)))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"targets": len(self)}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "SuffixArrayIndex":
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            raise FileNotFoundError(f"индекс не найден: {path}")
+        return cls(*[np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                     for name in _ARRAYS])
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _locate(self, sa: np.ndarray, lo: int, hi: int) -> List[Tuple[int, int]]:
+        # (target, позиция в target) суффиксов интервала [lo, hi) суффиксного массива sa, по возрастанию
+        positions = np.sort(np.asarray(sa[lo:hi]))
+        targets = np.searchsorted(self.starts, positions, side="right") - 1
+        return [(int(t), int(p - self.starts[t])) for t, p in zip(targets, positions)]
+
+    def target_sa(self, target: int) -> np.ndarray:
+        # суффиксный массив одного target - суффиксы target в том же порядке: суффиксы одного target
+        # различаются раньше его SEP (SEP больше любого кода); последний запрошенный запоминается
+        cached_target, cached = self._target_sa
+        if cached_target != target:
+            stop = self.starts[target + 1] if target + 1 < len(self.starts) else len(self.text)
+            sa = np.asarray(self.sa)
+            cached = sa[(sa >= self.starts[target]) & (sa < stop - 1)]
+            self._target_sa = (target, cached)
+        return cached
+
+    def find(self, pattern: SeqLike) -> List[Tuple[int, int]]:
+        # все точные вхождения pattern: [(target, позиция)]
+        codes = encode_sequence(pattern)
+        lo, hi = 0, len(self.sa)
+        sa, text = np.asarray(self.sa), np.asarray(self.text)
+        for depth in range(len(codes)):
+            lo, hi = _narrow(text, sa, lo, hi, depth, codes[depth])
+            if lo == hi:
+                return []
+        return self._locate(sa, lo, hi)
+
+    def smems(self, query: SeqLike, min_length: int = 1, max_occurrences: int = 0,
+              target: Optional[int] = None) -> List[Tuple[int, int, List[Tuple[int, int]]]]:
+        # [(начало в query, длина, [(target, позиция)])] супер-максимальных точных совпадений по возрастанию
+        # начала; max_occurrences > 0 - SMEM с большим числом вхождений (повторы) пропускаются. target - SMEM
+        # только относительно этого target (более длинные совпадения в других его не скрывают, вхождения
+        # считаются только в нем)
+        sa = np.asarray(self.sa) if target is None else self.target_sa(target)
+        positions, lengths, los, his = _smems(encode_sequence(query), np.asarray(self.text), sa,
+                                              max(min_length, 1))
+        return [(int(i), int(length), self._locate(sa, lo, hi))
+                for i, length, lo, hi in zip(positions, lengths, los, his)
+                if max_occurrences <= 0 or hi - lo <= max_occurrences]
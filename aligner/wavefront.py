@@ -0,0 +1,405 @@
+import numpy as np
+import numba
+from typing import Optional, Tuple
+from aligner.algorithms import OP_MATCH, OP_DEL, OP_INS, _NEG_INF, Alignment
+from aligner.linear_space import BASE_CELLS, STATE_M, STATE_X, STATE_Y, STATE_ANY, _divide_and_conquer
+from aligner.scoring import UNKNOWN_CODE, SeqLike, decode_sequence, encode_sequence
+
+# Wavefront alignment (WFA, Marco-Sola et al., 2021): вместо ячеек DP для каждого штрафа s хранится
+# "волна" - на каждой диагонали k = j - i самая дальняя ячейка, достижимая со штрафом ровно s, в состояниях
+# M (последний столбец - пара или начало), I (gap в seq1, ход вправо) и D (gap в seq2, ход вниз).
+# Совпадения продлевают диагональ бесплатно, поэтому работа - O(n * s), где s - штраф выравнивания:
+# для почти одинаковых последовательностей это почти линейно.
+#
+# WFA считает штрафы (совпадение 0), а needleman_wunsch - score с бонусом за совпадение. Переход (Eizenga & Paten):
+# x = 2 * (match - mismatch), o = 2 * (gap_extend - gap_open), e = match - 2 * gap_extend (linear gaps: o = 0,
+# e = match - 2 * gap), и score = (match * (n + m) - штраф) / 2 - оптимумы совпадают. Gap длины L стоит o + L * e,
+# как gap_open + (L - 1) * gap_extend. В отличие от _fill_affine, gap может открываться сразу после gap другого
+# направления; при mismatch_score >= 2 * gap_extend это никогда не выгоднее замены, и score тот же.
+#
+# Low-memory вариант: волны хранятся только в окне последних max(x, o + e) штрафов, а каждая ячейка несет метку
+# клетки, в которой ее путь впервые дошел до средней строки (и состояние в ней). Метка конечной ячейки дает точку
+# разбиения, как в Myers-Miller, и задача делится на две (aligner.linear_space._divide_and_conquer).
+
+# волна хранится как строки двумерного массива: слот s % slots, столбец k + K; метка ячейки - j * 4 + state + 1
+_INITIAL_SLOTS = 64
+_INITIAL_K = 16
+
+
+@numba.jit(nopython=True, cache=True)
+def _wf_get(offsets: np.ndarray, slot_score: np.ndarray, lo: np.ndarray, hi: np.ndarray, K: int, s: int,
+            k: int) -> int:
+    # смещение (столбец j) ячейки волны s на диагонали k, _NEG_INF - такой ячейки нет
+    if s < 0:
+        return _NEG_INF
+    slot = s % len(slot_score)
+    if slot_score[slot] != s or k < lo[slot] or k > hi[slot]:
+        return _NEG_INF
+    return offsets[slot, k + K]
+
+
+@numba.jit(nopython=True, cache=True)
+def _wf_slot(slot_score: np.ndarray, lo: np.ndarray, hi: np.ndarray, s: int) -> Tuple[int, int, int]:
+    # (слот, lo, hi) волны s; если волны нет - пустой диапазон
+    if s < 0:
+        return 0, 0, -1
+    slot = s % len(slot_score)
+    if slot_score[slot] != s:
+        return 0, 0, -1
+    return slot, lo[slot], hi[slot]
+
+
+@numba.jit(nopython=True, cache=True)
+def _widen(arr: np.ndarray, K: int, new_K: int, fill: int) -> np.ndarray:
+    wide = np.full((arr.shape[0], 2 * new_K + 1), fill, dtype=arr.dtype)
+    wide[:, new_K - K:new_K + K + 1] = arr
+    return wide
+
+
+@numba.jit(nopython=True, cache=True)
+def _lengthen(arr: np.ndarray, rows: int, fill: int) -> np.ndarray:
+    long = np.full((rows,) + arr.shape[1:], fill, dtype=arr.dtype)
+    long[:arr.shape[0]] = arr
+    return long
+
+
+@numba.jit(nopython=True, cache=True, nogil=True)
+def _wavefront(
+        a: np.ndarray,
+        b: np.ndarray,
+        i0: int,
+        i1: int,
+        j0: int,
+        j1: int,
+        x: int,
+        o: int,
+        e: int,
+        start: int,
+        end: int,
+        mid: int,
+        keep_all: bool
+) -> Tuple[int, int, np.ndarray, int]:
+    # WFA для a[i0:i1] x b[j0:j1]: start - состояние перед первым столбцом (gap в нем продолжается без o),
+    # end - требуемое состояние в конце (STATE_M и STATE_ANY - любое). keep_all - хранить все волны и вернуть
+    # операции, иначе только окно волн и метка пересечения строки mid. Возвращает (штраф, метка, ops, K)
+    n, m = i1 - i0, j1 - j0
+    k_end = m - n
+    slots = _INITIAL_SLOTS if keep_all else max(x, o + e) + 1
+    K = _INITIAL_K
+    width = 2 * K + 1
+    M = np.full((slots, width), _NEG_INF, dtype=np.int64)
+    I = np.full((slots, width), _NEG_INF, dtype=np.int64)
+    D = np.full((slots, width), _NEG_INF, dtype=np.int64)
+    tags = not keep_all
+    tag_shape = (slots, width) if tags else (1, 1)
+    Mt = np.zeros(tag_shape, dtype=np.int64)
+    It = np.zeros(tag_shape, dtype=np.int64)
+    Dt = np.zeros(tag_shape, dtype=np.int64)
+    slot_score = np.full(slots, -1, dtype=np.int64)
+    lo = np.zeros(slots, dtype=np.int64)
+    hi = np.full(slots, -1, dtype=np.int64)
+
+    # s = 0: начало и бесплатное продление совпадениями
+    slot_score[0], lo[0], hi[0] = 0, 0, 0
+    h = 0
+    while h < n and h < m and a[i0 + h] == b[j0 + h] and a[i0 + h] != UNKNOWN_CODE:
+        h += 1
+    M[0, K] = h
+    if tags and 0 < mid <= h:
+        Mt[0, K] = mid * 4 + STATE_M + 1
+    if start == STATE_Y:
+        I[0, K] = 0
+    elif start == STATE_X:
+        D[0, K] = 0
+
+    s = 0
+    while True:
+        if end == STATE_Y:
+            reached = _wf_get(I, slot_score, lo, hi, K, s, k_end)
+        elif end == STATE_X:
+            reached = _wf_get(D, slot_score, lo, hi, K, s, k_end)
+        else:
+            reached = _wf_get(M, slot_score, lo, hi, K, s, k_end)
+        if reached == m:
+            break
+        s += 1
+
+        # диапазон диагоналей волны s по волнам-источникам s - x, s - o - e, s - e
+        new_lo, new_hi = m + 1, -n - 1
+        for source, shift in ((s - x, 0), (s - o - e, 1), (s - e, 1)):
+            if source >= 0:
+                slot = source % slots
+                if slot_score[slot] == source and lo[slot] <= hi[slot]:
+                    new_lo = min(new_lo, lo[slot] - shift)
+                    new_hi = max(new_hi, hi[slot] + shift)
+        new_lo, new_hi = max(new_lo, -n), min(new_hi, m)
+
+        if keep_all and s >= slots:
+            grown = 2 * slots
+            M, I, D = _lengthen(M, grown, _NEG_INF), _lengthen(I, grown, _NEG_INF), _lengthen(D, grown, _NEG_INF)
+            slot_score = _lengthen(slot_score, grown, -1)
+            lo = _lengthen(lo, grown, 0)
+            hi = _lengthen(hi, grown, -1)
+            slots = grown
+        need = max(-new_lo, new_hi)
+        if need > K:
+            new_K = max(2 * K, need)
+            M, I, D = _widen(M, K, new_K, _NEG_INF), _widen(I, K, new_K, _NEG_INF), _widen(D, K, new_K, _NEG_INF)
+            if tags:
+                Mt, It, Dt = _widen(Mt, K, new_K, 0), _widen(It, K, new_K, 0), _widen(Dt, K, new_K, 0)
+            K = new_K
+
+        # слоты и диапазоны диагоналей волн-источников (пустой диапазон - волны нет)
+        sx, so, se = s - x, s - o - e, s - e
+        px, x_lo, x_hi = _wf_slot(slot_score, lo, hi, sx)
+        po, o_lo, o_hi = _wf_slot(slot_score, lo, hi, so)
+        pe, e_lo, e_hi = _wf_slot(slot_score, lo, hi, se)
+        slot = s % slots
+        for k in range(new_lo, new_hi + 1):
+            # I: ход вправо с диагонали k - 1 (открытие из M или продолжение I); строка не меняется
+            iv, it = _NEG_INF, 0
+            if o_lo <= k - 1 <= o_hi:
+                src = M[po, k - 1 + K]
+                if src != _NEG_INF and src + 1 <= m:
+                    iv = src + 1
+                    if tags:
+                        it = Mt[po, k - 1 + K]
+            if e_lo <= k - 1 <= e_hi:
+                src = I[pe, k - 1 + K]
+                if src != _NEG_INF and src + 1 <= m and src + 1 > iv:
+                    iv = src + 1
+                    if tags:
+                        it = It[pe, k - 1 + K]
+
+            # D: ход вниз с диагонали k + 1, столбец тот же, строка + 1
+            dv, dt = _NEG_INF, 0
+            if o_lo <= k + 1 <= o_hi:
+                src = M[po, k + 1 + K]
+                if src != _NEG_INF and src - k <= n:
+                    dv = src
+                    if tags:
+                        dt = Mt[po, k + 1 + K]
+            if e_lo <= k + 1 <= e_hi:
+                src = D[pe, k + 1 + K]
+                if src != _NEG_INF and src - k <= n and src > dv:
+                    dv = src
+                    if tags:
+                        dt = Dt[pe, k + 1 + K]
+            if tags and dt == 0 and dv != _NEG_INF and dv - k == mid:
+                dt = dv * 4 + STATE_X + 1
+
+            # M: замена с той же диагонали волны s - x, или конец gap'а той же волны
+            mv, mt = _NEG_INF, 0
+            if x_lo <= k <= x_hi:
+                src = M[px, k + K]
+                if src != _NEG_INF and src + 1 <= m and src + 1 - k <= n:
+                    mv = src + 1
+                    if tags:
+                        mt = Mt[px, k + K]
+                        if mt == 0 and mv - k == mid:
+                            mt = mv * 4 + STATE_M + 1
+            if iv > mv:
+                mv, mt = iv, it
+            if dv > mv:
+                mv, mt = dv, dt
+            if mv != _NEG_INF:
+                h = mv
+                while h - k < n and h < m and a[i0 + h - k] == b[j0 + h] and b[j0 + h] != UNKNOWN_CODE:
+                    h += 1
+                if tags and mt == 0 and mv - k < mid <= h - k:
+                    mt = (mid + k) * 4 + STATE_M + 1
+                mv = h
+
+            M[slot, k + K], I[slot, k + K], D[slot, k + K] = mv, iv, dv
+            if tags:
+                Mt[slot, k + K], It[slot, k + K], Dt[slot, k + K] = mt, it, dt
+
+        # отбрасываем крайние диагонали, на которых волна пуста: диапазон растет только там, где есть пути
+        while new_lo <= new_hi and M[slot, new_lo + K] == _NEG_INF and I[slot, new_lo + K] == _NEG_INF \
+                and D[slot, new_lo + K] == _NEG_INF:
+            new_lo += 1
+        while new_hi >= new_lo and M[slot, new_hi + K] == _NEG_INF and I[slot, new_hi + K] == _NEG_INF \
+                and D[slot, new_hi + K] == _NEG_INF:
+            new_hi -= 1
+        slot_score[slot], lo[slot], hi[slot] = s, new_lo, new_hi
+
+    score = s
+    tag = 0
+    if tags:
+        slot = s % slots
+        if end == STATE_Y:
+            tag = It[slot, k_end + K]
+        elif end == STATE_X:
+            tag = Dt[slot, k_end + K]
+        else:
+            tag = Mt[slot, k_end + K]
+    ops = np.empty(n + m if keep_all else 0, dtype=np.uint8)
+    if not keep_all:
+        return score, tag, ops, K
+
+    # traceback по сохраненным волнам от (n, m); при равенстве, как в прямом проходе: замена, затем I, затем D
+    state = end if end == STATE_X or end == STATE_Y else STATE_M
+    k, h, length = k_end, m, 0
+    while True:
+        if state == STATE_M:
+            if s == 0:
+                for _ in range(h):
+                    ops[length] = OP_MATCH
+                    length += 1
+                break
+            best, source = _NEG_INF, 0
+            src = _wf_get(M, slot_score, lo, hi, K, s - x, k)
+            if src != _NEG_INF and src + 1 <= m and src + 1 - k <= n:
+                best = src + 1
+            src = _wf_get(I, slot_score, lo, hi, K, s, k)
+            if src > best:
+                best, source = src, 1
+            src = _wf_get(D, slot_score, lo, hi, K, s, k)
+            if src > best:
+                best, source = src, 2
+            for _ in range(h - best):
+                ops[length] = OP_MATCH
+                length += 1
+            h = best
+            if source == 0:
+                ops[length] = OP_MATCH
+                length += 1
+                h -= 1
+                s -= x
+            else:
+                state = STATE_Y if source == 1 else STATE_X
+        elif state == STATE_Y:
+            if s == 0:
+                break
+            ops[length] = OP_INS
+            length += 1
+            if _wf_get(M, slot_score, lo, hi, K, s - o - e, k - 1) == h - 1:
+                state = STATE_M
+                s -= o + e
+            else:
+                s -= e
+            k -= 1
+            h -= 1
+        else:
+            if s == 0:
+                break
+            ops[length] = OP_DEL
+            length += 1
+            if _wf_get(M, slot_score, lo, hi, K, s - o - e, k + 1) == h:
+                state = STATE_M
+                s -= o + e
+            else:
+                s -= e
+            k += 1
+    return score, 0, ops[:length][::-1].copy(), K
+
+
+def _penalties(
+        match_score: int,
+        mismatch_score: int,
+        gap_penalty: int,
+        gap_open: Optional[int],
+        gap_extend: Optional[int]
+) -> Tuple[int, int, int]:
+    # (x, o, e) штрафов WFA для score-модели needleman_wunsch
+    if gap_open is None or gap_extend is None:
+        gap_open = gap_extend = gap_penalty
+    x = 2 * (match_score - mismatch_score)
+    o = 2 * (gap_extend - gap_open)
+    e = match_score - 2 * gap_extend
+    if x <= 0 or e <= 0 or o < 0:
+        raise ValueError("WFA требует match_score > mismatch_score, match_score > 2 * gap_extend "
+                         "и gap_open <= gap_extend")
+    if o > 0 and mismatch_score < 2 * gap_extend:
+        raise ValueError("WFA с affine gaps требует mismatch_score >= 2 * gap_extend")
+    return x, o, e
+
+
+def _ops_penalty(ops: np.ndarray, a: np.ndarray, b: np.ndarray, x: int, o: int, e: int) -> int:
+    # штраф выравнивания по операциям: замены, столбцы gap'ов и их серии
+    pairs = ops == OP_MATCH
+    col1 = np.cumsum(ops != OP_INS) - 1
+    col2 = np.cumsum(ops != OP_DEL) - 1
+    left, right = a[col1[pairs]], b[col2[pairs]]
+    mismatches = int(np.count_nonzero((left != right) | (left == UNKNOWN_CODE)))
+    return x * mismatches + e * int(np.count_nonzero(~pairs)) + o * _gap_runs(ops)
+
+
+def _gap_runs(ops: np.ndarray) -> int:
+    # число серий gap'ов: позиции, где gap-операция отличается от предыдущей
+    if len(ops) == 0:
+        return 0
+    starts = ops[1:] != ops[:-1]
+    return int(np.count_nonzero((ops[1:] != OP_MATCH) & starts) + (ops[0] != OP_MATCH))
+
+
+def _swap_state(state: int) -> int:
+    # состояние в транспонированной задаче (seq1 и seq2 меняются местами)
+    if state == STATE_X:
+        return STATE_Y
+    if state == STATE_Y:
+        return STATE_X
+    return state
+
+
+def wfa_score(
+        seq1: SeqLike,
+        seq2: SeqLike,
+        match_score: int = 1,
+        mismatch_score: int = -1,
+        gap_penalty: int = -2,
+        gap_open: Optional[int] = None,
+        gap_extend: Optional[int] = None
+) -> int:
+    # только score: окно из max(x, o + e) волн, O(s) памяти
+    x, o, e = _penalties(match_score, mismatch_score, gap_penalty, gap_open, gap_extend)
+    a, b = encode_sequence(seq1), encode_sequence(seq2)
+    penalty, _, _, _ = _wavefront(a, b, 0, len(a), 0, len(b), x, o, e, STATE_M, STATE_ANY, -1, False)
+    return (match_score * (len(a) + len(b)) - penalty) // 2
+
+
+def wfa_needleman_wunsch(
+        seq1: SeqLike,
+        seq2: SeqLike,
+        match_score: int = 1,
+        mismatch_score: int = -1,
+        gap_penalty: int = -2,
+        gap_open: Optional[int] = None,
+        gap_extend: Optional[int] = None,
+        low_memory: bool = False,
+        threads: int = 1,
+        base_cells: int = BASE_CELLS
+) -> Alignment:
+    # глобальное выравнивание WFA, тот же score, что у needleman_wunsch (без scoring_matrix);
+    # low_memory - деление по средней строке, в памяти окно волн, подзадачи до base_cells ячеек волн - целиком
+    x, o, e = _penalties(match_score, mismatch_score, gap_penalty, gap_open, gap_extend)
+    text1, text2 = decode_sequence(seq1), decode_sequence(seq2)
+    a, b = encode_sequence(seq1), encode_sequence(seq2)
+    if not low_memory:
+        penalty, _, ops, _ = _wavefront(a, b, 0, len(a), 0, len(b), x, o, e, STATE_M, STATE_ANY, -1, True)
+        return Alignment.from_ops(text1, text2, ops, (match_score * (len(a) + len(b)) - penalty) // 2)
+
+    def step(task):
+        i0, i1, j0, j1, start, end = task
+        n, m = i1 - i0, j1 - j0
+        if n >= 2:
+            mid = n // 2
+            penalty, tag, _, K = _wavefront(a, b, i0, i1, j0, j1, x, o, e, start, end, mid, False)
+        elif m >= 2:
+            # одна строка: делим по среднему столбцу транспонированной задачи
+            mid = m // 2
+            penalty, tag, _, K = _wavefront(b, a, j0, j1, i0, i1, x, o, e, _swap_state(start), _swap_state(end),
+                                            mid, False)
+        if (n < 2 and m < 2) or (penalty + 1) * (2 * K + 1) <= base_cells:
+            _, _, ops, _ = _wavefront(a, b, i0, i1, j0, j1, x, o, e, start, end, -1, True)
+            return "leaf", (ops, 0)
+        cross, state = divmod(tag - 1, 4)
+        if n >= 2:
+            split_i, split_j = i0 + mid, j0 + cross
+        else:
+            split_i, split_j, state = i0 + cross, j0 + mid, _swap_state(state)
+        return "split", ((i0, split_i, j0, split_j, start, state), (split_i, i1, split_j, j1, state, end))
+
+    ops, _ = _divide_and_conquer((0, len(a), 0, len(b), STATE_M, STATE_ANY), step, threads)
+    penalty = _ops_penalty(ops, a, b, x, o, e)
+    return Alignment.from_ops(text1, text2, ops, (match_score * (len(a) + len(b)) - penalty) // 2)
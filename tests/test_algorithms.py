@@ -1,8 +1,19 @@
 import pytest
+import numpy as np
 from unittest.mock import patch, MagicMock
-from aligner.algorithms import needleman_wunsch, smith_waterman
-from aligner.scoring import load_scoring_matrix
-from aligner.msa import multiple_sequence_alignment, MSAError
+from aligner.algorithms import needleman_wunsch, smith_waterman, _compiled_fill
+from aligner.scoring import load_scoring_matrix, encode_sequence, score_table
+from aligner.msa import multiple_sequence_alignment, compute_distance_matrix, MSAError
+from aligner.striped import QueryProfile, search
+from aligner.linear_space import hirschberg_needleman_wunsch, myers_miller_needleman_wunsch
+from aligner.optimizers import heuristic_local_align
+from aligner.wavefront import wfa_needleman_wunsch
+from aligner.dispatch import plan_alignment
+from aligner.batch import align_batch
+from aligner.index import MinimizerIndex
+from aligner.suffix_array import SuffixArrayIndex
+from aligner.genome import genome_align
+from aligner.cache import ResultCache
 from subprocess import run, CalledProcessError
 import os
 import sys
@@ -47,11 +58,461 @@ def test_needleman_wunsch_with_matrix():
     assert score > 0
 
 
+def test_encoded_sequences_match_strings():
+    matrix = load_scoring_matrix("BLOSUM62")
+    a, b = encode_sequence("HEAGAWGHEE"), encode_sequence("pawheae")
+    assert a.dtype == np.uint8
+    assert needleman_wunsch(a, b, gap_penalty=-8, scoring_matrix=matrix) == \
+        needleman_wunsch("HEAGAWGHEE", "PAWHEAE", gap_penalty=-8, scoring_matrix=matrix)
+    assert smith_waterman(a, b, gap_penalty=-8, scoring_matrix=matrix) == \
+        smith_waterman("HEAGAWGHEE", "PAWHEAE", gap_penalty=-8, scoring_matrix=matrix)
+
+
+def test_score_table_from_matrix():
+    matrix = load_scoring_matrix("BLOSUM62")
+    assert load_scoring_matrix("BLOSUM62") is matrix
+    table = score_table(mismatch_score=-7, scoring_matrix=matrix)
+    w, j = encode_sequence("WJ")
+    assert table[w, w] == matrix[("W", "W")] == matrix.array[matrix.alphabet.index("W"), matrix.alphabet.index("W")]
+    assert table[w, j] == -7
+    with pytest.raises(TypeError):
+        matrix[("W", "W")] = 0
+    with pytest.raises(TypeError):
+        matrix.update({("W", "W"): 0})
+    assert load_scoring_matrix("BLOSUM62")[("W", "W")] == 11
+    copy = dict(matrix)
+    copy[("W", "W")] = 0
+    assert matrix[("W", "W")] == 11
+
+
+def test_simple_table_case_and_unknown_symbols():
+    table = score_table(2, -3)
+    upper, lower, unknown, other = encode_sequence("Aa1.")
+    # регистр не важен, неизвестные символы не совпадают ни с чем, даже друг с другом
+    assert table[upper, lower] == 2
+    assert unknown == other
+    assert table[unknown, other] == -3
+    assert needleman_wunsch("ACGT", "acgt", 2, -3).score == 8
+    assert needleman_wunsch("A1", "A1", 2, -3).score == -1
+
+
 def test_needleman_wunsch_affine():
     align1, align2, score = needleman_wunsch("AGCT", "A--T", gap_penalty=-2, gap_open=-5, gap_extend=-1)
     assert score == 0
 
 
+def _affine_score(align1, align2, gap_open, gap_extend, match=1, mismatch=-1):
+    score, prev_gap = 0, None
+    for a, b in zip(align1, align2):
+        if a == '-' or b == '-':
+            kind = 'del' if b == '-' else 'ins'
+            score += gap_extend if prev_gap == kind else gap_open
+            prev_gap = kind
+        else:
+            score += match if a == b else mismatch
+            prev_gap = None
+    return score
+
+
+@pytest.mark.parametrize("seq1, seq2", [
+    ("ACGTTGCAACGT", "ACGAACGT"),
+    ("GATTACA", "GCATGCT"),
+    ("AAAAACCCCC", "CCCCCAAAAA"),
+])
+def test_affine_traceback_matches_score(seq1, seq2):
+    align1, align2, score = needleman_wunsch(seq1, seq2, gap_open=-4, gap_extend=-1)
+    assert align1.replace('-', '') == seq1 and align2.replace('-', '') == seq2
+    assert _affine_score(align1, align2, -4, -1) == score
+
+
+def test_banded_wide_equals_full():
+    seq1, seq2 = "ACGTTGCAACGTAGGCTA", "ACGAACGTAGCTTA"
+    assert needleman_wunsch(seq1, seq2, bandwidth=len(seq1)) == needleman_wunsch(seq1, seq2)
+
+
+def test_banded_affine_wide_equals_full():
+    seq1, seq2 = "ACGTTGCAACGTAGGCTA", "ACGAACGTAGCTTA"
+    expected = needleman_wunsch(seq1, seq2, gap_open=-5, gap_extend=-1)
+    assert needleman_wunsch(seq1, seq2, gap_open=-5, gap_extend=-1, bandwidth=len(seq1)) == expected
+
+
+@pytest.mark.parametrize("gap_open, gap_extend", [(None, None), (-5, -1)])
+def test_auto_bandwidth_is_optimal(gap_open, gap_extend):
+    seq1 = "ACGTTGCAACGTAGGCTAGGATCCA" * 12
+    seq2 = seq1[:100] + seq1[130:250] + "TTTT" + seq1[250:]
+    _, _, expected = needleman_wunsch(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend)
+    _, _, score = needleman_wunsch(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, bandwidth="auto")
+    assert score == expected
+
+
+@pytest.mark.parametrize("gap_open, gap_extend", [(None, None), (-5, -1)])
+@pytest.mark.parametrize("align", [needleman_wunsch, smith_waterman])
+def test_diagonal_engine_matches_compiled(align, gap_open, gap_extend):
+    matrix = load_scoring_matrix("BLOSUM62")
+    for seq1, seq2, kwargs in [
+        ("GATTACAGATTACA", "GCATGCTTACA", {}),
+        ("HEAGAWGHEE", "PAWHEAE", {"scoring_matrix": matrix, "gap_penalty": -8}),
+        ("ACGT", "", {}),
+    ]:
+        expected = align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, **kwargs)
+        assert align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, engine="diagonal", **kwargs) == expected
+
+
+def test_diagonal_engine_does_not_compile(tmp_path):
+    # numpy-движок не должен компилировать numba ни в fill, ни в traceback, ни в сборке Alignment
+    code = (
+        "import sys\n"
+        "from aligner.algorithms import needleman_wunsch, smith_waterman\n"
+        "for align in (needleman_wunsch, smith_waterman):\n"
+        "    for gaps in ({}, {'gap_open': -5, 'gap_extend': -1}):\n"
+        "        align('GATTACAGATTACA', 'GCATGCTTACA', engine='diagonal', **gaps).cigar\n"
+        "compiled = [name for mod in list(sys.modules.values()) if mod.__name__.startswith('aligner')\n"
+        "            for name, f in vars(mod).items() if getattr(f, 'signatures', None)]\n"
+        "print(compiled)\n"
+    )
+    env = dict(os.environ, NUMBA_CACHE_DIR=str(tmp_path),
+               PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        needleman_wunsch("AC", "AG", engine="gpu")
+
+
+@pytest.mark.parametrize("gap_open, gap_extend", [(None, None), (-5, -1)])
+@pytest.mark.parametrize("align", [needleman_wunsch, smith_waterman])
+def test_score_only_deferred_traceback(align, gap_open, gap_extend):
+    seq1, seq2 = "TTGACGTAGGCTACGGA", "CCACGTTGGCTACTT"
+    expected = align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend)
+    result = align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, score_only=True)
+    assert result.score == expected[2]
+    assert result.traceback() == expected
+
+
+def test_score_only_long_sequences():
+    result = needleman_wunsch("ACGT" * 3000, "ACGT" * 3000, score_only=True)
+    assert (result.score, result.end_i, result.end_j) == (12000, 12000, 12000)
+
+
+@pytest.mark.parametrize("seq1, seq2, kwargs", [
+    ("GATTACAGATTACAGG", "GCATGCTTACAGATC", {}),
+    ("HEAGAWGHEEPQRST", "PAWHEAEWWPQST", {"scoring_matrix": load_scoring_matrix("BLOSUM62")}),
+    ("A", "C", {"mismatch_score": -100}),
+    ("ACGT", "", {}),
+])
+def test_myers_miller_matches_needleman_wunsch(seq1, seq2, kwargs):
+    _, _, expected = needleman_wunsch(seq1, seq2, gap_open=-5, gap_extend=-1, **kwargs)
+    # base_cells=1 заставляет делить задачу до конца
+    align1, align2, score = myers_miller_needleman_wunsch(seq1, seq2, gap_open=-5, gap_extend=-1, base_cells=1,
+                                                          **kwargs)
+    assert score == expected
+    assert (align1.replace('-', ''), align2.replace('-', '')) == (seq1, seq2)
+
+
+@pytest.mark.parametrize("seq1, seq2, kwargs", [
+    ("GATTACAGATTACAGG", "GCATGCTTACAGATC", {}),
+    ("HEAGAWGHEEPQRST", "PAWHEAEWWPQST", {"scoring_matrix": load_scoring_matrix("BLOSUM62")}),
+    ("ACGT", "", {}),
+])
+def test_hirschberg_matches_needleman_wunsch(seq1, seq2, kwargs):
+    _, _, expected = needleman_wunsch(seq1, seq2, **kwargs)
+    align1, align2, score = hirschberg_needleman_wunsch(seq1, seq2, base_cells=1, threads=2, **kwargs)
+    assert score == expected
+    assert (align1.replace('-', ''), align2.replace('-', '')) == (seq1, seq2)
+
+
+@pytest.mark.parametrize("gap_open, gap_extend", [(None, None), (-5, -1)])
+def test_smith_waterman_linear_space_over_budget(gap_open, gap_extend):
+    seq1, seq2 = "TTTTGATTACAGATTACAGGTTTT", "CCGCATGCTTACAGATCCC"
+    expected = smith_waterman(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend)
+    # матрица не влезает в бюджет - smith_waterman переходит на линейную память
+    with patch("aligner.algorithms.MATRIX_MEMORY_BUDGET", 0):
+        align1, align2, score = smith_waterman(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend)
+    assert score == expected[2]
+    assert align1.replace('-', '') in seq1 and align2.replace('-', '') in seq2
+
+
+def test_needleman_wunsch_long_affine():
+    seq1 = "ACGTTGCA" * 1300
+    seq2 = seq1[:5000] + seq1[5040:]
+    align1, align2, score = needleman_wunsch(seq1, seq2, gap_open=-10, gap_extend=-1)
+    assert score == len(seq2) - 10 - 39
+    assert len(align1) == len(align2) == len(seq1)
+
+
+@pytest.mark.parametrize("gap_open, gap_extend", [(None, None), (-11, -1)])
+def test_striped_search_matches_smith_waterman(gap_open, gap_extend):
+    blosum = load_scoring_matrix("BLOSUM62")
+    query = "MKTAYIAKQRQISFVKSHFSRQ"
+    targets = ["MKTAYIAKQR", "GGGQRQISFVKSHWW", "", "WWWW", "FVKSHFSRQMKTAYIAKQRQISFVKSH"]
+    profile = QueryProfile(query, scoring_matrix=blosum)
+    scores, query_ends, target_ends = search(profile, targets, gap_penalty=-4, gap_open=gap_open,
+                                             gap_extend=gap_extend)
+    for target, score, query_end, target_end in zip(targets, scores, query_ends, target_ends):
+        _, _, expected = smith_waterman(query, target, gap_penalty=-4, scoring_matrix=blosum, gap_open=gap_open,
+                                        gap_extend=gap_extend)
+        assert score == expected
+        assert profile.align(target, -4, gap_open, gap_extend) == (score, query_end, target_end)
+    assert (query_ends[0], target_ends[0]) == (10, 10)
+
+
+@pytest.mark.parametrize("gap_open, gap_extend", [(None, None), (-5, -1)])
+def test_heuristic_local_align_finds_shared_region(gap_open, gap_extend):
+    core = "ACGTTGCATGCAAGTCCGATAGGCTTACGATCGGATC"
+    seq1 = "TTTTTTTTTTTTTTTTTTTT" + core + "GGGGGGGGGGGGGGG"
+    seq2 = "CCCCCCCCCCCC" + core[:15] + "A" + core[15:] + "AAAAAAAAAA"
+    expected = smith_waterman(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend)
+    assert heuristic_local_align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend) == expected
+    result = heuristic_local_align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, score_only=True)
+    assert result.score == expected[2]
+    assert result.traceback() == expected
+
+
+def test_heuristic_local_align_without_seeds():
+    assert heuristic_local_align("ACGTACGT", "TTTTTTTT", k=4) == ("", "", 0)
+
+
+@pytest.mark.parametrize("seq1, seq2", [
+    ("GATTACAGATTACAGG", "GCATGCTTACAGATC"),
+    ("ACGT" * 40, "ACGT" * 17 + "TT" + "ACGT" * 22),
+    ("ACGT", ""),
+])
+def test_bitparallel_engine_edit_distance(seq1, seq2):
+    # unit cost: тот же оптимум, что у needleman_wunsch с match=0, mismatch=gap=-1
+    _, _, expected = needleman_wunsch(seq1, seq2, 0, -1, -1)
+    align1, align2, score = needleman_wunsch(seq1, seq2, 0, -1, -1, engine="bitparallel")
+    assert score == expected
+    assert needleman_wunsch(seq1, seq2, 0, -1, -1, engine="bitparallel", score_only=True).score == expected
+    assert (align1.replace('-', ''), align2.replace('-', '')) == (seq1, seq2)
+    assert sum(x != y for x, y in zip(align1, align2)) == -score
+    # эквивалентная edit distance схема с другими весами - пересчет score
+    _, _, expected = needleman_wunsch(seq1, seq2, 2, -1, -2)
+    assert needleman_wunsch(seq1, seq2, 2, -1, -2, engine="bitparallel").score == expected
+    result = needleman_wunsch(seq1, seq2, 2, -1, -2, engine="bitparallel", score_only=True)
+    assert result.score == expected and result.traceback().score == expected
+
+
+@pytest.mark.parametrize("scores", [(1, -1, -2), (2, -3, -2), (0, 1, 0)])
+def test_bitparallel_engine_rejects_other_scores(scores):
+    with pytest.raises(ValueError):
+        needleman_wunsch("GATTACA", "GCATGCT", *scores, engine="bitparallel")
+
+
+def test_bitparallel_engine_rejects_scoring_matrix():
+    with pytest.raises(ValueError):
+        needleman_wunsch("AC", "AG", scoring_matrix=load_scoring_matrix("BLOSUM62"), engine="bitparallel")
+
+
+@pytest.mark.parametrize("gap_open, gap_extend", [(None, None), (-5, -1)])
+def test_wfa_matches_needleman_wunsch(gap_open, gap_extend):
+    rng = np.random.default_rng(12)
+    for _ in range(20):
+        seq1 = "".join(rng.choice(list("ACGT"), rng.integers(0, 40)))
+        seq2 = "".join(rng.choice(list("ACGT"), rng.integers(0, 40)))
+        expected = needleman_wunsch(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend)[2]
+        for low_memory in (False, True):
+            align1, align2, score = wfa_needleman_wunsch(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend,
+                                                         low_memory=low_memory, base_cells=1)
+            assert score == expected
+            assert align1.replace("-", "") == seq1 and align2.replace("-", "") == seq2
+        result = needleman_wunsch(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, engine="wfa",
+                                  score_only=True)
+        assert result.score == expected
+
+
+def test_wfa_rejects_unsupported_scheme():
+    with pytest.raises(ValueError):
+        wfa_needleman_wunsch("ACGT", "AGT", match_score=1, mismatch_score=-5, gap_open=-3, gap_extend=-1)
+    with pytest.raises(ValueError):
+        needleman_wunsch("AC", "AG", scoring_matrix=load_scoring_matrix("BLOSUM62"), engine="wfa")
+
+
+@pytest.mark.parametrize("gap_open, gap_extend", [(None, None), (-5, -1)])
+def test_auto_engine_matches_exact(gap_open, gap_extend):
+    rng = np.random.default_rng(5)
+    seq1 = "".join(rng.choice(list("ACGT"), 400))
+    seq2 = seq1[:150] + "T" + seq1[160:300] + "GGA" + seq1[300:]
+    # оценка расхождения и выбор движка и на коротких входах
+    with patch('aligner.dispatch.SMALL_CELLS', 0):
+        for align, kwargs in ((needleman_wunsch, {}), (smith_waterman, {})):
+            expected = align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, **kwargs)
+            result = align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, engine="auto")
+            assert result[2] == expected[2]
+            assert result.plan.cells > 0
+            scored = align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, engine="auto", score_only=True)
+            assert scored.score == expected[2]
+            assert scored.traceback()[2] == expected[2]
+
+
+def test_plan_alignment_memory_budget():
+    assert plan_alignment(1000, 1000).engine == "compiled"
+    # полная матрица не влезает в бюджет - линейная память, при малом расхождении - band или WFA
+    assert plan_alignment(50000, 50000).engine == "linear-space"
+    assert plan_alignment(50000, 50000, max_memory=1 << 32).engine == "compiled"
+    assert plan_alignment(50000, 50000, divergence=0.01).engine == "banded"
+    assert plan_alignment(50000, 50000, divergence=0.01, wfa_penalties=(4, 0, 3)).engine.startswith("wfa")
+    assert plan_alignment(10 ** 6, 10 ** 6, local=True).engine == "seed"
+
+
+def test_alignment_result_cigar_and_stats():
+    result = needleman_wunsch("AGC", "ACGC")
+    align1, align2, score = result
+    assert (align1, align2, score) == ("A-GC", "ACGC", 1)
+    assert result.cigar == "1M1I2M"
+    assert (result.length, result.matches, result.gaps) == (4, 3, 1)
+    assert result.identity == 75.0
+    assert result.match_line() == "| ||"
+    local = smith_waterman("TTTACGTAAA", "GGACGTGG")
+    assert (local.start_i, local.end_i, local.start_j, local.end_j) == (3, 7, 2, 6)
+    assert local.aligned() == ("ACGT", "ACGT")
+    assert local.cigar == "4M"
+
+
+def test_compiled_fill_promotes_on_saturation():
+    # 9000 совпадений не влезают в int16 - строки DP пересчитываются в int32, указатели упакованы по 2 бита
+    seq = "ACGT" * 2250
+    a = encode_sequence(seq)
+    table = score_table(1, -1)
+    ptr, score, _, end_i, end_j = _compiled_fill(a, a, table, -2, None, None, True)
+    assert (score, end_i, end_j) == (9000, 9000, 9000)
+    assert ptr.shape == (9001, (9001 + 3) // 4)
+    assert smith_waterman(seq, seq, score_only=True).score == 9000
+    assert needleman_wunsch(seq, "T" * 9000, engine="compiled").score == -4500
+
+
+@pytest.mark.parametrize("mode, align", [("global", needleman_wunsch), ("local", smith_waterman)])
+@pytest.mark.parametrize("gap_open, gap_extend", [(None, None), (-5, -1)])
+def test_align_batch_matches_per_pair(mode, align, gap_open, gap_extend):
+    rng = np.random.default_rng(5)
+    random_seq = lambda: "".join(rng.choice(list("ACGT"), rng.integers(0, 40)))
+    pairs = [(random_seq(), random_seq()) for _ in range(50)]
+    # выброс по длине считается отдельно, обычным движком
+    pairs.append(("ACGT" * 150, "ACGA" * 150))
+    results = align_batch(pairs, mode, 2, -1, -2, gap_open, gap_extend)
+    for (seq1, seq2), result in zip(pairs, results):
+        expected = align(seq1, seq2, 2, -1, -2, gap_open=gap_open, gap_extend=gap_extend, score_only=True)
+        assert (result.score, result.end_i, result.end_j) == (expected.score, expected.end_i, expected.end_j)
+    assert tuple(results[0].traceback()) == tuple(align(*pairs[0], 2, -1, -2, gap_open=gap_open, gap_extend=gap_extend))
+
+
+def test_minimizer_index_lookup_and_mmap(tmp_path):
+    rng = np.random.default_rng(9)
+    references = ["".join(rng.choice(list("ACGT"), 500)) for _ in range(20)]
+    index = MinimizerIndex.build(references)
+    query = references[13][100:300]
+    hits = index.lookup(query, top=3)
+    assert hits[0][0] == 13
+    assert all(hits[k][1] >= hits[k + 1][1] for k in range(len(hits) - 1))
+    index.save(str(tmp_path))
+    loaded = MinimizerIndex.load(str(tmp_path))
+    assert isinstance(loaded.keys, np.memmap)
+    assert loaded.lookup(query, top=3) == hits
+    assert index.lookup("ACGT") == []
+
+
+def test_suffix_array_smems(tmp_path):
+    targets = ["ACGTACGGTCA", "TTACGGTCAAC"]
+    index = SuffixArrayIndex.build(targets)
+    assert list(index.sa) == sorted(range(len(index.text)), key=lambda p: index.text[p:].tolist())
+    assert index.find("ACGG") == [(0, 4), (1, 2)]
+    # GTACGGTCA есть только в первом target, TACGGTCAA - только во втором
+    assert index.smems("GTACGGTCAA", min_length=4) == [(0, 9, [(0, 2)]), (1, 9, [(1, 1)])]
+    index.save(str(tmp_path))
+    loaded = SuffixArrayIndex.load(str(tmp_path))
+    assert isinstance(loaded.sa, np.memmap)
+    assert loaded.smems("GTACGGTCAA", min_length=4) == index.smems("GTACGGTCAA", min_length=4)
+    # относительно одного target: более длинное совпадение в другом не скрывает свое, вхождения - только его
+    assert index.smems("GTACGGTCAA", min_length=4, target=0) == [(0, 9, [(0, 2)])]
+    assert index.smems("GTACGGTCAA", min_length=4, target=1) == [(1, 9, [(1, 1)])]
+    repeats = SuffixArrayIndex.build(["ACGGT" * 4, "TTACGGTCAAC"])
+    assert repeats.smems("ACGGT", min_length=4, max_occurrences=1) == []
+    assert repeats.smems("ACGGT", min_length=4, max_occurrences=1, target=1) == [(0, 5, [(1, 2)])]
+
+
+@pytest.mark.parametrize("gap_open, gap_extend", [(None, None), (-5, -1)])
+def test_heuristic_local_align_smem_seeds(gap_open, gap_extend):
+    shared = "ACGTTGCAAGGCTTACCGATAGGCTAACGTTAGCCATGCAAGT"
+    seq1 = "TTTTTTTTTTTTTTTT" + shared + "GGGGGGGGGG"
+    seq2 = "CCCCCCCC" + shared + "AAAAAAAAAAAAAA"
+    expected = heuristic_local_align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend)
+    result = heuristic_local_align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, seeding="smem")
+    assert tuple(result) == tuple(expected)
+    index = SuffixArrayIndex.build(["GATTACA" * 5, seq2])
+    reused = heuristic_local_align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, seed_index=index, target=1)
+    assert tuple(reused) == tuple(expected)
+    # другой target содержит shared целиком, а seq2 - с заменой: затравки все равно берутся из seq2
+    mutated = "CCCCCCCC" + shared[:20] + "T" + shared[21:] + "AAAAAAAAAAAAAA"
+    expected = heuristic_local_align(seq1, mutated, gap_open=gap_open, gap_extend=gap_extend, seeding="smem")
+    assert expected.score > 0
+    index = SuffixArrayIndex.build([shared, mutated])
+    reused = heuristic_local_align(seq1, mutated, gap_open=gap_open, gap_extend=gap_extend, seed_index=index, target=1)
+    assert tuple(reused) == tuple(expected)
+
+
+@pytest.mark.parametrize("gap_open, gap_extend", [(None, None), (-5, -1)])
+def test_genome_align_matches_needleman_wunsch(gap_open, gap_extend):
+    rng = np.random.default_rng(21)
+    genome = rng.choice(list("ACGT"), 3000)
+    other = genome.copy()
+    other[rng.choice(3000, 30, replace=False)] = rng.choice(list("ACGT"), 30)
+    seq1 = "".join(genome)
+    # вставка и удаление между якорями
+    seq2 = "".join(other[:1000]) + "GATTACA" + "".join(other[1000:2000]) + "".join(other[2020:])
+    result = genome_align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend)
+    expected = needleman_wunsch(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend)
+    assert result.score == expected.score
+    align1, align2 = result.aligned()
+    assert align1.replace("-", "") == seq1 and align2.replace("-", "") == seq2
+    assert result.plan.engine == "genome" and result.plan.cells < len(seq1) * len(seq2) // 100
+
+
+def test_genome_align_bridges_long_insertion():
+    rng = np.random.default_rng(22)
+    genome = "".join(rng.choice(list("ACGT"), 30000))
+    insertion = "".join(rng.choice(list("ACGT"), 12000))
+    seq2 = genome[:15000] + insertion + genome[15000:]
+    result = genome_align(genome, seq2)
+    # вставка длиннее CHAIN_MAX_DISTANCE перешагивается, а не уходит в один большой прямоугольник DP
+    assert result.plan.cells < 1000000
+    assert result.score == len(genome) - 2 * len(insertion)
+    align1, align2 = result.aligned()
+    assert align1.replace("-", "") == genome and align2.replace("-", "") == seq2
+
+
+def test_result_cache_roundtrip_and_eviction(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    key = ResultCache.key("ACGT", "acgt", "global", match=1, gap=-2)
+    assert key == ResultCache.key(encode_sequence("ACGT"), "ACGT", "global", gap=-2, match=1)
+    assert key != ResultCache.key("ACGT", "ACGT", "global", match=1, gap=-3)
+    with ResultCache(path) as cache:
+        assert cache.get(key) is None
+        cache.put(key, 4, 4, 4)
+    cache = ResultCache(path)
+    assert cache.get(key) == (4, 4, 4)
+    assert (cache.hits, cache.misses) == (1, 0)
+    cache.close()
+
+    cache = ResultCache(path, max_bytes=64 << 10, memory_entries=16)
+    for k in range(5000):
+        cache.put(ResultCache.key(str(k), "A", "global"), k)
+    assert 0 < len(cache) < 5000
+    assert cache.get(ResultCache.key("4999", "A", "global")) == (4999, 0, 0)
+    cache.close()
+
+
+def test_msa_distance_matrix_cache():
+    seqs = ["ACGTACGT", "ACGTTCGT", "AGGTACGA", "ACGTACG"]
+    cache = ResultCache()
+    first = compute_distance_matrix(seqs, threads=1, cache=cache)
+    assert cache.misses == 6
+    second = compute_distance_matrix(seqs, threads=1, cache=cache)
+    assert cache.hits == 6
+    assert np.array_equal(first, second)
+    assert np.array_equal(first, compute_distance_matrix(seqs, threads=1))
+
+
 def test_multiple_sequence_alignment_basic():
     seqs = ["AGC", "ACGC", "AGGC"]
     aligned = multiple_sequence_alignment(seqs)
@@ -189,6 +189,47 @@ def test_cli_msa_flags(dummy_fasta):
     except CalledProcessError as e:
         pytest.fail(f"CLI failed: {e}")
 
+def test_cli_max_memory_flags(dummy_fasta):
+    # --engine auto (по умолчанию) с бюджетом памяти: выбранный движок - в выводе
+    try:
+        run([sys.executable, "-m", "aligner.cli", "global", "--input1", "test_dir/test1.fasta", "--input2", "test_dir/test2.fasta",
+             "--output", "test_out.txt", "--max-memory", "64M", "--lang", "en"], check=True)
+        with open("test_out.txt", "r") as f:
+            content = f.read()
+            assert "Engine: compiled" in content
+        os.remove("test_out.txt")
+    except CalledProcessError as e:
+        pytest.fail(f"CLI failed: {e}")
+
+def test_cli_search_flags(dummy_fasta, tmp_path):
+    # search: индекс строится по reference, сохраняется в --index и читается оттуда при втором запуске
+    query = tmp_path / "query.fasta"
+    query.write_text(">q\nACGTTGCAAGGCTTACCGATAGGCTAACGTTAGCCA\n")
+    reference = tmp_path / "reference.fasta"
+    reference.write_text(">r1\nTTTTTTTTGGGGGGGGCCCCCCCCAAAAAAAATTTT\n>r2\nGGACGTTGCAAGGCTTACCGATAGGCTAACGTTAGCCAGG\n")
+    output = tmp_path / "search.txt"
+    for _ in range(2):
+        try:
+            run([sys.executable, "-m", "aligner.cli", "search", "--query", str(query), "--reference", str(reference),
+                 "--index", str(tmp_path / "index"), "--output", str(output), "--lang", "en"], check=True)
+        except CalledProcessError as e:
+            pytest.fail(f"CLI failed: {e}")
+        content = output.read_text()
+        assert "Target 2: Score: 36" in content
+        assert "Target 1" not in content
+    assert (tmp_path / "index" / "meta.json").exists()
+
+def test_print_alignment_table_long():
+    # строка совпадений режется на куски по 60 столбцов до разметки rich, теги не разрываются
+    from aligner.algorithms import needleman_wunsch
+    from aligner.cli import console, print_alignment_table
+    alignment = needleman_wunsch("ACGT" * 40, "ACGT" * 20 + "TCGT" + "ACGT" * 19)
+    with console.capture() as capture:
+        print_alignment_table(alignment, {})
+    output = capture.get()
+    assert "[/" not in output and "[green]" not in output
+    assert "||||" in output
+
 def test_cli_error_handling():
     # тест обработки ошибок
     child = pexpect.spawn(sys.executable, ["-m", "aligner.cli"])
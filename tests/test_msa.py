@@ -1,6 +1,9 @@
 import pytest
-from aligner.msa import multiple_sequence_alignment, MSAError
-from aligner.scoring import load_scoring_matrix
+import numpy as np
+from unittest.mock import patch
+from aligner.algorithms import needleman_wunsch
+from aligner.msa import PROFILE_SCALE, MSABlock, _scaled_profile_scores, compute_distance_matrix, embedded_guide_tree, join_clusters, profile_align, profile_scores, multiple_sequence_alignment, to_newick, MSAError
+from aligner.scoring import decode_sequence, load_scoring_matrix, score_table
 
 def test_multiple_sequence_alignment_basic():
     seqs = ["AGC", "ACGC", "AGGC"]
@@ -24,6 +27,105 @@ def test_msa_error(seqs):
     with pytest.raises(MSAError):
         multiple_sequence_alignment(seqs)
 
+def test_msa_edit_distance_backend():
+    seqs = ["ACGTACGT", "ACGTTCGT", "AGGTACGA"]
+    aligned = multiple_sequence_alignment(seqs, distance="edit")
+    assert len(aligned) == 3
+    assert all(len(a) == len(aligned[0]) for a in aligned)
+
+def test_kmer_distance_matrix():
+    seqs = ["ACGTACGTAC", "ACGTACGTAA", "TTTTGGGGCC", "ACGTACGTAC"]
+    dist = compute_distance_matrix(seqs, distance="kmer")
+    assert dist.shape == (4, 4)
+    assert np.allclose(dist, dist.T)
+    assert np.allclose(np.diag(dist), 0)
+    assert dist[0, 3] == 0
+    assert 0 < dist[0, 1] < dist[0, 2] <= 1
+    aligned = multiple_sequence_alignment(seqs, distance="kmer")
+    assert all(len(a) == len(aligned[0]) for a in aligned)
+
+@pytest.mark.parametrize("method, expected", [
+    ("upgma", "((a:2.5,b:2.5):2.0833,(c:3.75,(d:1.5,e:1.5):2.25):0.83333);"),
+    ("nj", "(e:0.5,(d:2,(c:4,(a:2,b:3):3):2):0.5);"),
+])
+def test_guide_tree_newick(method, expected):
+    dist = np.array([[0, 5, 9, 9, 8], [5, 0, 10, 10, 9], [9, 10, 0, 8, 7], [9, 10, 8, 0, 3], [8, 9, 7, 3, 0]],
+                    dtype=float)
+    tree, lengths = join_clusters(dist, method)
+    assert len(tree) == 4 and all(i < j for i, j in tree)
+    assert to_newick(tree, list("abcde"), lengths) == expected
+
+def test_msa_returns_tree():
+    seqs = ["ACGTACGT", "ACGTTCGT", "AGGTACGA"]
+    aligned, newick = multiple_sequence_alignment(seqs, tree_method="nj", return_tree=True)
+    assert len(aligned) == 3
+    assert newick.endswith(";") and all(f"Seq{k}:" in newick for k in (1, 2, 3))
+    with pytest.raises(MSAError):
+        multiple_sequence_alignment(seqs, tree_method="single")
+
+def test_embedded_guide_tree_groups_families():
+    rng = np.random.default_rng(3)
+    families = [rng.choice(list("ACGT"), 60) for _ in range(3)]
+    seqs = []
+    for k in range(30):
+        seq = families[k % 3].copy()
+        seq[rng.integers(0, 60, 3)] = rng.choice(list("ACGT"), 3)
+        seqs.append("".join(seq))
+    tree = embedded_guide_tree(seqs, distance="kmer", cluster_size=4)
+    clusters = [{k} for k in range(len(seqs))]
+    merged = []
+    for i, j in tree:
+        assert i < j < len(clusters)
+        merged.append(clusters[i] | clusters[j])
+        clusters.pop(j)
+        clusters.pop(i)
+        clusters.append(merged[-1])
+    assert clusters == [set(range(30))]
+    # каждая семья - отдельное поддерево
+    assert all(set(range(f, 30, 3)) in merged for f in range(3))
+    aligned = multiple_sequence_alignment(seqs, distance="kmer", embed_above=10)
+    assert sorted(a.replace("-", "") for a in aligned) == sorted(seqs)
+    assert all(len(a) == len(aligned[0]) for a in aligned)
+
+def test_msa_block_merge():
+    left = MSABlock.from_sequence("ACGT").merge(MSABlock.from_sequence("AGT"), np.array([0, 1, 0, 0], dtype=np.uint8))
+    assert left.sequences() == ["ACGT", "A-GT"]
+    merged = left.merge(MSABlock.from_sequence("ACGTT"), np.array([0, 0, 0, 0, 2], dtype=np.uint8))
+    assert merged.sequences() == ["ACGT-", "A-GT-", "ACGTT"]
+    expected = MSABlock(merged.rows, np.zeros_like(merged.counts))
+    for row in merged.sequences():
+        expected.counts += MSABlock.from_sequence(row).counts
+    assert np.array_equal(merged.counts, expected.counts)
+    assert list(merged.consensus()[:4]) == list(MSABlock.from_sequence("ACGT").consensus())
+
+def test_profile_align_uses_columns():
+    block1 = MSABlock.from_sequence("ACGT").merge(MSABlock.from_sequence("ACGA"), np.zeros(4, dtype=np.uint8))
+    block2 = MSABlock.from_sequence("CGT")
+    scores = profile_scores(block1, block2, score_table(1, -1))
+    assert scores.shape == (4, 3)
+    assert scores[3, 2] == 0 and scores[1, 0] == 1 and scores[0, 0] == -1
+    ops = profile_align(block1, block2)
+    assert block1.merge(block2, ops).sequences() == ["ACGT", "ACGA", "-CGT"]
+
+def test_profile_align_memory_fallback():
+    block1 = MSABlock.from_sequence("ACGTTGCA").merge(MSABlock.from_sequence("ACGTTGGA"), np.zeros(8, dtype=np.uint8))
+    block2 = MSABlock.from_sequence("ACTTGCA")
+    expected = needleman_wunsch(decode_sequence(block1.consensus()), "ACTTGCA").ops()
+    with patch("aligner.msa.MATRIX_MEMORY_BUDGET", 8 * 8 * 7), patch("aligner.msa._align_encoded") as dp:
+        ops = profile_align(block1, block2)
+    dp.assert_not_called()
+    assert np.array_equal(ops, expected)
+    # таблица score по блокам строк совпадает с целой
+    with patch("aligner.msa.PROFILE_BLOCK_BYTES", 8):
+        blocked = _scaled_profile_scores(block1, block2, score_table(1, -1))
+    assert np.array_equal(blocked, np.rint(profile_scores(block1, block2, score_table(1, -1)) * PROFILE_SCALE))
+
+def test_msa_deterministic():
+    seqs = ["ACGTTGCA", "ACGTGCA", "ACTTGCA", "AGGTTGCA", "ACGTTGGA"]
+    first = multiple_sequence_alignment(seqs, threads=1)
+    assert all(multiple_sequence_alignment(seqs, threads=1) == first for _ in range(3))
+    assert sorted(a.replace("-", "") for a in first) == sorted(seqs)
+
 def test_msa_identical():
     seqs = ["AAA", "AAA", "AAA"]
     aligned = multiple_sequence_alignment(seqs)